@@ -0,0 +1,199 @@
+"""Request validation and response bodies for the /v1 API, shared by app.py and asgi_app.py.
+
+Both apps parse the request their own way (Flask's request object, asgi_app.Request) and hand the
+plain values to these functions, so a validation rule or response shape lives in one place.
+Functions return (body, status); the apps add headers and serialize. Refused requests raise
+BadRequest, whose response() is the JSON error body.
+"""
+import json
+
+import db
+import search_cache
+
+
+class BadRequest(Exception):
+    """A request the API refuses before any database work"""
+    def __init__(self, error, details, status=400):
+        super().__init__(details)
+        self.error = error
+        self.details = details
+        self.status = status
+
+    def response(self):
+        body = {
+            'error': self.error,
+            'details': self.details
+        }
+        return (body, self.status)
+
+
+def invalid_limit_details(limit):
+    return f"limit must be a positive integer, received {limit}"
+
+
+def search_fields(args):
+    """db.search_resources kwargs (plus 'format') from /v1/search query args"""
+    return {
+        'author': args.get('author'),
+        'title': args.get('title'),
+        'isbn': args.get('isbn'),
+        'limit': args.get('limit'),
+        'cursor': args.get('cursor'),
+        'available': args.get('available') == '1',
+        'format': args.get('format')
+    }
+
+
+def search_shortcut(fields):
+    """(body, status) for a /v1/search that needs no query: no search fields, or an unknown
+    format. None when the search should run."""
+    if not fields['author'] and not fields['title'] and not fields['isbn']:  # No fields were provided
+        body = {
+            'results': [],
+            'next': None
+        }
+        return (body, 200)
+    if fields['format'] not in (None, 'columns'):
+        body = {
+            'error': 'invalidFormat',
+            'details': f"format must be 'columns' or omitted, received {fields['format']}"
+        }
+        return (body, 400)
+    return None
+
+
+def search_page(fields, version, key):
+    """Runs one /v1/search page. Returns (payload, 200), the serialized JSON also put in
+    search_cache under (version, key), or (error body, 400)."""
+    try:
+        results, next_cursor = db.search_resources(**fields)  # Pass dict as kwargs for extensibility
+    except ValueError:
+        body = {
+            'error': 'invalidLimit',
+            'details': invalid_limit_details(fields['limit'])
+        }
+        return (body, 400)
+    except db.InvalidCursorException as ice:
+        body = {
+            'error': 'invalidCursor',
+            'details': str(ice)
+        }
+        return (body, 400)
+
+    if fields['format'] == 'columns':
+        body = db.resources_to_columns(results)
+        body['next'] = next_cursor
+    else:
+        body = {
+            'results': [r.to_dict() for r in results],
+            'next': next_cursor
+        }
+    payload = json.dumps(body).encode()
+    search_cache.response_cache.put(version, key, payload)
+    return (payload, 200)
+
+
+def search_batch_type_error(query):
+    """Names the fields of a /v1/search/batch query that have the wrong JSON type, or None. Text
+    fields must be strings; limit an integer (or a numeric string, as in /v1/search)."""
+    wrong = [field for field in ('author', 'title', 'isbn', 'cursor') if not isinstance(query.get(field), (str, type(None)))]
+    limit = query.get('limit')
+    if isinstance(limit, bool) or not isinstance(limit, (int, str, type(None))):
+        wrong.append('limit')
+    return ', '.join(wrong) or None
+
+
+def parse_search_batch(body):
+    """Validates a decoded /v1/search/batch body, {'queries': [{'id', 'author', 'title', 'isbn',
+    'limit', 'cursor', 'available'}]}.
+
+    Returns:
+        (query_ids, fields): each query's id (its position if omitted) and its
+            db.search_resources_batch kwargs
+
+    Raises:
+        BadRequest: the body is not a list of query objects, ids repeat, or a field has the wrong type
+    """
+    queries = body.get('queries') if isinstance(body, dict) else None
+    if not isinstance(queries, list) or not all(isinstance(query, dict) for query in queries):
+        raise BadRequest('invalidBody', 'Body must be JSON with a queries array of objects')
+
+    query_ids = [str(query.get('id', index)) for index, query in enumerate(queries)]
+    if len(set(query_ids)) != len(query_ids):
+        raise BadRequest('duplicateQueryId', 'Every query id in a batch must be unique')
+    for query_id, query in zip(query_ids, queries):
+        wrong_fields = search_batch_type_error(query)
+        if wrong_fields:
+            raise BadRequest(
+                'invalidBody',
+                f"Query {query_id} has the wrong type for {wrong_fields}: author, title, isbn and cursor must be strings, limit an integer"
+            )
+
+    fields = [
+        {
+            'author': query.get('author'),
+            'title': query.get('title'),
+            'isbn': query.get('isbn'),
+            'limit': query.get('limit'),
+            'cursor': query.get('cursor'),
+            'available': bool(query.get('available'))
+        }
+        for query in queries
+    ]
+    return query_ids, fields
+
+
+def search_batch(query_ids, fields):
+    """Runs a parsed batch over one connection; (body, status) with results keyed by query id"""
+    try:
+        pages = db.search_resources_batch(fields)
+    except ValueError as ve:
+        body = {
+            'error': 'batchTooLarge',
+            'details': str(ve)
+        }
+        return (body, 400)
+
+    results = {}
+    for query_id, query_fields, page in zip(query_ids, fields, pages):
+        if isinstance(page, db.InvalidCursorException):
+            results[query_id] = {'error': 'invalidCursor', 'details': str(page)}
+        elif isinstance(page, ValueError):
+            results[query_id] = {'error': 'invalidLimit', 'details': invalid_limit_details(query_fields['limit'])}
+        else:
+            resources, next_cursor = page
+            results[query_id] = {'results': [r.to_dict() for r in resources], 'next': next_cursor}
+    return ({'results': results}, 200)
+
+
+def parse_stock_id(body):
+    """The integer stockId of a decoded /v1/checkout or /v1/checkin body
+
+    Raises:
+        BadRequest: there is no integer stockId
+    """
+    stock_id = body.get('stockId') if isinstance(body, dict) else None
+    if not isinstance(stock_id, int) or isinstance(stock_id, bool):
+        raise BadRequest('invalidStockId', 'Body must be JSON with an integer stockId')
+    return stock_id
+
+
+def borrow_action(action, action_exception, error, verb, token, stock_id):
+    """Runs checkout_resource/check_in_resource for the member holding `token`; (body, status)"""
+    member_id = db.get_member_by_token(token)
+    try:
+        borrow_id = action(member_id, stock_id)
+    except action_exception as e:
+        body = {
+            'error': error,
+            'details': str(e)
+        }
+        return (body, 409)
+
+    body = {
+        'borrowId': borrow_id,
+        'stockId': stock_id,
+        'error': 'None',
+        'details': f"Stock {stock_id} {verb} successfully"
+    }
+    return (body, 200)
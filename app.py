@@ -1,23 +1,60 @@
+import atexit
 import json
 
 import flask
-from flask import request, make_response, abort, Flask, redirect, url_for, render_template
+from flask import request, make_response, abort, Flask, redirect, url_for, Response, stream_with_context, g
 import requests
 
 from auth import require_auth
+import api
 import db
+import ingest
+import metrics
+import profiling
+import search_cache
+import static_assets
+import suggest
+import sweeper
 
 
 db.prepare_db()
+sweeper.start()
+suggest.start()
+static_assets.build()  # Renders the pages and gzips them and the static files once
+atexit.register(db.stop_write_queue)  # Commits write-behind writes still queued
 
 
 
-app = Flask(__name__)
+app = Flask(__name__, static_folder=None)  # static/ is served from memory by static_file()
 
 # This app is just for testing. Never expose your secret in a production app!
 app.secret_key = b'mysecretkey'
 
 
+@app.before_request
+def open_db_connection():
+    if profiling.should_profile(request.headers):
+        g.profiler = profiling.start_profile()
+    metrics.start_request()
+    db.open_request_connection()  # Every read in this request shares one pooled read-only connection
+
+
+@app.after_request
+def add_server_timing(response):
+    stats = metrics.finish_request(request.endpoint)
+    if stats is not None:
+        response.headers['Server-Timing'] = metrics.server_timing(stats)
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        response.headers['X-Profile-File'] = profiling.finish_profile(profiler, request.endpoint)
+    return response
+
+
+@app.teardown_request
+def close_db_connection(exc):
+    db.close_request_connection()
+
+
 @app.route('/', endpoint='index')
 def index():
     headers = {}
@@ -28,7 +65,22 @@ def index():
     return redirect(url_for('login')), 302, headers
 
 
+@app.route('/static/<path:filename>', methods=['GET'], endpoint='static')
+def static_file(filename):
+    response = static_assets.static_response(
+        filename, request.headers.get('If-None-Match'), request.headers.get('Accept-Encoding')
+    )
+    if response is None:
+        body = {
+            'error': 'notFound',
+            'details': f"No static file {filename}"
+        }
+        return (body, 404)
+    return response
+
+
 @app.route('/v1/login', methods=['POST'], endpoint='api_login')
+@db.session_unit_of_work
 def api_login():
     headers = {}
     lsession = request.headers.get('LSESSION', None)
@@ -44,7 +96,6 @@ def api_login():
 
     email_provided = request.form['email']
     if not db.password_matches(email_provided, request.form['password']):
-        print(email_provided, request.form['password'])
         body = {
             'error': 'passwordInvalid',
             'details': 'Password was not valid'
@@ -52,8 +103,9 @@ def api_login():
         return (body, 400, headers)
 
     member_id = db.get_member_by_email(email_provided)
-    db.associate_session_with_user(lsession, member_id, request.remote_addr, request.headers['User-Agent'])
-    token = db.add_token(lsession)
+    session_id, token = db.start_member_session(lsession, member_id, request.remote_addr, request.headers['User-Agent'])
+    if session_id != lsession:  # The client's session was swept; hand it the new one
+        headers['LSESSION'] = session_id
     headers['Set-Cookie'] = f'token={token}; Path=/; HttpOnly'
     body = {
         'error': 'None',
@@ -64,13 +116,14 @@ def api_login():
 
 @app.route('/login', methods=['GET'], endpoint='login')
 def login():
-    return render_template('login.html')
+    return static_assets.page_response('login', request.headers.get('If-None-Match'), request.headers.get('Accept-Encoding'))
 
 @app.route('/join', methods=['GET'], endpoint='join')
 def join():
-    return render_template('join.html')
+    return static_assets.page_response('join', request.headers.get('If-None-Match'), request.headers.get('Accept-Encoding'))
 
 @app.route('/v1/join', methods=['POST'], endpoint='api_join')
+@db.unit_of_work
 def api_join():
     headers = {}
 
@@ -124,8 +177,8 @@ def api_join():
 
     # Associate session with user
     user_agent = request.headers['User-Agent']
-    db.associate_session_with_user(lsession, member_id, request.remote_addr, user_agent)
-    token_id = db.add_token(lsession)
+    lsession, token_id = db.start_member_session(lsession, member_id, request.remote_addr, user_agent)
+    headers['LSESSION'] = lsession
     headers['Set-Cookie'] = f'token={token_id}; Path=/; HttpOnly'
     body = {
         'error': 'None',
@@ -137,41 +190,84 @@ def api_join():
 @app.route('/search', methods=['GET'], endpoint='search')
 @require_auth
 def search():
-    return render_template('search.html')
+    return static_assets.page_response('search', request.headers.get('If-None-Match'), request.headers.get('Accept-Encoding'))
 
 
 @app.route('/v1/search', methods=['GET'], endpoint='api_search')
 @require_auth
 def api_search():
-    author = request.args.get('author')
-    title = request.args.get('title')
-    isbn = request.args.get('isbn')
+    fields = api.search_fields(request.args)
+    shortcut = api.search_shortcut(fields)
+    if shortcut is not None:
+        return shortcut
+
+    wants_stream = (
+        request.args.get('stream') == '1'
+        or request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson']) == 'application/x-ndjson'
+    )
+    if wants_stream:
+        return stream_search_results(fields)
+
+    # Read the version once, so the ETag and cache entry describe the data the query could see
+    version = db.catalog_version()
+    key = search_cache.cache_key(fields)
+    etag = search_cache.etag(version, key)
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if search_cache.etag_matches(request.headers.get('If-None-Match'), etag):
+        return Response(status=304, headers=headers)
+
+    payload = search_cache.response_cache.get(version, key)
+    if payload is None:
+        payload, status = api.search_page(fields, version, key)
+        if status != 200:
+            return (payload, status)
+
+    return Response(payload, 200, headers=headers, mimetype='application/json')
+
+
+@app.route('/v1/search/batch', methods=['POST'], endpoint='api_search_batch')
+@require_auth
+def api_search_batch():
+    """Runs a JSON {'queries': [{'id', 'author', 'title', 'isbn', 'limit', 'cursor', 'available'}]}
+    batch over one connection. Results are keyed by each query's id (its position if omitted)."""
+    try:
+        query_ids, fields = api.parse_search_batch(request.get_json(silent=True))
+    except api.BadRequest as br:
+        return br.response()
+    return api.search_batch(query_ids, fields)
+
 
-    if not author and not title and not isbn:  # No fields were provided
+def stream_search_results(fields):
+    """Streams one JSON resource per line (NDJSON). Unlike paged search, limit is optional here."""
+    try:
+        if fields['limit'] is not None and int(fields['limit']) < 1:
+            raise ValueError()
+        if fields['cursor']:
+            db.decode_search_cursor(fields['cursor'])
+    except ValueError:
         body = {
-            'results': []
+            'error': 'invalidLimit',
+            'details': api.invalid_limit_details(fields['limit'])
         }
-        return (body, 200)
-
-    fields = {
-        'author': author,
-        'title': title,
-        'isbn': isbn
-    }
+        return (body, 400)
+    except db.InvalidCursorException as ice:
+        body = {
+            'error': 'invalidCursor',
+            'details': str(ice)
+        }
+        return (body, 400)
 
-    results = db.search_resources(**fields)  # Pass dict as kwargs for extensibility
-    results_as_dicts = [r.__dict__ for r in results]
-    body = {
-        'results': results_as_dicts
-    }
+    def generate():
+        for resource in db.iter_search_resources(**fields):
+            yield json.dumps(resource.to_dict()) + '\n'
 
-    return (body, 200)
+    return Response(stream_with_context(generate()), 200, mimetype='application/x-ndjson')
 
 
 @app.route('/resource', methods=['GET'], endpoint='resource')
 @require_auth
 def resource():
-    return render_template('add_resource.html')
+    return static_assets.page_response('resource', request.headers.get('If-None-Match'), request.headers.get('Accept-Encoding'))
 
 
 @app.route('/v1/resource', methods=['POST'], endpoint='api_resource')
@@ -196,8 +292,12 @@ def api_resource():
         )
         details = f"{body['title']} added successfully."
         status = 200
+    except db.InvalidIsbnException as iie:
+        error = 'invalidIsbn'
+        details = str(iie)
+        status = 400
     except Exception as e:
-        print(e)
+        app.logger.exception("Failed to add resource")
         error = "add-resource-error"
         details = str(e)
         status = 500
@@ -210,6 +310,178 @@ def api_resource():
     return (body, status)
 
 
+@app.route('/v1/resource/isbn/<isbn>', methods=['GET'], endpoint='api_resource_by_isbn')
+@require_auth
+def api_resource_by_isbn(isbn):
+    try:
+        resource = db.get_resource_by_isbn(isbn)
+    except db.InvalidIsbnException as iie:
+        body = {
+            'error': 'invalidIsbn',
+            'details': str(iie)
+        }
+        return (body, 400)
+
+    if resource is None:
+        body = {
+            'error': 'resourceNotFound',
+            'details': f"No resource has ISBN {isbn}"
+        }
+        return (body, 404)
+
+    body = {
+        'resource': resource.to_dict()
+    }
+    return (body, 200)
+
+
+@app.route('/v1/resource/isbn/batch', methods=['POST'], endpoint='api_resource_isbn_batch')
+@require_auth
+def api_resource_isbn_batch():
+    body = request.get_json(silent=True)
+    isbns = body.get('isbns') if isinstance(body, dict) else None
+    if not isinstance(isbns, list) or not all(isinstance(isbn, str) for isbn in isbns):
+        body = {
+            'error': 'invalidBody',
+            'details': 'Body must be JSON with an isbns array of strings'
+        }
+        return (body, 400)
+    if len(isbns) > db.ISBN_BATCH_MAX:
+        body = {
+            'error': 'tooManyIsbns',
+            'details': f"At most {db.ISBN_BATCH_MAX} ISBNs per request, received {len(isbns)}"
+        }
+        return (body, 400)
+
+    results = db.resolve_isbns(isbns)
+    summary = {status: sum(1 for result in results if result['status'] == status) for status in ('found', 'notFound', 'invalid')}
+    body = {
+        'results': results,
+        'summary': summary
+    }
+    return (body, 200)
+
+
+@app.route('/v1/checkout', methods=['POST'], endpoint='api_checkout')
+@require_auth
+def api_checkout():
+    return borrow_action(db.checkout_resource, db.CheckoutException, 'checkoutFailed', 'checked out')
+
+
+@app.route('/v1/checkin', methods=['POST'], endpoint='api_checkin')
+@require_auth
+def api_checkin():
+    return borrow_action(db.check_in_resource, db.CheckinException, 'checkinFailed', 'checked in')
+
+
+def borrow_action(action, action_exception, error, verb):
+    """Runs checkout_resource/check_in_resource for the logged in member and a JSON {'stockId': n} body"""
+    try:
+        stock_id = api.parse_stock_id(request.get_json(silent=True))
+    except api.BadRequest as br:
+        return br.response()
+    return api.borrow_action(action, action_exception, error, verb, request.cookies.get('token'), stock_id)
+
+
+@app.route('/v1/resources/bulk', methods=['POST'], endpoint='api_resources_bulk')
+@require_auth
+def api_resources_bulk():
+    if request.mimetype == 'application/x-ndjson':
+        rows = ingest.iter_ndjson_rows(request.stream)
+    else:
+        rows = request.get_json(silent=True)
+        if not isinstance(rows, list):
+            body = {
+                'error': 'invalidBody',
+                'details': 'Body must be a JSON array of resources or NDJSON (application/x-ndjson)'
+            }
+            return (body, 400)
+
+    try:
+        batch_size = int(request.args.get('batchSize', db.BULK_BATCH_SIZE))
+    except ValueError:
+        batch_size = 0
+    if batch_size < 1:
+        body = {
+            'error': 'invalidBatchSize',
+            'details': 'batchSize must be a positive integer'
+        }
+        return (body, 400)
+
+    report = db.bulk_add_resources_to_inventory(rows, batch_size=batch_size)
+    body = {
+        'results': report['results'],
+        'summary': report['summary'],
+        'error': 'None' if not report['summary']['error'] else 'bulk-resource-errors',
+        'details': f"{report['summary']['created']} created, {report['summary']['stockAdded']} stock added, {report['summary']['error']} failed"
+    }
+    return (body, 200)
+
+
+@app.route('/v1/suggest', methods=['GET'], endpoint='api_suggest')
+@require_auth
+def api_suggest():
+    try:
+        limit = min(int(request.args.get('limit') or suggest.SUGGEST_DEFAULT_LIMIT), suggest.SUGGEST_MAX_LIMIT)
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        body = {
+            'error': 'invalidLimit',
+            'details': f"limit must be a positive integer, received {request.args.get('limit')}"
+        }
+        return (body, 400)
+    kind = request.args.get('kind') or None
+    if kind is not None and kind not in suggest.SUGGEST_KINDS:
+        body = {
+            'error': 'invalidKind',
+            'details': f"kind must be one of {', '.join(suggest.SUGGEST_KINDS)}, received {kind}"
+        }
+        return (body, 400)
+
+    body = {
+        'suggestions': suggest.suggest_index.suggest(request.args.get('prefix', ''), limit, kind)
+    }
+    return (body, 200)
+
+
+@app.route('/v1/db/pool', methods=['GET'], endpoint='api_db_pool')
+def api_db_pool():
+    body = {
+        'pool': db.pool_stats(),
+        'writeQueue': db.group_commit_writer.stats()
+    }
+    return (body, 200)
+
+
+@app.route('/v1/auth/cache', methods=['GET'], endpoint='api_auth_cache')
+def api_auth_cache():
+    body = {
+        'tokenCache': db.token_cache.stats(),
+        'sessionStore': db.get_session_store().stats(),
+        'searchCache': search_cache.response_cache.stats(),
+        'suggestIndex': suggest.suggest_index.stats(),
+        'staticAssets': static_assets.get_bundle().stats()
+    }
+    return (body, 200)
+
+
+@app.route('/metrics', methods=['GET'], endpoint='metrics')
+def prometheus_metrics():
+    pool = db.pool_stats()
+    cache = db.token_cache.stats()
+    gauges = {
+        'library_db_pool_in_use': pool['read']['inUse'],
+        'library_db_pool_open': pool['read']['open'],
+        'library_db_pool_wait_seconds': pool['read']['waitSecsTotal'],
+        'library_db_write_pool_in_use': pool['write']['inUse'],
+        'library_db_write_pool_wait_seconds': pool['write']['waitSecsTotal'],
+        'library_token_cache_hits': cache['hits'],
+        'library_token_cache_misses': cache['misses'],
+    }
+    return Response(metrics.render_prometheus(gauges), 200, mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/methods/<user_id>', methods=['DELETE'], endpoint='methods')
 @app.route('/methods', methods=['POST', 'GET'], endpoint='methods')
 def methods(user_id=None):
@@ -0,0 +1,512 @@
+"""Asyncio/ASGI entry point serving the same /v1 API and pages as app.py.
+
+Every request is a coroutine, so idle keep-alive clients cost no threads. Blocking db.py work
+runs on a bounded thread pool: at most DB_MAX_PENDING calls may be queued or running, and a
+request that cannot get a slot within DB_SLOT_TIMEOUT_SECS is answered with 503 instead of
+piling up behind the database.
+
+Run it with a local ASGI server only, e.g.:
+    uvicorn asgi_app:app --host 127.0.0.1 --port 8000
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from http.cookies import SimpleCookie
+import json
+from urllib.parse import parse_qs
+
+import api
+import db
+import search_cache
+import static_assets
+import suggest
+import sweeper
+
+
+DB_EXECUTOR_WORKERS = db.DB_POOL_SIZE  # More threads than pooled read connections would only wait on the pool
+DB_MAX_PENDING = DB_EXECUTOR_WORKERS * 4
+DB_SLOT_TIMEOUT_SECS = 2
+
+
+class OverloadedException(Exception):
+    pass
+
+
+class Request:
+    def __init__(self, scope, body):
+        self.scope = scope
+        self.body = body
+        self.method = scope['method']
+        self.path = scope['path']
+        self.headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope['headers']}
+        self.args = {k: v[0] for k, v in parse_qs(scope.get('query_string', b'').decode()).items()}
+        client = scope.get('client')
+        self.remote_addr = client[0] if client else None
+
+    @property
+    def form(self):
+        return {k: v[0] for k, v in parse_qs(self.body.decode(), keep_blank_values=True).items()}
+
+    @property
+    def json(self):
+        return json.loads(self.body or b'null')
+
+    @property
+    def cookies(self):
+        cookie = SimpleCookie()
+        cookie.load(self.headers.get('cookie', ''))
+        return {key: morsel.value for key, morsel in cookie.items()}
+
+
+_executor = None
+_db_slots = None
+
+
+def start_executor():
+    global _executor, _db_slots
+    _executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix='db')
+    _db_slots = asyncio.Semaphore(DB_MAX_PENDING)
+
+
+def stop_executor():
+    _executor.shutdown(wait=True)
+    db.reset_pool()
+
+
+def _in_connection(func, *args, **kwargs):
+    db.open_request_connection()  # Every read made by func shares one pooled read-only connection
+    try:
+        return func(*args, **kwargs)
+    finally:
+        db.close_request_connection()
+
+
+async def run_db(func, *args, **kwargs):
+    """Runs blocking db work on the executor, waiting at most DB_SLOT_TIMEOUT_SECS for a slot"""
+    try:
+        await asyncio.wait_for(_db_slots.acquire(), DB_SLOT_TIMEOUT_SECS)
+    except asyncio.TimeoutError:
+        raise OverloadedException()
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, partial(_in_connection, func, *args, **kwargs))
+    finally:
+        _db_slots.release()
+
+
+# Blocking request bodies, each run as a single executor call
+@db.session_unit_of_work
+def _login(lsession, email, password, remote_addr, user_agent):
+    headers = {}
+    if not lsession:
+        lsession = db.create_new_session()
+        headers['LSESSION'] = lsession
+    if not email or not password:
+        body = {
+            'error': 'missingFields',
+            'details': 'Must include email and password'
+        }
+        return (body, 400, headers)
+
+    if not db.password_matches(email, password):
+        body = {
+            'error': 'passwordInvalid',
+            'details': 'Password was not valid'
+        }
+        return (body, 400, headers)
+
+    member_id = db.get_member_by_email(email)
+    session_id, token = db.start_member_session(lsession, member_id, remote_addr, user_agent)
+    if session_id != lsession:  # The client's session was swept; hand it the new one
+        headers['LSESSION'] = session_id
+    headers['Set-Cookie'] = f'token={token}; Path=/; HttpOnly'
+    body = {
+        'error': 'None',
+        'details': 'Member logged in successfully'
+    }
+    return (body, 200, headers)
+
+
+@db.unit_of_work
+def _join(lsession, email, password, remote_addr, user_agent):
+    if lsession is None:  # New user or cookies have been cleared
+        lsession = db.create_new_session()
+    headers = {'LSESSION': lsession}
+
+    try:
+        member_id = db.add_new_member(email, password)
+    except db.InvalidEmailException as iee:
+        body = {
+            'error': 'invalidEmail',
+            'details': str(iee)
+        }
+        return (body, 400, headers)
+
+    if member_id is None:  # Failed to create a new member
+        body = {
+            'error': 'joinFailed',
+            'details': 'Failed to create new member'
+        }
+        return (body, 400, headers)
+
+    lsession, token_id = db.start_member_session(lsession, member_id, remote_addr, user_agent)
+    headers['LSESSION'] = lsession
+    headers['Set-Cookie'] = f'token={token_id}; Path=/; HttpOnly'
+    body = {
+        'error': 'None',
+        'details': 'Member created successfully'
+    }
+    return (body, 200, headers)
+
+
+# Coroutine handlers
+async def api_login(request):
+    form = request.form
+    return await run_db(
+        _login,
+        request.headers.get('lsession'),
+        form.get('email'),
+        form.get('password'),
+        request.remote_addr,
+        request.headers.get('user-agent')
+    )
+
+
+async def api_join(request):
+    form = request.form
+    required_fields = {'email', 'password', 'confirm_password'}
+    received_fields = set(form.keys())
+    if received_fields.intersection(required_fields) != required_fields:
+        body = {
+            'error': 'Missing fields',
+            'details': (
+                f"Fields required: {', '.join(required_fields)}, "
+                f"Fields received: {', '.join(received_fields)}"
+            )
+        }
+        return (body, 400, {})
+
+    if form['password'] != form['confirm_password']:
+        body = {
+            'error': 'passwordMismatch',
+            'details': 'Password and confirmation do not match'
+        }
+        return (body, 400, {})
+
+    return await run_db(
+        _join,
+        request.headers.get('lsession'),
+        form['email'],
+        form['password'],
+        request.remote_addr,
+        request.headers.get('user-agent')
+    )
+
+
+async def api_search(request):
+    fields = api.search_fields(request.args)
+    shortcut = api.search_shortcut(fields)
+    if shortcut is not None:
+        return (*shortcut, {})
+
+    version = db.catalog_version()
+    key = search_cache.cache_key(fields)
+    etag = search_cache.etag(version, key)
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if search_cache.etag_matches(request.headers.get('if-none-match'), etag):
+        return (None, 304, headers)
+
+    payload = search_cache.response_cache.get(version, key)  # Cache hits skip the executor entirely
+    if payload is None:
+        payload, status = await run_db(api.search_page, fields, version, key)
+        if status != 200:
+            return (payload, status, {})
+    return (payload, 200, headers)
+
+
+async def api_search_batch(request):
+    try:
+        body = request.json
+    except ValueError:
+        body = None
+    try:
+        query_ids, fields = api.parse_search_batch(body)
+    except api.BadRequest as br:
+        return (*br.response(), {})
+    body, status = await run_db(api.search_batch, query_ids, fields)
+    return (body, status, {})
+
+
+async def api_resource(request):
+    try:
+        body = request.json
+        resource = await run_db(
+            db.add_resource_to_inventory,
+            body['title'],
+            body['authorFirst'],
+            body['authorMiddle'],
+            body['authorLast'],
+            body['edition'],
+            body['isbn10'],
+            body['isbn13']
+        )
+    except OverloadedException:
+        raise
+    except db.InvalidIsbnException as iie:
+        body = {
+            'resource': {},
+            'error': 'invalidIsbn',
+            'details': str(iie)
+        }
+        return (body, 400, {})
+    except Exception as e:
+        body = {
+            'resource': {},
+            'error': 'add-resource-error',
+            'details': str(e)
+        }
+        return (body, 500, {})
+
+    body = {
+        'resource': resource,
+        'error': 'None',
+        'details': f"{body['title']} added successfully."
+    }
+    return (body, 200, {})
+
+
+def _resource_by_isbn(isbn):
+    try:
+        resource = db.get_resource_by_isbn(isbn)
+    except db.InvalidIsbnException as iie:
+        body = {
+            'error': 'invalidIsbn',
+            'details': str(iie)
+        }
+        return (body, 400, {})
+
+    if resource is None:
+        body = {
+            'error': 'resourceNotFound',
+            'details': f"No resource has ISBN {isbn}"
+        }
+        return (body, 404, {})
+    return ({'resource': resource.to_dict()}, 200, {})
+
+
+async def api_resource_by_isbn(request, isbn):
+    return await run_db(_resource_by_isbn, isbn)
+
+
+async def api_resource_isbn_batch(request):
+    try:
+        body = request.json
+    except ValueError:
+        body = None
+    isbns = body.get('isbns') if isinstance(body, dict) else None
+    if not isinstance(isbns, list) or not all(isinstance(isbn, str) for isbn in isbns):
+        return ({'error': 'invalidBody', 'details': 'Body must be JSON with an isbns array of strings'}, 400, {})
+    if len(isbns) > db.ISBN_BATCH_MAX:
+        body = {
+            'error': 'tooManyIsbns',
+            'details': f"At most {db.ISBN_BATCH_MAX} ISBNs per request, received {len(isbns)}"
+        }
+        return (body, 400, {})
+
+    results = await run_db(db.resolve_isbns, isbns)
+    summary = {status: sum(1 for result in results if result['status'] == status) for status in ('found', 'notFound', 'invalid')}
+    return ({'results': results, 'summary': summary}, 200, {})
+
+
+def _stock_id(request):
+    try:
+        body = request.json
+    except ValueError:
+        body = None
+    return api.parse_stock_id(body)
+
+
+async def api_checkout(request):
+    try:
+        stock_id = _stock_id(request)
+    except api.BadRequest as br:
+        return (*br.response(), {})
+    body, status = await run_db(
+        api.borrow_action, db.checkout_resource, db.CheckoutException, 'checkoutFailed', 'checked out',
+        request.cookies.get('token'), stock_id
+    )
+    return (body, status, {})
+
+
+async def api_checkin(request):
+    try:
+        stock_id = _stock_id(request)
+    except api.BadRequest as br:
+        return (*br.response(), {})
+    body, status = await run_db(
+        api.borrow_action, db.check_in_resource, db.CheckinException, 'checkinFailed', 'checked in',
+        request.cookies.get('token'), stock_id
+    )
+    return (body, status, {})
+
+
+async def api_suggest(request):
+    # Served from memory on the event loop; never queues behind the DB executor
+    try:
+        limit = min(int(request.args.get('limit') or suggest.SUGGEST_DEFAULT_LIMIT), suggest.SUGGEST_MAX_LIMIT)
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        body = {
+            'error': 'invalidLimit',
+            'details': f"limit must be a positive integer, received {request.args.get('limit')}"
+        }
+        return (body, 400, {})
+    kind = request.args.get('kind') or None
+    if kind is not None and kind not in suggest.SUGGEST_KINDS:
+        body = {
+            'error': 'invalidKind',
+            'details': f"kind must be one of {', '.join(suggest.SUGGEST_KINDS)}, received {kind}"
+        }
+        return (body, 400, {})
+
+    body = {
+        'suggestions': suggest.suggest_index.suggest(request.args.get('prefix', ''), limit, kind)
+    }
+    return (body, 200, {})
+
+
+def page(name):
+    async def handler(request):
+        # Pre-rendered and served from memory on the event loop, like api_suggest
+        return static_assets.page_response(name, request.headers.get('if-none-match'), request.headers.get('accept-encoding'))
+    return handler
+
+
+async def static_file(request, filename):
+    response = static_assets.static_response(
+        filename, request.headers.get('if-none-match'), request.headers.get('accept-encoding')
+    )
+    if response is None:
+        body = {
+            'error': 'notFound',
+            'details': f"No static file {filename}"
+        }
+        return (body, 404, {})
+    return response
+
+
+def require_auth(handler):
+    async def wrapper(request, *args):
+        token = request.cookies.get('token')
+        if not token or not await run_db(db.token_is_valid, token):
+            body = {
+                'error': 'tokenInvalidError',
+                'details': 'token {} is not valid'.format(token)
+            }
+            return (body, 403, {})
+        return await handler(request, *args)
+    return wrapper
+
+
+ROUTES = {
+    ('GET', '/login'): page('login'),
+    ('GET', '/join'): page('join'),
+    ('GET', '/search'): require_auth(page('search')),
+    ('GET', '/resource'): require_auth(page('resource')),
+    ('POST', '/v1/login'): api_login,
+    ('POST', '/v1/join'): api_join,
+    ('GET', '/v1/search'): require_auth(api_search),
+    ('POST', '/v1/search/batch'): require_auth(api_search_batch),
+    ('POST', '/v1/resource'): require_auth(api_resource),
+    ('POST', '/v1/checkout'): require_auth(api_checkout),
+    ('POST', '/v1/checkin'): require_auth(api_checkin),
+    ('GET', '/v1/suggest'): require_auth(api_suggest),
+    ('POST', '/v1/resource/isbn/batch'): require_auth(api_resource_isbn_batch),
+}
+# Routes ending in one path parameter, e.g. /v1/resource/isbn/<isbn>, tried when no exact route matches
+PARAM_ROUTES = {
+    ('GET', '/v1/resource/isbn/'): require_auth(api_resource_by_isbn),
+}
+
+
+def _route(request):
+    """Returns (handler, args) for the request, or (None, allowed methods for the path)"""
+    handler = ROUTES.get((request.method, request.path))
+    if handler is not None:
+        return handler, ()
+    if request.path.startswith(static_assets.STATIC_URL_PREFIX):  # Static paths may contain '/'
+        if request.method != 'GET':
+            return None, ['GET']
+        return static_file, (request.path[len(static_assets.STATIC_URL_PREFIX):],)
+    for (method, prefix), param_handler in PARAM_ROUTES.items():
+        param = request.path[len(prefix):] if request.path.startswith(prefix) else ''
+        if param and '/' not in param and method == request.method:
+            return param_handler, (param,)
+    allowed = [method for method, path in ROUTES if path == request.path]
+    allowed += [method for method, prefix in PARAM_ROUTES if request.path.startswith(prefix) and request.path != prefix]
+    return None, allowed
+
+
+async def _read_body(receive):
+    chunks = []
+    more_body = True
+    while more_body:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        more_body = message.get('more_body', False)
+    return b''.join(chunks)
+
+
+async def _send_json(send, body, status, headers):
+    """Sends `body` as JSON; bytes are sent as already serialized JSON (or as the Content-Type in
+    `headers`, e.g. for pages), and None as no body"""
+    if body is None:
+        payload = b''
+    elif isinstance(body, bytes):
+        payload = body
+    else:
+        payload = json.dumps(body).encode()
+    raw_headers = [(b'content-length', str(len(payload)).encode())]
+    if 'Content-Type' not in headers:
+        raw_headers.append((b'content-type', b'application/json'))
+    raw_headers += [(k.lower().encode('latin-1'), str(v).encode('latin-1')) for k, v in headers.items()]
+    await send({'type': 'http.response.start', 'status': status, 'headers': raw_headers})
+    await send({'type': 'http.response.body', 'body': payload})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            start_executor()
+            await run_db(db.prepare_db)
+            await run_db(suggest.start)
+            await run_db(static_assets.build)
+            sweeper.start()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            sweeper.stop()
+            await run_db(db.stop_write_queue)  # Commits write-behind writes still queued
+            stop_executor()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    request = Request(scope, await _read_body(receive))
+    handler, args = _route(request)
+    if handler is None:
+        status = 405 if args else 404
+        return await _send_json(send, {'error': 'notFound' if status == 404 else 'methodNotAllowed'}, status, {})
+
+    try:
+        body, status, headers = await handler(request, *args)
+    except OverloadedException:
+        body, status, headers = {'error': 'overloaded', 'details': 'Too many requests waiting on the database'}, 503, {'Retry-After': '1'}
+    await _send_json(send, body, status, headers)
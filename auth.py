@@ -1,12 +1,15 @@
+import functools
+
 from flask import session, redirect, url_for, request, make_response
 from db import token_is_valid, create_new_session, add_token, NoMemberFoundException
 
-def require_auth(func, *args, **kwargs):
-    def wrapper():
+def require_auth(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
         headers = {}
 
         token = request.cookies.get('token', None)
-        if not token:
+        if not token or not token_is_valid(token):
             body = {
                 'error': 'tokenInvalidError',
                 'details': 'token {} is not valid'.format(token)
@@ -0,0 +1,351 @@
+"""Endpoint load test and latency benchmark.
+
+Usage:
+    python bench.py [--members 1000] [--resources 20000] [--copies 2]
+                    [--transport client|server] [--server flask|asgi]
+                    [--concurrency 8] [--requests 500] [--endpoints join login search resource checkout]
+                    [--output results.json] [--baseline bench_baseline.json] [--save-baseline]
+
+Seeds a fresh database in a temporary directory, then drives each endpoint with `requests` calls
+spread over `concurrency` threads, either through the Flask test client (no network) or through
+a real local server subprocess. Throughput and p50/p95/p99 latency are reported per endpoint.
+
+With --baseline, results are compared against a stored run and the exit status is 1 if any
+endpoint's p95 latency or throughput regressed by more than --tolerance.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import http.client
+from itertools import count
+import json
+import os
+import platform
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlencode
+
+import db
+
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+ENDPOINTS = ('join', 'login', 'search', 'resource', 'checkout')
+SEARCH_TITLES = ['the', 'history', 'book', 'night', 'river', 'garden']
+TITLE_WORDS = ['The', 'History', 'Book', 'Night', 'River', 'Garden', 'Of', 'A', 'Silent', 'Winter']
+MEMBER_PASSWORD = 'benchpw'
+DEFAULT_BASELINE = os.path.join(REPO_DIR, 'bench_baseline.json')
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'secs': round(elapsed, 3),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50Ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95Ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99Ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def bench_isbn13(prefix, n):
+    """A valid, unique ISBN-13 for the n-th resource, e.g. prefix '978' for seeded books"""
+    body = f"{prefix}{n:09d}"
+    return body + db.isbn13_check_digit(body)
+
+
+def seed_catalog(db_path, total_resources, total_members=0, copies=0):
+    """Creates `total_resources` resources (with `copies` stock rows each) and `total_members`
+    members whose password is MEMBER_PASSWORD, in a fresh database at `db_path`.
+    """
+    db.DB_NAME = db_path
+    db.reset_pool()
+    db.prepare_db()
+    rows = (
+        {
+            'title': f"{TITLE_WORDS[i % 10]} {TITLE_WORDS[(i // 10) % 10]} {TITLE_WORDS[(i // 100) % 10]} {i}",
+            'authorFirst': f"First{i % 997}",
+            'authorMiddle': '',
+            'authorLast': f"Last{i % 211}",
+            'edition': '1',
+            'isbn10': '',
+            'isbn13': bench_isbn13('978', i),
+        }
+        for i in range(total_resources)
+    )
+    db.bulk_add_resources_to_inventory(rows)
+
+    with db.connection() as conx:
+        for copy in range(copies):
+            conx.execute("INSERT INTO stock(resource_id) SELECT id FROM resource")
+        conx.executemany(
+            "INSERT INTO member(email, password) VALUES(?, ?)",
+            ((f"member{i}@example.com", MEMBER_PASSWORD) for i in range(total_members))
+        )
+        conx.commit()
+    db.reset_pool()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode, port, workdir):
+    """Starts app.py (Flask development server with threads) or asgi_app.py (uvicorn) in `workdir`"""
+    env = dict(os.environ, PYTHONPATH=REPO_DIR, FLASK_APP='app')
+    if mode == 'flask':
+        cmd = [sys.executable, '-m', 'flask', 'run', '--host', '127.0.0.1', '--port', str(port), '--with-threads']
+    else:
+        cmd = [sys.executable, '-m', 'uvicorn', 'asgi_app:app', '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning']
+    proc = subprocess.Popen(cmd, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.time() + 20
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError(f"{mode} server did not start on port {port}")
+
+
+class TestClientTransport:
+    """Calls the Flask app in process. One instance per thread."""
+    def __init__(self, flask_app):
+        self.client = flask_app.test_client(use_cookies=False)
+
+    def request(self, method, path, headers=None, form=None, json_body=None):
+        resp = self.client.open(path, method=method, headers=headers or {}, data=form, json=json_body)
+        return resp.status_code, resp.headers.get('Set-Cookie'), resp.get_json(silent=True)
+
+    def close(self):
+        pass
+
+
+class HttpTransport:
+    """Calls a local server over one keep-alive connection. One instance per thread."""
+    def __init__(self, port):
+        self.port = port
+        self.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+
+    def request(self, method, path, headers=None, form=None, json_body=None):
+        headers = dict(headers or {})
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        elif json_body is not None:
+            body = json.dumps(json_body)
+            headers['Content-Type'] = 'application/json'
+        try:
+            self.conn.request(method, path, body, headers)
+            resp = self.conn.getresponse()
+            payload = resp.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            raise
+        if resp.will_close:
+            self.conn.close()
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            data = None
+        return resp.status, resp.getheader('Set-Cookie'), data
+
+    def close(self):
+        self.conn.close()
+
+
+class Worker:
+    """One benchmark thread: its own transport, its own member and auth token"""
+    def __init__(self, index, transport, options):
+        self.index = index
+        self.transport = transport
+        self.options = options
+        self.sequence = count()
+        self.cookie = self.join(f"worker{index}-{time.time_ns()}@example.com")
+
+    def join(self, email):
+        form = {'email': email, 'password': MEMBER_PASSWORD, 'confirm_password': MEMBER_PASSWORD}
+        status, set_cookie, body = self.transport.request('POST', '/v1/join', {'User-Agent': 'bench'}, form=form)
+        if status != 200:
+            raise RuntimeError(f"Join failed with {status}: {body}")
+        return set_cookie.split(';')[0]
+
+    def auth_headers(self):
+        return {'Cookie': self.cookie, 'User-Agent': 'bench'}
+
+    def op_join(self, i):
+        email = f"join{self.index}-{i}-{time.time_ns()}@example.com"
+        form = {'email': email, 'password': MEMBER_PASSWORD, 'confirm_password': MEMBER_PASSWORD}
+        return self.transport.request('POST', '/v1/join', {'User-Agent': 'bench'}, form=form)[0]
+
+    def op_login(self, i):
+        # Seeded members only: logging in revokes that member's other tokens, so never use our own
+        member = (self.index + i * self.options.concurrency) % max(self.options.members, 1)
+        form = {'email': f"member{member}@example.com", 'password': MEMBER_PASSWORD}
+        return self.transport.request('POST', '/v1/login', {'User-Agent': 'bench'}, form=form)[0]
+
+    def op_search(self, i):
+        qs = urlencode({'title': SEARCH_TITLES[(self.index + i) % len(SEARCH_TITLES)], 'limit': 20})
+        return self.transport.request('GET', f"/v1/search?{qs}", self.auth_headers())[0]
+
+    def op_resource(self, i):
+        n = next(self.sequence)
+        book = {
+            'title': f"Bench Title {self.index} {n}",
+            'authorFirst': f"Bench{self.index}",
+            'authorMiddle': '',
+            'authorLast': f"Author{n % 50}",
+            'edition': '1',
+            'isbn10': '',
+            'isbn13': bench_isbn13('979', self.index * 100000 + n),
+        }
+        return self.transport.request('POST', '/v1/resource', self.auth_headers(), json_body=book)[0]
+
+    def op_checkout(self, i):
+        # Stock ids are partitioned across workers so they never contend for the same copy
+        stock_id = 1 + (self.index + i * self.options.concurrency) % max(self.options.stock, 1)
+        status = self.transport.request('POST', '/v1/checkout', self.auth_headers(), json_body={'stockId': stock_id})[0]
+        self.transport.request('POST', '/v1/checkin', self.auth_headers(), json_body={'stockId': stock_id})
+        return status
+
+
+def run_endpoint(workers, endpoint, total_requests):
+    def drive(worker, requests_for_worker):
+        latencies = []
+        errors = 0
+        op = getattr(worker, f"op_{endpoint}")
+        for i in range(requests_for_worker):
+            started = time.perf_counter()
+            try:
+                status = op(i)
+            except Exception:
+                status = None
+            latencies.append(time.perf_counter() - started)
+            if status is None or status >= 400:
+                errors += 1
+        return latencies, errors
+
+    concurrency = len(workers)
+    per_worker = [total_requests // concurrency + (1 if i < total_requests % concurrency else 0) for i in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(drive, workers, per_worker))
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency for worker_latencies, errors in outcomes for latency in worker_latencies]
+    return summarize(latencies, sum(errors for worker_latencies, errors in outcomes), elapsed)
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Returns a list of human readable regressions (empty if none)"""
+    regressions = []
+    for endpoint, current in results['endpoints'].items():
+        previous = baseline.get('endpoints', {}).get(endpoint)
+        if not previous or current.get('skipped') or previous.get('skipped'):
+            continue
+        if current['p95Ms'] > previous['p95Ms'] * (1 + tolerance):
+            regressions.append(f"{endpoint}: p95 {current['p95Ms']}ms vs baseline {previous['p95Ms']}ms")
+        if current['rps'] < previous['rps'] * (1 - tolerance):
+            regressions.append(f"{endpoint}: {current['rps']} req/s vs baseline {previous['rps']} req/s")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the library API endpoints")
+    parser.add_argument('--members', type=int, default=1000)
+    parser.add_argument('--resources', type=int, default=20000)
+    parser.add_argument('--copies', type=int, default=2, help="Stock rows seeded per resource")
+    parser.add_argument('--transport', choices=['client', 'server'], default='client')
+    parser.add_argument('--server', choices=['flask', 'asgi'], default='flask', help="Server started for --transport server")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=500, help="Requests per endpoint")
+    parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    parser.add_argument('--baseline', help=f"Compare against this results file (e.g. {DEFAULT_BASELINE})")
+    parser.add_argument('--save-baseline', action='store_true', help="Store this run as the --baseline file")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed fractional regression vs baseline")
+    args = parser.parse_args(argv)
+    args.stock = args.resources * args.copies
+
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    seed_catalog(os.path.join(workdir, db.DB_NAME), args.resources, args.members, args.copies)
+
+    proc = None
+    if args.transport == 'server':
+        port = free_port()
+        proc = start_server(args.server, port, workdir)
+        make_transport = lambda: HttpTransport(port)
+    else:
+        os.chdir(workdir)
+        import app as flask_app_module  # Imported late: app.py prepares the database on import
+        flask_app = flask_app_module.app
+        make_transport = lambda: TestClientTransport(flask_app)
+
+    results = {
+        'meta': {
+            'transport': args.transport if args.transport == 'client' else f"server:{args.server}",
+            'concurrency': args.concurrency,
+            'requestsPerEndpoint': args.requests,
+            'members': args.members,
+            'resources': args.resources,
+            'stock': args.stock,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'endpoints': {}
+    }
+
+    try:
+        workers = [Worker(i, make_transport(), args) for i in range(args.concurrency)]
+        probe_status = workers[0].transport.request('POST', '/v1/checkout', workers[0].auth_headers(), json_body={})[0]
+        supports_checkout = probe_status != 404
+        for endpoint in args.endpoints:
+            if endpoint == 'checkout' and not supports_checkout:
+                results['endpoints'][endpoint] = {'skipped': 'no /v1/checkout route'}
+            else:
+                results['endpoints'][endpoint] = run_endpoint(workers, endpoint, args.requests)
+            print(json.dumps({'endpoint': endpoint, **results['endpoints'][endpoint]}))
+        for worker in workers:
+            worker.transport.close()
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
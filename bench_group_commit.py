@@ -0,0 +1,91 @@
+"""Compares session and token writes with and without the write-behind group commit writer.
+
+Usage:
+    python bench_group_commit.py [--threads 16] [--ops 300] [--synchronous NORMAL FULL]
+
+For each SQLite synchronous setting, runs the same workload with db.WRITE_BEHIND off and on in
+a fresh database. `threads` threads each run `ops` operations:
+
+  session   create_new_session(), as for every anonymous hit on /
+  login     associate_session_with_user() then add_token(), as in /v1/login (waited for)
+
+Reports operations/s and p50/p99 latency per operation, commits made, and for write-behind the
+time to drain writes that were queued but not waited for.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import os
+import tempfile
+import time
+
+from bench import percentile
+import db
+import metrics
+
+
+def run(db_path, write_behind, threads, ops):
+    db.DB_NAME = db_path
+    db.WRITE_BEHIND = write_behind
+    db.reset_pool()
+    db.prepare_db()
+    member_ids = [db.add_new_member(f"member{i}@example.com", 'pw') for i in range(threads)]
+    session_ids = [db.create_new_session() for i in range(threads)]
+    db.group_commit_writer.stop()
+    commits_before = metrics.registry.commit_durations.count
+
+    def drive(index):
+        latencies = {'session': [], 'login': []}
+        for i in range(ops):
+            started = time.perf_counter()
+            if i % 2:
+                db.associate_session_with_user(session_ids[index], member_ids[index], '127.0.0.1', 'bench')
+                db.add_token(session_ids[index])
+                latencies['login'].append(time.perf_counter() - started)
+            else:
+                db.create_new_session()
+                latencies['session'].append(time.perf_counter() - started)
+        return latencies
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        per_thread = list(executor.map(drive, range(threads)))
+    issued = time.perf_counter() - started
+    db.group_commit_writer.stop()  # Waits for queued session inserts to commit
+    elapsed = time.perf_counter() - started
+
+    result = {
+        'writeBehind': write_behind,
+        'opsPerSec': round(threads * ops / elapsed, 1),
+        'drainMs': round((elapsed - issued) * 1000, 1),
+        'commits': metrics.registry.commit_durations.count - commits_before,
+    }
+    for kind in ('session', 'login'):
+        latencies = sorted(sum((thread[kind] for thread in per_thread), []))
+        result[f"{kind}P50Ms"] = round(percentile(latencies, 50) * 1000, 2)
+        result[f"{kind}P99Ms"] = round(percentile(latencies, 99) * 1000, 2)
+    db.reset_pool()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark write-behind group commit")
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--ops', type=int, default=300)
+    parser.add_argument('--synchronous', nargs='+', default=['NORMAL', 'FULL'])
+    args = parser.parse_args(argv)
+
+    pragmas = db.SQLITE_PRAGMAS
+    try:
+        for synchronous in args.synchronous:
+            db.SQLITE_PRAGMAS = tuple((name, synchronous if name == 'synchronous' else value) for name, value in pragmas)
+            for write_behind in (False, True):
+                with tempfile.TemporaryDirectory() as tmp:
+                    result = run(os.path.join(tmp, 'bench.db'), write_behind, args.threads, args.ops)
+                print(f"synchronous={synchronous} {result}")
+    finally:
+        db.SQLITE_PRAGMAS = pragmas
+    return 0
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Measures the overhead of metrics collection on db.py's hot path.
+
+Usage:
+    python bench_metrics.py [--iterations 50000]
+
+Runs the token_is_valid and search statements through db.query_result against a small seeded
+database with metrics.enabled off and on, and reports the added cost per statement.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from bench import bench_isbn13, seed_catalog
+import db
+import metrics
+
+
+def time_statements(iterations):
+    statements = [
+        ("SELECT id FROM member WHERE email=?", ['member1@example.com']),
+        ("SELECT id, title FROM resource WHERE isbn = ?", [bench_isbn13('978', 42)]),
+    ]
+    with db.connection() as conx:
+        metrics.start_request()
+        started = time.perf_counter()
+        for i in range(iterations):
+            qry, args = statements[i % len(statements)]
+            db.query_result(conx, qry, args, single_row=True, empty_results=True)
+        elapsed = time.perf_counter() - started
+        metrics.finish_request('bench')
+    return elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure metrics collection overhead")
+    parser.add_argument('--iterations', type=int, default=50000)
+    args = parser.parse_args(argv)
+
+    seed_catalog(os.path.join(tempfile.mkdtemp(prefix='bench-metrics-'), db.DB_NAME), 1000, 100)
+    time_statements(1000)  # Warm the page cache and fingerprint cache
+
+    results = {}
+    for enabled in (False, True, False, True):
+        metrics.enabled = enabled
+        results.setdefault(enabled, []).append(time_statements(args.iterations))
+
+    off = min(results[False]) / args.iterations * 1e6
+    on = min(results[True]) / args.iterations * 1e6
+    print(f"metrics off: {off:.2f}us/statement")
+    print(f"metrics on:  {on:.2f}us/statement")
+    print(f"overhead:    {on - off:.2f}us/statement ({(on - off) / off * 100:.1f}%)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""Measures memory and CPU for building and serializing search results.
+
+Usage:
+    python bench_models.py [--rows 10000] [--repeat 5]
+
+Builds `rows` Resource objects from search-shaped rows and serializes them three ways:
+
+  legacy    the dict-backed Resource that db.py used before, serialized through __dict__
+  objects   the slotted Resource, serialized through to_dict() (the default /v1/search shape)
+  columns   the slotted Resource, serialized by resources_to_columns (?format=columns)
+
+Reports the peak memory of the built objects (tracemalloc), build and serialize time (best of
+`repeat`), and the JSON size.
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+import db
+
+
+class LegacyResource:
+    """db.Resource as it was before __slots__, for comparison"""
+    def __init__(self, result=None, author_first=None, author_middle=None, author_last=None, copies=None, available=None):
+        author_full = ""
+        if author_first:
+            author_full += (author_first + " ")
+        if author_middle:
+            author_full += (author_middle + " ")
+        if author_last:
+            author_full += (author_last)
+        self.id = result[0]
+        self.author = author_full
+        self.title = result[1]
+        self.isbn10 = result[4]
+        self.isbn13 = result[5]
+        self.added = result[6]
+        self.edition = result[3]
+        self.copies = copies
+        self.available = available
+
+
+def search_rows(n):
+    """Rows shaped like build_search_query's: 7 resource columns, author names, copies, available"""
+    return [
+        (
+            (i, f"Title number {i}", i % 500, str(i % 5 + 1), f"{i:010d}", f"978{i:010d}", '2024-01-01'),
+            'Ursula', 'K' if i % 3 else '', f"Author{i % 500}", 2, i % 3
+        )
+        for i in range(n)
+    ]
+
+
+SHAPES = {
+    'legacy': (LegacyResource, lambda resources: json.dumps({'results': [r.__dict__ for r in resources]})),
+    'objects': (db.Resource, lambda resources: json.dumps({'results': [r.to_dict() for r in resources]})),
+    'columns': (db.Resource, lambda resources: json.dumps(db.resources_to_columns(resources))),
+}
+
+
+def build(model, rows):
+    return [model(row, first, middle, last, copies, available) for row, first, middle, last, copies, available in rows]
+
+
+def measure(shape, rows, repeat):
+    model, serialize = SHAPES[shape]
+
+    tracemalloc.start()
+    resources = build(model, rows)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    build_secs = serialize_secs = float('inf')
+    for i in range(repeat):
+        started = time.perf_counter()
+        resources = build(model, rows)
+        build_secs = min(build_secs, time.perf_counter() - started)
+        started = time.perf_counter()
+        payload = serialize(resources)
+        serialize_secs = min(serialize_secs, time.perf_counter() - started)
+
+    return {
+        'memoryKb': round(memory / 1024, 1),
+        'buildMs': round(build_secs * 1000, 2),
+        'serializeMs': round(serialize_secs * 1000, 2),
+        'jsonKb': round(len(payload) / 1024, 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare Resource memory and serialization cost")
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    rows = search_rows(args.rows)
+    results = {shape: measure(shape, rows, args.repeat) for shape in SHAPES}
+    legacy = results['legacy']
+    print(f"{args.rows} rows")
+    for shape, result in results.items():
+        saved = {
+            key: f"{(1 - result[key] / legacy[key]) * 100:+.0f}%" if legacy[key] else 'n/a'
+            for key in ('memoryKb', 'buildMs', 'serializeMs', 'jsonKb')
+        }
+        print(f"{shape:8} {result}  saved vs legacy {saved}")
+    return 0
+
+
+if __name__ == '__main__':
+    main()
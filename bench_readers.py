@@ -0,0 +1,90 @@
+"""Measures search throughput per reader thread count while a bulk import is writing.
+
+Usage:
+    python bench_readers.py [--resources 20000] [--threads 1 2 4 8] [--secs 3] [--no-import]
+
+Seeds a fresh database, then for each thread count runs db.search_resources in that many
+threads for `secs` seconds while another thread keeps importing resources through
+db.bulk_add_resources_to_inventory. Searches use the read-only pool and the import holds the
+single writer, so searches/s should grow with threads and the import should keep its rate.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+import os
+import tempfile
+import threading
+import time
+
+from bench import SEARCH_TITLES, TITLE_WORDS, bench_isbn13, percentile, seed_catalog
+import db
+
+
+def import_forever(stop_event, imported, batch_size=200):
+    sequence = count(10000000)
+    while not stop_event.is_set():
+        rows = [
+            {
+                'title': f"{TITLE_WORDS[n % 10]} Imported {n}",
+                'authorFirst': f"Import{n % 97}",
+                'authorLast': f"Writer{n % 31}",
+                'isbn13': bench_isbn13('979', n),
+            }
+            for n in (next(sequence) for i in range(batch_size))
+        ]
+        db.bulk_add_resources_to_inventory(rows, batch_size=batch_size)
+        imported[0] += len(rows)
+
+
+def search_for(secs, index):
+    latencies = []
+    deadline = time.perf_counter() + secs
+    i = index
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        db.search_resources(title=SEARCH_TITLES[i % len(SEARCH_TITLES)], limit=20)
+        latencies.append(time.perf_counter() - started)
+        i += 1
+    return latencies
+
+
+def run(threads, secs, with_import):
+    stop_event = threading.Event()
+    imported = [0]
+    importer = threading.Thread(target=import_forever, args=(stop_event, imported), daemon=True)
+    if with_import:
+        importer.start()
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            latencies = sorted(sum(executor.map(search_for, [secs] * threads, range(threads)), []))
+    finally:
+        stop_event.set()
+        if with_import:
+            importer.join()
+    return {
+        'threads': threads,
+        'searchesPerSec': round(len(latencies) / secs, 1),
+        'p50Ms': round(percentile(latencies, 50) * 1000, 2),
+        'p99Ms': round(percentile(latencies, 99) * 1000, 2),
+        'importedPerSec': round(imported[0] / secs, 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search throughput by reader threads during an import")
+    parser.add_argument('--resources', type=int, default=20000)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--secs', type=float, default=3)
+    parser.add_argument('--no-import', dest='with_import', action='store_false')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        seed_catalog(os.path.join(tmp, 'bench.db'), args.resources)
+        for threads in args.threads:
+            print(run(threads, args.secs, args.with_import))
+        db.reset_pool()
+    return 0
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Compares the Flask (app.py) and ASGI (asgi_app.py) serving modes on one seeded database.
+
+Usage:
+    python bench_serving.py [--resources 20000] [--concurrency 8 32] [--idle 0 500] [--requests 2000]
+
+Each mode is started as a local server subprocess (the Flask development server with threads,
+or uvicorn for ASGI). For every (concurrency, idle) pair the benchmark opens `idle` keep-alive
+sockets that never send a request, then runs `requests` authenticated /v1/search calls spread
+over `concurrency` client threads, and reports throughput and latency percentiles.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import http.client
+import json
+import os
+import socket
+import tempfile
+import time
+from urllib.parse import urlencode
+
+from bench import free_port, seed_catalog, start_server, summarize
+import db
+
+
+SEARCH_TITLES = ['the', 'history', 'book', 'night', 'river', 'garden']
+
+
+def login(port):
+    email = f"bench-{time.time_ns()}@example.com"
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    form = urlencode({'email': email, 'password': 'benchpw', 'confirm_password': 'benchpw'})
+    conn.request('POST', '/v1/join', form, {'Content-Type': 'application/x-www-form-urlencoded', 'User-Agent': 'bench'})
+    resp = conn.getresponse()
+    resp.read()
+    if resp.status != 200:
+        raise RuntimeError(f"Join failed with {resp.status}")
+    return resp.getheader('Set-Cookie').split(';')[0]
+
+
+def run_load(port, cookie, total_requests, concurrency):
+    def worker(worker_index, count):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        latencies = []
+        errors = 0
+        for i in range(count):
+            qs = urlencode({'title': SEARCH_TITLES[(worker_index + i) % len(SEARCH_TITLES)], 'limit': 20})
+            started = time.perf_counter()
+            try:
+                conn.request('GET', f"/v1/search?{qs}", headers={'Cookie': cookie})
+                resp = conn.getresponse()
+                resp.read()
+                if resp.status != 200:
+                    errors += 1
+                if resp.will_close:
+                    conn.close()
+            except (OSError, http.client.HTTPException):
+                errors += 1
+                conn.close()
+            latencies.append(time.perf_counter() - started)
+        conn.close()
+        return latencies, errors
+
+    per_worker = [total_requests // concurrency + (1 if i < total_requests % concurrency else 0) for i in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(worker, range(concurrency), per_worker))
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency for worker_latencies, errors in outcomes for latency in worker_latencies]
+    return summarize(latencies, sum(errors for worker_latencies, errors in outcomes), elapsed)
+
+
+def open_idle_connections(port, total):
+    sockets = []
+    for i in range(total):
+        try:
+            sockets.append(socket.create_connection(('127.0.0.1', port), timeout=5))
+        except OSError:
+            break
+    return sockets
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare Flask and ASGI serving modes")
+    parser.add_argument('--modes', nargs='+', default=['flask', 'asgi'], choices=['flask', 'asgi'])
+    parser.add_argument('--resources', type=int, default=20000)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[8, 32])
+    parser.add_argument('--idle', type=int, nargs='+', default=[0, 500], help="Idle keep-alive sockets held open during the run")
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='bench-serving-')
+    seed_catalog(os.path.join(workdir, db.DB_NAME), args.resources)
+
+    results = []
+    for mode in args.modes:
+        port = free_port()
+        proc = start_server(mode, port, workdir)
+        try:
+            cookie = login(port)
+            for idle in args.idle:
+                idle_sockets = open_idle_connections(port, idle)
+                try:
+                    for concurrency in args.concurrency:
+                        result = {'mode': mode, 'concurrency': concurrency, 'idle': len(idle_sockets)}
+                        result.update(run_load(port, cookie, args.requests, concurrency))
+                        results.append(result)
+                        print(json.dumps(result))
+                finally:
+                    for sock in idle_sockets:
+                        sock.close()
+        finally:
+            proc.terminate()
+            proc.wait()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
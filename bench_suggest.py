@@ -0,0 +1,71 @@
+"""Measures /v1/suggest lookup latency and index memory at catalog scale.
+
+Usage:
+    python bench_suggest.py [--titles 1000000] [--lookups 20000] [--inserts 10000]
+
+Loads a PrefixIndex with generated titles (see fixtures.TITLE_WORDS), then reports:
+  - build time and traced memory of the loaded index
+  - p50/p99/max latency of lookups for 1-4 character prefixes drawn from real titles
+  - per-insert cost of incremental adds (as made after add_resource commits)
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from bench import percentile
+import fixtures
+import suggest
+
+
+def generate_titles(n, rng):
+    words = fixtures.TITLE_WORDS
+    return [' '.join(rng.choice(words) for w in range(rng.randint(2, 6))) + f" {i}" for i in range(n)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the suggest prefix index")
+    parser.add_argument('--titles', type=int, default=1000000)
+    parser.add_argument('--lookups', type=int, default=20000)
+    parser.add_argument('--inserts', type=int, default=10000)
+    parser.add_argument('--limit', type=int, default=suggest.SUGGEST_DEFAULT_LIMIT)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    titles = generate_titles(args.titles, rng)
+    pairs = [(suggest.normalize(title), title) for title in titles]
+
+    index = suggest.PrefixIndex()
+    tracemalloc.start()
+    started = time.perf_counter()
+    index.load(pairs)
+    build_secs = time.perf_counter() - started
+    del pairs
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"built {len(index)} titles in {build_secs:.2f}s, {memory / 1024 / 1024:.1f} MB ({memory / max(len(index), 1):.0f} bytes/title)")
+
+    prefixes = [suggest.normalize(rng.choice(titles))[:rng.randint(1, 4)] for i in range(args.lookups)]
+    latencies = []
+    for prefix in prefixes:
+        started = time.perf_counter()
+        index.lookup(prefix, args.limit)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    print(
+        f"lookup: p50 {percentile(latencies, 50) * 1e6:.1f}us, p99 {percentile(latencies, 99) * 1e6:.1f}us, "
+        f"max {latencies[-1] * 1e6:.1f}us over {len(latencies)} prefixes"
+    )
+
+    started = time.perf_counter()
+    for i in range(args.inserts):
+        title = f"Inserted Title {i}"
+        index.add(suggest.normalize(title), title)
+    insert_secs = time.perf_counter() - started
+    print(f"insert: {insert_secs / max(args.inserts, 1) * 1e6:.1f}us each over {args.inserts} (merges every {index.merge_size})")
+    return 0
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""Query-plan regression check for db.py.
+
+Usage:
+    python check_query_plans.py [--scale 10000] [--db existing_fixture.db] [--verbose]
+
+Generates a fixture database (see fixtures.py), exercises every db.py helper while tracing the SQL
+it sends, then runs EXPLAIN QUERY PLAN on each distinct statement. The exit status is 1 if any
+statement falls back to a full table (or full index) scan, so a missing index or an unindexable
+predicate is caught before it reaches production sized tables.
+"""
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+
+import db
+import fixtures
+
+
+# Tables that are tiny by construction and fine to scan
+SCAN_ALLOWED_TABLES = {'sqlite_sequence', 'schema_version'}
+UNPLANNED_PREFIXES = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE', 'PRAGMA', 'CREATE', 'ANALYZE', 'EXPLAIN', '--')
+FULL_SCAN = re.compile(r"^SCAN ([\w.]+)\b(?! VIRTUAL TABLE)")
+FTS_SHADOW_TABLE = re.compile(r"_(config|data|idx|content|docsize)'?$")  # FTS5 internals, read by key or tiny
+
+
+def exercises(scale):
+    """(name, callable) pairs covering every db.py helper that issues SQL at request time"""
+    email = 'member1@example.com'
+    isbn10, isbn13 = fixtures.make_isbns(scale // 2)
+    state = {}
+
+    def join_and_login():
+        member_id = db.add_new_member('plan-check@example.com', 'pw')
+        session_id = db.create_new_session()
+        db.associate_session_with_user(session_id, member_id, '127.0.0.1', 'plan-check')
+        state['member_id'] = member_id
+        state['session_id'] = session_id
+        state['token'] = db.add_token(session_id)
+
+    def first_search_page_cursor():
+        return db.search_resources(title='the', limit=5)[1]
+
+    def checkout_and_check_in():
+        with db.connection() as conx:
+            # Fixture borrows are open for the lowest stock ids, so the newest copy is free
+            stock_id = db.query_result(conx, "SELECT MAX(id) FROM stock", single_row=True, all_fields=False)
+        db.checkout_resource(state['member_id'], stock_id)
+        db.check_in_resource(state['member_id'], stock_id)
+
+    return [
+        ('add_new_member/create_new_session/associate_session_with_user/add_token', join_and_login),
+        ('password_matches', lambda: db.password_matches(email, 'password')),
+        ('get_member_by_email', lambda: db.get_member_by_email(email)),
+        ('get_member_by_session', lambda: db.get_member_by_session(state['session_id'])),
+        ('token_is_valid', lambda: (db.token_cache.clear(), db.token_is_valid(state['token']))),
+        ('sesson_is_valid', lambda: db.sesson_is_valid(state['session_id'])),
+        ('deactivate_tokens', lambda: db.deactivate_tokens(state['member_id'])),
+        ('get_authors_by_id', lambda: db.get_authors_by_id([1, 2, 3])),
+        ('get_author_by_name', lambda: db.get_author_by_name('John', '', 'Smith')),
+        ('get_authors_by_last_name', lambda: db.get_authors_by_last_name('Smith')),
+        ('search_resources title', lambda: db.search_resources(title='river garden')),
+        ('search_resources author', lambda: db.search_resources(author='Smith')),
+        ('search_resources author+title', lambda: db.search_resources(author='Smith', title='the')),
+        ('search_resources isbn', lambda: db.search_resources(isbn=isbn10)),
+        ('get_resource_by_isbn', lambda: db.get_resource_by_isbn(isbn13)),
+        ('resolve_isbns', lambda: db.resolve_isbns([isbn10, isbn13, '0-306-40615-2', 'not-an-isbn'])),
+        ('search_resources available', lambda: db.search_resources(title='the', available=True)),
+        ('search_resources_batch', lambda: db.search_resources_batch([{'author': 'Smith'}, {'title': 'river'}, {'isbn': isbn13}])),
+        ('search_resources cursor', lambda: db.search_resources(title='the', limit=5, cursor=first_search_page_cursor())),
+        ('iter_search_resources', lambda: list(db.iter_search_resources(title='night', limit=50))),
+        ('add_resource_to_inventory existing', lambda: db.add_resource_to_inventory('t', 'John', '', 'Smith', '1', isbn10, isbn13)),
+        ('add_resource_to_inventory new', lambda: db.add_resource_to_inventory('Plan Check', 'Plan', '', 'Check', '1', '0000000000', '9780000000002')),
+        ('bulk_add_resources_to_inventory', lambda: db.bulk_add_resources_to_inventory([
+            {'title': 'Bulk', 'authorFirst': 'Bulk', 'authorMiddle': '', 'authorLast': 'Smith', 'edition': '1', 'isbn10': isbn10, 'isbn13': ''},
+            {'title': 'Bulk New', 'authorFirst': 'Bulk', 'authorMiddle': '', 'authorLast': 'Smith', 'edition': '1', 'isbn10': '1111111111', 'isbn13': ''},
+        ])),
+        ('get_member_by_token', lambda: (db.token_cache.clear(), db.get_member_by_token(state['token']))),
+        ('checkout_resource/check_in_resource', checkout_and_check_in),
+        ('deactivate_resource', lambda: db.deactivate_resource(1)),
+        ('deactivate_member', lambda: db.deactivate_member(state['member_id'])),
+        ('purge_expired', lambda: db.get_session_store().purge_expired(100, 3600)),
+    ]
+
+
+def trace_statements(scale, verbose=False):
+    """Runs every exercise on one traced connection. Returns ({sql: exercise name}, {exercise name: error})."""
+    statements = {}
+    errors = {}
+    current = {'name': None}
+
+    def on_statement(sql):
+        if not sql.lstrip().upper().startswith(UNPLANNED_PREFIXES):
+            statements.setdefault(sql.strip(), current['name'])
+
+    with db.connection() as conx:
+        conx.set_trace_callback(on_statement)
+        try:
+            for name, exercise in exercises(scale):
+                current['name'] = name
+                try:
+                    exercise()
+                except Exception as e:
+                    errors[name] = f"{type(e).__name__}: {e}"
+                    if conx.in_transaction:
+                        conx.rollback()
+                if verbose:
+                    print(f"ran {name}")
+        finally:
+            conx.set_trace_callback(None)
+    return statements, errors
+
+
+def full_scans(conx, sql):
+    """Plan lines that scan a whole table or index"""
+    try:
+        plan = conx.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+    except sqlite3.Error as e:
+        return [f"could not plan: {e}"]
+    scans = []
+    for row in plan:
+        detail = row[-1]
+        match = FULL_SCAN.match(detail)
+        if not match or match.group(1) == 'CONSTANT':
+            continue
+        table = match.group(1).split('.')[-1]
+        if table not in SCAN_ALLOWED_TABLES and not FTS_SHADOW_TABLE.search(table):
+            scans.append(detail)
+    return scans
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fail if a db.py query falls back to a full scan")
+    parser.add_argument('--scale', type=int, default=10000, help="Resources in the generated fixture")
+    parser.add_argument('--db', help="Check an existing fixture instead of generating one (the exercises write to it)")
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args(argv)
+
+    if args.db:
+        db.DB_NAME = args.db
+        db.reset_pool()
+        db.prepare_db()
+    else:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='query-plans-'), 'fixture.db')
+        fixtures.generate(
+            db_path,
+            members=max(args.scale // 10, 10),
+            authors=max(args.scale // 20, 10),
+            resources=args.scale,
+            stock=args.scale * 2,
+            borrows=args.scale * 3,
+            log=print if args.verbose else (lambda message: None)
+        )
+        db.DB_NAME = db_path
+        db.reset_pool()
+
+    statements, errors = trace_statements(args.scale, args.verbose)
+
+    failures = 0
+    with db.connection() as conx:
+        for sql, exercise in statements.items():
+            scans = full_scans(conx, sql)
+            if scans:
+                failures += 1
+                print(f"FULL SCAN in {exercise}:\n    {sql}\n    " + "\n    ".join(scans))
+            elif args.verbose:
+                print(f"ok  {exercise}: {sql}")
+
+    for name, error in errors.items():
+        print(f"WARNING {name} raised {error}")
+    print(f"{len(statements)} statements checked, {failures} with full scans")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
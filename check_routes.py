@@ -0,0 +1,248 @@
+"""Route regression check for app.py and asgi_app.py.
+
+Usage:
+    python check_routes.py [--verbose]
+
+Starts both apps in-process on one fresh database (Flask through its test client, ASGI by calling
+asgi_app.app directly), logs a member in on each, and sends every request in ROUTE_CASES to both.
+The exit status is 1 if either app answers a case with an unexpected status or body, e.g. a 500
+from a decorator that drops route arguments.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+from urllib.parse import urlencode
+from uuid import uuid4
+
+import db
+import fixtures
+
+
+ISBN10, ISBN13 = fixtures.make_isbns(1)
+MISSING_ISBN13 = fixtures.make_isbns(2)[1]
+
+# (name, method, path, json body or None, expected status, check(body) or None)
+ROUTE_CASES = [
+    ('resource by ISBN-13', 'GET', f"/v1/resource/isbn/{ISBN13}", None, 200,
+     lambda body: body['resource']['isbn13'] == ISBN13),
+    ('resource by ISBN-10', 'GET', f"/v1/resource/isbn/{ISBN10}", None, 200,
+     lambda body: body['resource']['isbn13'] == ISBN13),
+    ('resource by unknown ISBN', 'GET', f"/v1/resource/isbn/{MISSING_ISBN13}", None, 404,
+     lambda body: body['error'] == 'resourceNotFound'),
+    ('resource by invalid ISBN', 'GET', '/v1/resource/isbn/1234567890', None, 400,
+     lambda body: body['error'] == 'invalidIsbn'),
+    ('resource ISBN batch', 'POST', '/v1/resource/isbn/batch', {'isbns': [ISBN10, MISSING_ISBN13]}, 200,
+     lambda body: [result['status'] for result in body['results']] == ['found', 'notFound']),
+    ('search limit 0', 'GET', '/v1/search?title=route&limit=0', None, 400,
+     lambda body: body['error'] == 'invalidLimit'),
+    ('search stream limit 0', 'GET', '/v1/search?title=route&limit=0&stream=1', None, 400,
+     lambda body: body['error'] == 'invalidLimit'),
+    ('search default limit', 'GET', '/v1/search?title=route', None, 200,
+     lambda body: len(body['results']) == 1),
+    ('search batch', 'POST', '/v1/search/batch', {'queries': [{'id': 'a', 'title': 'route'}, {'isbn': ISBN13, 'limit': 5}]}, 200,
+     lambda body: [len(body['results'][key]['results']) for key in ('a', '1')] == [1, 1]),
+    ('search batch non-numeric limit', 'POST', '/v1/search/batch', {'queries': [{'title': 'route', 'limit': 'ten'}]}, 200,
+     lambda body: body['results']['0']['error'] == 'invalidLimit'),
+    ('search batch limit 0', 'POST', '/v1/search/batch', {'queries': [{'title': 'route', 'limit': 0}]}, 200,
+     lambda body: body['results']['0']['error'] == 'invalidLimit'),
+    ('search unknown format', 'GET', '/v1/search?title=route&format=rows', None, 400,
+     lambda body: body['error'] == 'invalidFormat'),
+    ('search batch duplicate ids', 'POST', '/v1/search/batch', {'queries': [{'id': 'a', 'title': 'x'}, {'id': 'a', 'title': 'y'}]}, 400,
+     lambda body: body['error'] == 'duplicateQueryId'),
+    ('checkout without stockId', 'POST', '/v1/checkout', {'stockId': 'one'}, 400,
+     lambda body: body['error'] == 'invalidStockId'),
+    ('checkin of stock not on loan', 'POST', '/v1/checkin', {'stockId': 1}, 409,
+     lambda body: body['error'] == 'checkinFailed'),
+    ('search batch integer title', 'POST', '/v1/search/batch', {'queries': [{'title': 5}]}, 400,
+     lambda body: body['error'] == 'invalidBody'),
+    ('search batch list author', 'POST', '/v1/search/batch', {'queries': [{'author': ['a']}]}, 400,
+     lambda body: body['error'] == 'invalidBody'),
+    ('search batch list limit', 'POST', '/v1/search/batch', {'queries': [{'title': 'route', 'limit': [1]}]}, 400,
+     lambda body: body['error'] == 'invalidBody'),
+    ('search batch object cursor', 'POST', '/v1/search/batch', {'queries': [{'title': 'route', 'cursor': {}}]}, 400,
+     lambda body: body['error'] == 'invalidBody'),
+]
+
+
+class _LifespanDone(Exception):
+    pass
+
+
+class FlaskClient:
+    name = 'flask'
+
+    def __init__(self):
+        import app  # Prepares the database on import, so only once db.DB_NAME is set
+        self.client = app.app.test_client()
+
+    def request(self, method, path, body=None, form=None, headers=None):
+        response = self.client.open(path, method=method, json=body, data=form, headers={'User-Agent': 'check_routes', **(headers or {})})
+        return response.status_code, response.headers, response.get_json(silent=True)
+
+    def set_cookie(self, name, value):
+        self.client.set_cookie(name, value)
+
+    def close(self):
+        pass
+
+
+class AsgiClient:
+    name = 'asgi'
+
+    def __init__(self):
+        import asgi_app
+        self.app = asgi_app.app
+        self.cookies = {}
+        self.loop = asyncio.new_event_loop()
+        self.loop.run_until_complete(self._lifespan('lifespan.startup'))
+
+    async def _lifespan(self, message_type):
+        messages = [{'type': message_type}]
+
+        async def receive():
+            return messages.pop() if messages else await asyncio.Future()
+
+        async def send(message):
+            raise _LifespanDone()  # Startup or shutdown completed; leave asgi_app's lifespan loop
+
+        try:
+            await self.app({'type': 'lifespan'}, receive, send)
+        except _LifespanDone:
+            pass
+
+    async def _request(self, method, path, body=None, form=None, extra_headers=None):
+        headers = [(b'user-agent', b'check_routes')]
+        headers += [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in (extra_headers or {}).items() if v is not None]
+        if self.cookies:
+            headers.append((b'cookie', '; '.join(f"{k}={v}" for k, v in self.cookies.items()).encode()))
+        payload = json.dumps(body).encode() if body is not None else urlencode(form or {}).encode()
+        path, _, query = path.partition('?')
+        scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query.encode(), 'headers': headers}
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': payload, 'more_body': False}
+
+        async def send(message):
+            sent.append(message)
+
+        try:
+            await self.app(scope, receive, send)
+        except Exception as e:  # An ASGI server would answer these with a 500
+            print(f"{self.name} {method} {path} raised {e!r}")
+            return 500, {}, None
+        response_headers = {k.decode('latin-1').title(): v.decode('latin-1') for k, v in sent[0]['headers']}
+        try:
+            response_body = json.loads(sent[1]['body'])
+        except ValueError:
+            response_body = None
+        return sent[0]['status'], response_headers, response_body
+
+    def request(self, method, path, body=None, form=None, headers=None):
+        return self.loop.run_until_complete(self._request(method, path, body, form, headers))
+
+    def set_cookie(self, name, value):
+        self.cookies[name] = value
+
+    def close(self):
+        self.loop.run_until_complete(self._lifespan('lifespan.shutdown'))
+        self.loop.close()
+
+
+def log_in(client):
+    form = {'email': f"{client.name}@example.com", 'password': 'pw', 'confirm_password': 'pw'}
+    status, headers, body = client.request('POST', '/v1/join', form=form)
+    if status != 200:
+        raise RuntimeError(f"{client.name}: join failed with {status} {body}")
+    client.set_cookie('token', headers['Set-Cookie'].split(';')[0].split('=', 1)[1])
+
+
+def check_swept_session(client, verbose=False):
+    """Logging in or joining with an LSESSION that no longer exists (e.g. swept while anonymous)
+    must succeed and hand back a new session"""
+    failures = 0
+    cases = [
+        ('login with swept session', '/v1/login', {'email': f"{client.name}@example.com", 'password': 'pw'}),
+        ('join with swept session', '/v1/join', {'email': f"{client.name}-2@example.com", 'password': 'pw', 'confirm_password': 'pw'}),
+    ]
+    for name, path, form in cases:
+        swept = str(uuid4())  # A session id with no row, as the sweeper leaves behind
+        status, headers, body = client.request('POST', path, form=form, headers={'LSESSION': swept})
+        session_id = headers.get('Lsession')
+        if status != 200 or not session_id or session_id == swept or 'Set-Cookie' not in headers:
+            failures += 1
+            print(f"FAIL {client.name} {name}: POST {path} -> {status} {body} LSESSION={session_id}")
+        elif verbose:
+            print(f"ok   {client.name} {name}: {status}")
+    return failures
+
+
+def check_external_write(client, verbose=False):
+    """A catalog write made by another process (here a plain sqlite3 connection, as ingest.py
+    would make) must invalidate cached /v1/search responses and their ETags"""
+    title = f"Outside {client.name}"
+    path = f"/v1/search?title={title.replace(' ', '+')}"
+    status, headers, body = client.request('GET', path)
+    etag = headers.get('Etag')
+    other = sqlite3.connect(db.DB_NAME)
+    try:
+        author_id = other.execute("INSERT INTO author(first_name, middle_name, last_name) VALUES('Out', '', 'Side')").lastrowid
+        other.execute("INSERT INTO resource(title, author_id, edition) VALUES(?, ?, '1')", [title, author_id])
+        other.commit()
+    finally:
+        other.close()
+    status_after, headers_after, body_after = client.request('GET', path, headers={'If-None-Match': etag})
+    if body != {'results': [], 'next': None} or status_after != 200 or len((body_after or {}).get('results', [])) != 1:
+        print(f"FAIL {client.name} search after external write: {status} {body} then {status_after} {body_after}")
+        return 1
+    if verbose:
+        print(f"ok   {client.name} search after external write: {status_after}")
+    return 0
+
+
+def run_cases(client, verbose=False):
+    failures = 0
+    for name, method, path, body, expected_status, check in ROUTE_CASES:
+        status, headers, response_body = client.request(method, path, body)
+        ok = status == expected_status
+        if ok and check is not None:
+            try:
+                ok = bool(check(response_body))
+            except (KeyError, TypeError, IndexError):
+                ok = False
+        if not ok:
+            failures += 1
+            print(f"FAIL {client.name} {name}: {method} {path} -> {status} {response_body} (expected {expected_status})")
+        elif verbose:
+            print(f"ok   {client.name} {name}: {status}")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fail if app.py or asgi_app.py mishandles a route")
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args(argv)
+
+    db.DB_NAME = os.path.join(tempfile.mkdtemp(prefix='check-routes-'), 'library.db')
+    db.reset_pool()
+    db.prepare_db()
+    db.add_resource_to_inventory('Route Check', 'Ada', '', 'Checker', '1', ISBN10, ISBN13)
+
+    failures = 0
+    for client_class in (FlaskClient, AsgiClient):
+        client = client_class()
+        log_in(client)
+        failures += run_cases(client, args.verbose)
+        failures += check_external_write(client, args.verbose)
+        failures += check_swept_session(client, args.verbose)  # Last: logging in again replaces the client's token
+        client.close()
+    print(f"{len(ROUTE_CASES)} cases checked on flask and asgi, {failures} failures")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
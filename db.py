@@ -1,12 +1,69 @@
-from datetime import datetime
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from concurrent.futures import Future
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+import math
+import os
+from queue import LifoQueue, Empty, Queue
+import re
+from urllib.request import pathname2url
 from uuid import uuid4
+import json
 import sqlite3
 from sqlite3 import connect as sqlite_connect
+import logging
+import threading
+import time
+
+import metrics
+import profiling
+
+logger = logging.getLogger(__name__)
 
 SCHEMA = "library"
 DB_NAME = "{}.db".format(SCHEMA)
 TOKEN_TTL_SECS = 120
+TOKEN_CACHE_SIZE = 10000
+SESSION_STORE = os.environ.get('LIBRARY_SESSION_STORE', 'sqlite')  # 'sqlite' or 'memory' (see SESSION_STORES)
+TIMER_WHEEL_TICK_SECS = 1.0
+# Session/token writes and add_borrow go through one group commit writer thread (see submit_writes)
+WRITE_BEHIND = os.environ.get('LIBRARY_WRITE_BEHIND', '0') == '1'
+GROUP_COMMIT_MAX_WRITES = int(os.environ.get('LIBRARY_GROUP_COMMIT_MAX_WRITES', '256'))
+GROUP_COMMIT_WINDOW_SECS = float(os.environ.get('LIBRARY_GROUP_COMMIT_WINDOW_SECS', '0'))  # 0: group whatever queued during the last commit
 RESOURCE_CHECKOUT_LIMIT = 3
+SEARCH_DEFAULT_LIMIT = 50
+SEARCH_MAX_LIMIT = 500
+SEARCH_FETCH_SIZE = 200
+SEARCH_BATCH_MAX_QUERIES = 50
+SEARCH_BATCH_MAX_RESULTS = 5000  # Sum of the per-query limits in one batch
+BULK_BATCH_SIZE = 1000
+SQLITE_MAX_VARIABLES = 900  # Stay under SQLite's historical 999 bound parameter limit
+ISBN_BATCH_MAX = 5000
+# How stale catalog_version() may be about commits made by other processes (ingest.py, other
+# workers). 0 reads the stored version on every call, which costs a few microseconds.
+CATALOG_VERSION_POLL_SECS = float(os.environ.get('LIBRARY_CATALOG_VERSION_POLL_SECS', '0'))
+
+# Connection pool
+DB_POOL_SIZE = 8  # Read-only connections; searches and auth checks scale with these
+DB_WRITE_POOL_SIZE = 1  # SQLite allows one writer at a time, so writers queue here rather than on SQLITE_BUSY
+DB_POOL_TIMEOUT_SECS = 5
+SQLITE_PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("cache_size", -16000),  # Negative values are KiB, so roughly 16MB per connection
+    ("mmap_size", 268435456),
+    ("busy_timeout", 5000),
+)
+# Readers are opened with mode=ro and never set journal_mode: under WAL they read a snapshot and
+# neither block the writer nor wait for it
+SQLITE_READ_PRAGMAS = (
+    ("query_only", 1),
+    ("cache_size", -16000),
+    ("mmap_size", 268435456),
+    ("busy_timeout", 5000),
+)
 
 class CheckoutException(Exception):
     pass
@@ -29,31 +86,61 @@ class MultipleAuthorsMatchedException(Exception):
 class ResourceCreateException(Exception):
     pass
 
+class PoolTimeoutException(Exception):
+    pass
+
+class InvalidCursorException(Exception):
+    pass
+
+class InvalidIsbnException(Exception):
+    pass
+
 class Resource:
-    def __init__(self, result=None, author_first=None, author_middle=None, author_last=None):
+    """A catalog entry as returned by search. Slotted, since searches build thousands at a time."""
+    FIELDS = ('id', 'author', 'title', 'isbn10', 'isbn13', 'added', 'edition', 'copies', 'available')
+    __slots__ = FIELDS
+
+    def __init__(self, result=None, author_first=None, author_middle=None, author_last=None, copies=None, available=None):
         if result and (not author_first or not author_last):
             raise ResourceCreateException(
                 f"Expected author first, middle, and last names, received '{author_first}' '{author_middle}' '{author_last}'"
             )
-        if not result:
-            return None  # Empty object
+        if not result:  # Empty object
+            result = (None,) * 7
 
-        author_full = ""
-        if author_first:
-            author_full += (author_first + " ")
-        if author_middle:
-            author_full += (author_middle + " ")
-        if author_last:
-            author_full += (author_last)
         self.id = result[0]
-        self.author = author_full
+        if author_middle:
+            self.author = f"{author_first} {author_middle} {author_last}"
+        else:
+            self.author = f"{author_first} {author_last}" if author_first else (author_last or '')
         self.title = result[1]
         self.isbn10 = result[4]
         self.isbn13 = result[5]
         self.added = result[6]
         self.edition = result[3]
+        self.copies = copies
+        self.available = available
+
+    def values(self):
+        return (self.id, self.author, self.title, self.isbn10, self.isbn13, self.added, self.edition, self.copies, self.available)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'author': self.author,
+            'title': self.title,
+            'isbn10': self.isbn10,
+            'isbn13': self.isbn13,
+            'added': self.added,
+            'edition': self.edition,
+            'copies': self.copies,
+            'available': self.available,
+        }
+
 
 class Author:
+    __slots__ = ('id', 'first_name', 'middle_name', 'last_name')
+
     def __init__(self, author_result):
         self.id = author_result[0]
         self.first_name = author_result[1]
@@ -61,14 +148,639 @@ class Author:
         self.last_name = author_result[3]
 
 
+def resources_to_columns(resources):
+    """Columnar shape for large result sets: field names once, then one array per field.
+    Returns:
+        {'fields': [...], 'columns': [[ids...], [authors...], ...]}
+    """
+    rows = [resource.values() for resource in resources]
+    columns = [list(column) for column in zip(*rows)] if rows else [[] for field in Resource.FIELDS]
+    return {'fields': list(Resource.FIELDS), 'columns': columns}
+
+
+def utc_now():
+    """Naive UTC datetime, comparable with SQLite's CURRENT_TIMESTAMP and datetime('now') values"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class TokenCache:
+    """In-process LRU cache of valid tokens and their expiry times (UTC), bounded to `max_size` entries.
+
+    Entries are dropped once their expiry passes, when the LRU bound is hit, or when the member's
+    tokens are deactivated. The cache is per process, so revocations made by another process
+    are only seen once the cached entry expires (at most TOKEN_TTL_SECS).
+
+    A token read from the store just before a deactivation commits must not be cached after the
+    invalidation has run, so callers take generation() before reading the store and pass it to
+    put(), which refuses the entry if the member was invalidated since.
+    """
+    def __init__(self, max_size=TOKEN_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()  # token -> (expires_at, member_id)
+        self._member_tokens = {}  # member_id -> set of cached tokens
+        self._generation = 0  # Bumped by every invalidate_member
+        self._invalidated = {}  # member_id -> generation of the member's latest invalidation
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, token):
+        """Returns the cached expiry for `token`, or None if it is not cached (or has expired)"""
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, member_id = entry
+            if utc_now() > expires_at:
+                self._remove(token, member_id)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return expires_at
+
+    def generation(self):
+        with self._lock:
+            return self._generation
+
+    def put(self, token, expires_at, member_id, generation):
+        """Caches `token` unless the member was invalidated after `generation` was taken"""
+        with self._lock:
+            if self._invalidated.get(member_id, -1) > generation:
+                return
+            if token in self._entries:
+                self._remove(token, self._entries[token][1])
+            self._entries[token] = (expires_at, member_id)
+            self._member_tokens.setdefault(member_id, set()).add(token)
+            while len(self._entries) > self.max_size:
+                oldest_token, (oldest_expiry, oldest_member) = next(iter(self._entries.items()))
+                self._remove(oldest_token, oldest_member)
+                self.evictions += 1
+
+    def member_of(self, token):
+        """Returns the member id for a cached, unexpired `token` without counting a hit or miss"""
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or utc_now() > entry[0]:
+                return None
+            return entry[1]
+
+    def invalidate_member(self, member_id):
+        with self._lock:
+            self._generation += 1
+            self._invalidated[member_id] = self._generation
+            for token in self._member_tokens.pop(member_id, set()):
+                self._entries.pop(token, None)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._member_tokens.clear()
+
+    def _remove(self, token, member_id):
+        self._entries.pop(token, None)
+        member_tokens = self._member_tokens.get(member_id)
+        if member_tokens is not None:
+            member_tokens.discard(token)
+            if not member_tokens:
+                del self._member_tokens[member_id]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxSize': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'expirations': self.expirations,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+token_cache = TokenCache()
+
 
 # SQLite3
-def get_sqlite3_conx(db_name):
-    """Get SQLite3 connection for communicating with the local DB"""
-    conn = sqlite_connect(db_name, check_same_thread=False)  # Allows multithread access
+def get_sqlite3_conx(db_name, pragmas=SQLITE_PRAGMAS, readonly=False):
+    """Get SQLite3 connection for communicating with the local DB
+    Args:
+        readonly (bool): Open the file with mode=ro, so the connection can never write
+    """
+    if readonly:
+        uri = "file:{}?mode=ro".format(pathname2url(os.path.abspath(db_name)))
+        conn = sqlite_connect(uri, uri=True, check_same_thread=False)
+    else:
+        conn = sqlite_connect(db_name, check_same_thread=False)  # Allows multithread access
+    for name, value in pragmas:
+        conn.execute(f"PRAGMA {name}={value}")
+    # Used by migrations to backfill resource.isbn; request paths normalize ISBNs in Python
+    conn.create_function('normalize_isbn', 1, _normalize_isbn_or_none, deterministic=True)
+    conn.create_function('isbn13_to_isbn10', 1, isbn13_to_isbn10, deterministic=True)
     return conn
 
 
+class ConnectionPool:
+    """Bounded pool of configured SQLite3 connections.
+
+    Connections are opened lazily up to `size`. Once every connection is checked out, callers
+    wait up to `timeout` seconds for one to be released before PoolTimeoutException is raised.
+    """
+    def __init__(self, db_name, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT_SECS, pragmas=SQLITE_PRAGMAS, readonly=False):
+        self.db_name = db_name
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = pragmas
+        self.readonly = readonly
+        self._idle = LifoQueue()  # Most recently used connection first, so its page cache is warm
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._acquired = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._wait_secs_total = 0.0
+        self._wait_secs_max = 0.0
+
+    def acquire(self):
+        try:
+            conx = self._idle.get_nowait()
+        except Empty:
+            conx = None
+
+        if conx is None:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    conx = get_sqlite3_conx(self.db_name, self.pragmas, self.readonly)
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                conx = self._wait_for_connection()
+
+        with self._lock:
+            self._in_use += 1
+            self._acquired += 1
+        return conx
+
+    def _wait_for_connection(self):
+        started = time.perf_counter()
+        try:
+            conx = self._idle.get(timeout=self.timeout)
+        except Empty:
+            with self._lock:
+                self._timeouts += 1
+            raise PoolTimeoutException(
+                "No connection to {} became available within {}s".format(self.db_name, self.timeout)
+            )
+        waited = time.perf_counter() - started
+        with self._lock:
+            self._waits += 1
+            self._wait_secs_total += waited
+            self._wait_secs_max = max(self._wait_secs_max, waited)
+        return conx
+
+    def release(self, conx):
+        if conx.in_transaction:  # Never hand an open transaction to the next caller
+            conx.rollback()
+        with self._lock:
+            self._in_use -= 1
+        self._idle.put(conx)
+
+    def close(self):
+        while True:
+            try:
+                conx = self._idle.get_nowait()
+            except Empty:
+                break
+            conx.close()
+            with self._lock:
+                self._created -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'open': self._created,
+                'inUse': self._in_use,
+                'idle': self._created - self._in_use,
+                'acquired': self._acquired,
+                'waits': self._waits,
+                'timeouts': self._timeouts,
+                'waitSecsTotal': round(self._wait_secs_total, 6),
+                'waitSecsMax': round(self._wait_secs_max, 6),
+                'waitSecsAvg': round(self._wait_secs_total / self._waits, 6) if self._waits else 0.0,
+            }
+
+
+_pool = None
+_read_pool = None
+_pool_lock = threading.Lock()
+# Per thread: `conx`, the writer held by the outermost connection()/transaction(); `read_conx`,
+# the reader held by the outermost read_connection() or, with `request_scoped`, by the request
+_scope = threading.local()
+
+
+def get_pool():
+    """The writer pool (DB_WRITE_POOL_SIZE connections), used by connection() and transaction()"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_NAME, size=DB_WRITE_POOL_SIZE, pragmas=SQLITE_PRAGMAS)
+    return _pool
+
+
+def get_read_pool():
+    """The read-only pool (DB_POOL_SIZE connections), used by read_connection()"""
+    global _read_pool
+    if _read_pool is None:
+        with _pool_lock:
+            if _read_pool is None:
+                _read_pool = ConnectionPool(DB_NAME, size=DB_POOL_SIZE, pragmas=SQLITE_READ_PRAGMAS, readonly=True)
+    return _read_pool
+
+
+def reset_pool():
+    """Close idle pooled connections so the next caller opens fresh ones (e.g. after DB_NAME changes)"""
+    global _pool, _read_pool
+    with _pool_lock:
+        for pool in (_pool, _read_pool):
+            if pool is not None:
+                pool.close()
+        _pool = None
+        _read_pool = None
+    _close_catalog_version_conx()
+
+
+def pool_stats():
+    return {
+        'write': get_pool().stats(),
+        'read': get_read_pool().stats(),
+    }
+
+
+@contextmanager
+def connection():
+    """Yields the writer bound to the current thread, checking it out of the pool if needed.
+    Use it for anything that writes; pure reads go through read_connection().
+
+    Nested calls (e.g. add_token -> get_member_by_session) reuse the outer connection, and
+    only the outermost caller returns it to the pool, so other writers can have it as soon as
+    the unit of work is done.
+    """
+    conx = getattr(_scope, 'conx', None)
+    if conx is not None:
+        yield conx
+        return
+
+    pool = get_pool()
+    conx = pool.acquire()
+    _scope.conx = conx
+    try:
+        yield conx
+    finally:
+        _scope.conx = None
+        pool.release(conx)
+
+
+@contextmanager
+def read_connection():
+    """Yields a connection for reads. Inside connection()/transaction() that is the writer, so
+    reads see the unit's own uncommitted writes; otherwise a read-only connection, which never
+    waits on the writer.
+    """
+    conx = getattr(_scope, 'conx', None) or getattr(_scope, 'read_conx', None)
+    if conx is not None:
+        yield conx
+        return
+
+    pool = get_read_pool()
+    conx = pool.acquire()
+    _scope.read_conx = conx
+    try:
+        yield conx
+    finally:
+        if not getattr(_scope, 'request_scoped', False):
+            _scope.read_conx = None
+            pool.release(conx)
+
+
+@contextmanager
+def read_transaction():
+    """Runs the block's reads against one snapshot of the database (BEGIN ... COMMIT on a reader)"""
+    with read_connection() as conx:
+        if in_transaction() or conx.in_transaction:  # Already inside a unit of work or snapshot
+            yield conx
+            return
+        conx.execute("BEGIN")
+        try:
+            yield conx
+        finally:
+            conx.commit()
+
+
+def open_request_connection():
+    """Keep the first read-only connection a request checks out until the request ends, so every
+    read in it shares one. The writer is still only held for each unit of work."""
+    _scope.request_scoped = True
+
+
+def close_request_connection():
+    _scope.request_scoped = False
+    _scope.tx_depth = 0
+    conx = getattr(_scope, 'read_conx', None)
+    if conx is not None:
+        _scope.read_conx = None
+        get_read_pool().release(conx)
+
+
+def in_transaction():
+    return getattr(_scope, 'tx_depth', 0) > 0
+
+
+@contextmanager
+def transaction(immediate=True):
+    """Runs every db call in the block as one unit of work: a single BEGIN ... COMMIT, rolled back
+    as a whole if the block raises. update_db does not commit while a transaction is open.
+
+    Nested transactions (e.g. add_token inside an api_join transaction) become savepoints, so an
+    inner failure that the caller handles only undoes the inner work.
+    Args:
+        immediate (bool): Take the write lock at BEGIN rather than at the first write, so a
+            read-then-write unit cannot fail with SQLITE_BUSY halfway through
+    """
+    with connection() as conx:
+        depth = getattr(_scope, 'tx_depth', 0)
+        savepoint = "unit_{}".format(depth)
+        if depth == 0:
+            if conx.in_transaction:  # Implicit transaction left by a read outside any unit
+                conx.commit()
+            conx.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            _scope.after_commit = []
+        else:
+            conx.execute("SAVEPOINT {}".format(savepoint))
+        callbacks_before = len(_scope.after_commit)
+        _scope.tx_depth = depth + 1
+        try:
+            yield conx
+        except BaseException:
+            _scope.tx_depth = depth
+            del _scope.after_commit[callbacks_before:]
+            if depth == 0:
+                conx.rollback()
+            else:
+                conx.execute("ROLLBACK TO {}".format(savepoint))
+                conx.execute("RELEASE {}".format(savepoint))
+            raise
+
+        _scope.tx_depth = depth
+        if depth > 0:
+            conx.execute("RELEASE {}".format(savepoint))
+            return
+        started = time.perf_counter()
+        conx.commit()
+        metrics.record_commit(time.perf_counter() - started)
+        callbacks, _scope.after_commit = _scope.after_commit, []
+        for callback in callbacks:
+            callback()
+
+
+def after_commit(callback):
+    """Calls `callback` once the current unit of work commits (now, if none is open).
+    Used for in-process caches, which must not change for work that may yet roll back."""
+    if in_transaction():
+        _scope.after_commit.append(callback)
+    else:
+        callback()
+
+
+def unit_of_work(func):
+    """Decorator running `func` in one transaction, e.g. a view that makes several writes"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with transaction():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class GroupCommitWriter:
+    """One thread applying queued writes in group commits.
+
+    Each submitted job (a list of statements, applied atomically) gets a Future. The thread takes
+    the first waiting job, gathers more for up to `window_secs` or until it has `max_writes`, and
+    applies them all in one transaction with a savepoint per job, so a failing job only fails its
+    own Future. Futures are resolved once the transaction commits, so result() means durable.
+    """
+    def __init__(self, max_writes=GROUP_COMMIT_MAX_WRITES, window_secs=GROUP_COMMIT_WINDOW_SECS):
+        self.max_writes = max_writes
+        self.window_secs = window_secs
+        self._queue = Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.jobs = 0
+        self.commits = 0
+        self.failed = 0
+        self.max_group = 0
+
+    def submit(self, statements):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+                self._thread.start()
+        future = Future()
+        self._queue.put((statements, future))
+        return future
+
+    def is_writer_thread(self):
+        return threading.current_thread() is self._thread
+
+    def _next_group(self):
+        """Blocks for the first job, then gathers more until the window closes. None means stop."""
+        job = self._queue.get()
+        if job is None:
+            return None
+        group = [job]
+        deadline = time.perf_counter() + self.window_secs
+        while len(group) < self.max_writes:
+            try:
+                job = self._queue.get(timeout=max(0, deadline - time.perf_counter()))
+            except Empty:
+                break
+            if job is None:  # Stop after this group
+                self._queue.put(None)
+                break
+            group.append(job)
+        return group
+
+    def _run(self):
+        while True:
+            group = self._next_group()
+            if group is None:
+                return
+            self._commit(group)
+
+    def _commit(self, group):
+        results = []
+        try:
+            with transaction() as conx:
+                for statements, future in group:
+                    try:
+                        with transaction():  # A savepoint, so a failing job leaves the others intact
+                            results.append([update_db(conx, qry, args) for qry, args in statements])
+                    except Exception as e:
+                        results.append(e)
+        except Exception as e:
+            logger.exception("Group commit of %s writes failed", len(group))
+            results = [e] * len(group)
+
+        with self._lock:
+            self.jobs += len(group)
+            self.commits += 1
+            self.failed += sum(1 for result in results if isinstance(result, Exception))
+            self.max_group = max(self.max_group, len(group))
+        for (statements, future), result in zip(group, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stop(self, timeout=None):
+        """Applies every job already queued, then stops the thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': WRITE_BEHIND,
+                'queued': self._queue.qsize(),
+                'jobs': self.jobs,
+                'commits': self.commits,
+                'failed': self.failed,
+                'maxGroup': self.max_group,
+                'avgGroup': round(self.jobs / self.commits, 2) if self.commits else 0.0,
+            }
+
+
+group_commit_writer = GroupCommitWriter()
+
+
+def submit_writes(statements):
+    """Applies [(qry, args), ...] atomically. Returns a Future of their update_db results
+    (last row ids); call result() to wait until they are committed.
+
+    With WRITE_BEHIND the writes are queued to group_commit_writer. Otherwise, and when the
+    caller already holds the writer (inside connection()/transaction(), where waiting on the
+    writer thread would deadlock and the writes belong to the caller's unit of work), they run
+    here and now, and errors raise immediately.
+    """
+    if WRITE_BEHIND and getattr(_scope, 'conx', None) is None and not group_commit_writer.is_writer_thread():
+        return group_commit_writer.submit(statements)
+
+    future = Future()
+    with transaction() as conx:
+        future.set_result([update_db(conx, qry, args) for qry, args in statements])
+    return future
+
+
+def _log_write_failure(future):
+    """Done-callback for submit_writes Futures nobody waits on, whose errors would otherwise vanish"""
+    error = future.exception()
+    if error is not None:
+        logger.error("Write-behind write failed", exc_info=error)
+
+
+def stop_write_queue():
+    group_commit_writer.stop()
+
+
+_catalog_version = 0
+_catalog_version_read_at = None  # perf_counter() of the last read; None forces the next call to read
+_catalog_version_conx = None  # Own read-only connection, so a poll never waits on the pool
+_catalog_version_lock = threading.Lock()
+
+
+def catalog_version():
+    """Changes whenever a commit changes what a search can return (see search_cache.py).
+
+    The version is the catalog_version row, bumped by triggers on resource, author and stock, so
+    writes from any process count. It is re-read after every catalog commit made here, and
+    otherwise once CATALOG_VERSION_POLL_SECS have passed (by default on every call), which bounds
+    how long a commit made by another process can go unseen.
+    """
+    global _catalog_version, _catalog_version_read_at, _catalog_version_conx
+    read_at = _catalog_version_read_at
+    if read_at is not None and time.perf_counter() - read_at < CATALOG_VERSION_POLL_SECS:
+        return _catalog_version
+    with _catalog_version_lock:
+        if _catalog_version_conx is None:
+            _catalog_version_conx = get_sqlite3_conx(DB_NAME, SQLITE_READ_PRAGMAS, readonly=True)
+        read_at = time.perf_counter()
+        _catalog_version = _catalog_version_conx.execute(CATALOG_VERSION_SQL).fetchall()[0][0]
+        _catalog_version_read_at = read_at
+        return _catalog_version
+
+
+def _expire_catalog_version():
+    global _catalog_version_read_at
+    _catalog_version_read_at = None
+
+
+def _close_catalog_version_conx():
+    global _catalog_version_conx
+    with _catalog_version_lock:
+        if _catalog_version_conx is not None:
+            _catalog_version_conx.close()
+            _catalog_version_conx = None
+    _expire_catalog_version()
+
+
+def bump_catalog_version():
+    """The triggers already bumped the stored version; re-read it once this commit lands"""
+    after_commit(_expire_catalog_version)
+
+
+_catalog_listeners = []
+
+
+def add_catalog_listener(callback):
+    """Registers callback(kind, value), called after commit for every inserted title
+    (kind 'title', value the title) and author (kind 'author', value (first, middle, last))"""
+    if callback not in _catalog_listeners:
+        _catalog_listeners.append(callback)
+
+
+def _catalog_inserted(kind, values):
+    if not _catalog_listeners:
+        return
+
+    def notify():
+        for value in values:
+            for callback in _catalog_listeners:
+                callback(kind, value)
+    after_commit(notify)
+
+
+def _record_statement(qry, args, duration, rows):
+    metrics.record_statement(qry, duration, rows)
+    profiling.check_slow_query(qry, args, duration)
+
+
 def query_result(cxn, qry, args=None, single_row=False, all_fields=True, empty_results=False):
     """Executes a READ-only query against the database (does not COMMIT changes).
     Args:
@@ -85,11 +797,13 @@ def query_result(cxn, qry, args=None, single_row=False, all_fields=True, empty_r
     """
     args = args or []
     curs = cxn.cursor()
+    started = time.perf_counter()
     curs.execute(qry, args)
     if single_row:
         result = curs.fetchone()
     else:
         result = curs.fetchall()
+    _record_statement(qry, args, time.perf_counter() - started, (1 if result else 0) if single_row else len(result))
     if not result and not empty_results:
         raise Exception("Query results were empty, but empty results are not allowed")
     if not result:
@@ -98,7 +812,7 @@ def query_result(cxn, qry, args=None, single_row=False, all_fields=True, empty_r
         return result if all_fields else result[0]
 
 def update_db(cxn, qry, args=None):
-    """Executes a WRITE query against the database, including a COMMIT.
+    """Executes a WRITE query against the database, including a COMMIT unless a transaction() is open.
     Args:
         cxn (DB-API 2.0 compliant DB connection)
         qry (str): Valid SQL query
@@ -110,17 +824,239 @@ def update_db(cxn, qry, args=None):
     args = args or []
     curs = cxn.cursor()
     try:
+        started = time.perf_counter()
         curs.execute(qry, args)
-        cxn.commit()
+        executed = time.perf_counter()
+        _record_statement(qry, args, executed - started, max(curs.rowcount, 0))
+        if not in_transaction():  # Otherwise the enclosing unit of work commits once at the end
+            cxn.commit()
+            metrics.record_commit(time.perf_counter() - executed)
         return curs.lastrowid
     except Exception as e:
         raise Exception('Update was unsuccessful') from e
 
 
 def prepare_db():
-    conx = get_sqlite3_conx(DB_NAME)
-    create_db_tables(conx)
-    # clear_db_data(conx)
+    with connection() as conx:
+        create_db_tables(conx)
+        migrate_db(conx)
+        # clear_db_data(conx)
+
+
+GET_STOCK_SQL = "SELECT stock.id, stock.active, stock.on_loan, resource.title FROM stock LEFT JOIN resource ON resource.id = stock.resource_id WHERE stock.id=?"
+# A copy counts towards `total` while active, and towards `available` while active and not on loan
+AVAILABILITY_ADD_SQL = """INSERT INTO resource_availability(resource_id, total, available)
+                VALUES({row}.resource_id, {row}.active = 1, {row}.active = 1 AND coalesce({row}.on_loan, 0) = 0)
+                ON CONFLICT(resource_id) DO UPDATE SET total = total + excluded.total, available = available + excluded.available;"""
+AVAILABILITY_REMOVE_SQL = """UPDATE resource_availability
+                SET total = total - ({row}.active = 1), available = available - ({row}.active = 1 AND coalesce({row}.on_loan, 0) = 0)
+                WHERE resource_id = {row}.resource_id;"""
+REBUILD_AVAILABILITY_SQL = """INSERT INTO resource_availability(resource_id, total, available)
+    SELECT resource_id, SUM(active = 1), SUM(active = 1 AND coalesce(on_loan, 0) = 0) FROM stock GROUP BY resource_id"""
+CATALOG_VERSION_BUMP_SQL = "UPDATE catalog_version SET version = version + 1 WHERE id = 1;"
+CATALOG_VERSION_SQL = "SELECT version FROM catalog_version WHERE id = 1"
+AUTHOR_FULL_NAME_SQL = "trim(replace(coalesce(author.first_name, '') || ' ' || coalesce(author.middle_name, '') || ' ' || coalesce(author.last_name, ''), '  ', ' '))"
+
+# Ordered schema migrations as (version, description, statements). Never edit or reorder a
+# migration once it has shipped; append a new one instead so existing library.db files roll forward.
+MIGRATIONS = [
+    (
+        1,
+        "Indexes on hot lookup columns",
+        [
+            "CREATE INDEX IF NOT EXISTS idx_member_email ON member(email)",
+            "CREATE INDEX IF NOT EXISTS idx_token_session_active ON token(session_id, active)",
+            "CREATE INDEX IF NOT EXISTS idx_session_member ON session(member_id)",
+            "CREATE INDEX IF NOT EXISTS idx_resource_isbn_10 ON resource(isbn_10)",
+            "CREATE INDEX IF NOT EXISTS idx_resource_isbn_13 ON resource(isbn_13)",
+            "CREATE INDEX IF NOT EXISTS idx_resource_author ON resource(author_id)",
+            "CREATE INDEX IF NOT EXISTS idx_stock_resource ON stock(resource_id)",
+            "CREATE INDEX IF NOT EXISTS idx_author_name ON author(last_name, first_name, middle_name)",
+            "CREATE INDEX IF NOT EXISTS idx_borrow_member_stock_closed ON borrow(member_id, stock_id, closed)",
+        ]
+    ),
+    (
+        2,
+        "FTS5 catalog search over titles and author names",
+        [
+            "CREATE VIRTUAL TABLE IF NOT EXISTS resource_fts USING fts5(title, author, tokenize='unicode61 remove_diacritics 2')",
+            "CREATE VIRTUAL TABLE IF NOT EXISTS author_fts USING fts5(first_name, middle_name, last_name, tokenize='unicode61 remove_diacritics 2')",
+            # Triggers keep the indexes in sync with add_resource/add_author and any other writer
+            f"""CREATE TRIGGER IF NOT EXISTS resource_fts_insert AFTER INSERT ON resource BEGIN
+                INSERT INTO resource_fts(rowid, title, author)
+                SELECT new.id, new.title, {AUTHOR_FULL_NAME_SQL} FROM author WHERE author.id = new.author_id;
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS resource_fts_update AFTER UPDATE OF title, author_id ON resource BEGIN
+                DELETE FROM resource_fts WHERE rowid = old.id;
+                INSERT INTO resource_fts(rowid, title, author)
+                SELECT new.id, new.title, {AUTHOR_FULL_NAME_SQL} FROM author WHERE author.id = new.author_id;
+            END""",
+            """CREATE TRIGGER IF NOT EXISTS resource_fts_delete AFTER DELETE ON resource BEGIN
+                DELETE FROM resource_fts WHERE rowid = old.id;
+            END""",
+            """CREATE TRIGGER IF NOT EXISTS author_fts_insert AFTER INSERT ON author BEGIN
+                INSERT INTO author_fts(rowid, first_name, middle_name, last_name)
+                VALUES(new.id, new.first_name, new.middle_name, new.last_name);
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS author_fts_update AFTER UPDATE OF first_name, middle_name, last_name ON author BEGIN
+                DELETE FROM author_fts WHERE rowid = old.id;
+                INSERT INTO author_fts(rowid, first_name, middle_name, last_name)
+                VALUES(new.id, new.first_name, new.middle_name, new.last_name);
+                UPDATE resource_fts SET author = {AUTHOR_FULL_NAME_SQL.replace('author.', 'new.')}
+                WHERE rowid IN (SELECT id FROM resource WHERE author_id = new.id);
+            END""",
+            """CREATE TRIGGER IF NOT EXISTS author_fts_delete AFTER DELETE ON author BEGIN
+                DELETE FROM author_fts WHERE rowid = old.id;
+            END""",
+            # Backfill rows that existed before this migration
+            f"""INSERT INTO resource_fts(rowid, title, author)
+                SELECT resource.id, resource.title, {AUTHOR_FULL_NAME_SQL}
+                FROM resource JOIN author ON author.id = resource.author_id""",
+            """INSERT INTO author_fts(rowid, first_name, middle_name, last_name)
+                SELECT id, first_name, middle_name, last_name FROM author""",
+        ]
+    ),
+    (
+        3,
+        "On-loan flag per stock item and maintained member borrow counters",
+        [
+            "ALTER TABLE stock ADD COLUMN on_loan INTEGER DEFAULT 0",
+            "UPDATE stock SET on_loan=1 WHERE id IN (SELECT stock_id FROM borrow WHERE closed=0)",
+            """UPDATE member SET
+                checked_out = (SELECT COUNT(*) FROM borrow WHERE borrow.member_id = member.id AND closed=0),
+                total_borrowed = (SELECT COUNT(*) FROM borrow WHERE borrow.member_id = member.id)""",
+            # At most one open borrow per copy, whatever path the borrow was written by
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_borrow_open_stock ON borrow(stock_id) WHERE closed=0",
+        ]
+    ),
+    (
+        4,
+        "Per-resource copy and availability counts",
+        [
+            "CREATE TABLE IF NOT EXISTS resource_availability(resource_id INTEGER PRIMARY KEY, total INTEGER NOT NULL DEFAULT 0, available INTEGER NOT NULL DEFAULT 0)",
+            # Triggers keep the counts in step with add_stock, checkout/check-in and bulk ingest
+            f"""CREATE TRIGGER IF NOT EXISTS resource_availability_insert AFTER INSERT ON stock BEGIN
+                {AVAILABILITY_ADD_SQL.format(row='new')}
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS resource_availability_update AFTER UPDATE OF resource_id, active, on_loan ON stock BEGIN
+                {AVAILABILITY_REMOVE_SQL.format(row='old')}
+                {AVAILABILITY_ADD_SQL.format(row='new')}
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS resource_availability_delete AFTER DELETE ON stock BEGIN
+                {AVAILABILITY_REMOVE_SQL.format(row='old')}
+            END""",
+            REBUILD_AVAILABILITY_SQL,
+        ]
+    ),
+    (
+        5,
+        "Indexes for the session/token sweeper",
+        [
+            "CREATE INDEX IF NOT EXISTS idx_token_active_created ON token(active, time_created)",
+            # Also serves member_id lookups, replacing idx_session_member
+            "CREATE INDEX IF NOT EXISTS idx_session_member_created ON session(member_id, created)",
+            "DROP INDEX IF EXISTS idx_session_member",
+        ]
+    ),
+    (
+        6,
+        "Active flag on resources, read by deactivate_resource and search",
+        [
+            "ALTER TABLE resource ADD COLUMN active INTEGER DEFAULT 1",
+        ]
+    ),
+    (
+        7,
+        "Single normalized ISBN-13 key per resource",
+        [
+            "ALTER TABLE resource ADD COLUMN isbn TEXT",
+            "UPDATE resource SET isbn = coalesce(normalize_isbn(isbn_13), normalize_isbn(isbn_10))",
+            # Before this key the same book could be entered twice, once per ISBN form; the oldest
+            # row keeps the key, so lookups and new stock resolve to it
+            """UPDATE resource SET isbn = NULL WHERE isbn IS NOT NULL
+                AND id NOT IN (SELECT MIN(id) FROM resource WHERE isbn IS NOT NULL GROUP BY isbn)""",
+            """UPDATE resource SET isbn_13 = isbn, isbn_10 = isbn13_to_isbn10(isbn)
+                WHERE isbn IS NOT NULL AND (isbn_13 IS NOT isbn OR isbn_10 IS NOT isbn13_to_isbn10(isbn))""",
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_resource_isbn ON resource(isbn)",
+            "DROP INDEX IF EXISTS idx_resource_isbn_10",
+            "DROP INDEX IF EXISTS idx_resource_isbn_13",
+        ]
+    ),
+    (
+        8,
+        "Catalog version counter shared by every process writing the database",
+        [
+            "CREATE TABLE IF NOT EXISTS catalog_version(id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)",
+            "INSERT OR IGNORE INTO catalog_version(id, version) VALUES(1, 0)",
+            # Triggers, so the CLI loader, the sweeper and other workers bump it too
+        ] + [
+            f"""CREATE TRIGGER IF NOT EXISTS catalog_version_{table}_{event.split()[0].lower()} AFTER {event} ON {table} BEGIN
+                {CATALOG_VERSION_BUMP_SQL}
+            END"""
+            for table in ('resource', 'author', 'stock')
+            for event in ('INSERT', 'UPDATE', 'DELETE')
+        ]
+    ),
+]
+
+
+def get_schema_version(conx):
+    conx.execute(
+        "CREATE TABLE IF NOT EXISTS schema_version(version INTEGER PRIMARY KEY, description TEXT, applied TEXT DEFAULT CURRENT_TIMESTAMP)"
+    )
+    version = query_result(
+        conx,
+        "SELECT MAX(version) FROM schema_version",
+        single_row=True,
+        all_fields=False,
+        empty_results=True
+    )
+    return version or 0
+
+
+def migrate_db(conx, migrations=None):
+    """Applies every migration newer than the recorded schema version, each in its own transaction.
+    Returns:
+        applied (list): Versions applied by this call
+    """
+    migrations = sorted(migrations or MIGRATIONS, key=lambda m: m[0])
+    current_version = get_schema_version(conx)
+    applied = []
+
+    for version, description, statements in migrations:
+        if version <= current_version:
+            continue
+        cursor = conx.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            # Another process starting on the same file may have applied it while we waited for
+            # the write lock, so re-read the version now that we hold it
+            current_version = get_schema_version(conx)
+            if version <= current_version:
+                conx.rollback()
+                continue
+            for statement in statements:
+                cursor.execute(statement)
+            cursor.execute(
+                "INSERT INTO schema_version(version, description) VALUES(?, ?)",
+                [version, description]
+            )
+            conx.commit()
+        except Exception as e:
+            conx.rollback()
+            raise Exception("Migration {} '{}' failed".format(version, description)) from e
+        applied.append(version)
+
+    return applied
+
+
+def rebuild_resource_availability():
+    """Recomputes resource_availability from the stock table, e.g. after stock was edited with
+    the triggers dropped. Runs in one transaction, so searches never see partial counts."""
+    with transaction() as conx:
+        update_db(conx, "DELETE FROM resource_availability")
+        update_db(conx, REBUILD_AVAILABILITY_SQL)
+        bump_catalog_version()
 
 
 def clear_db_data(conx):
@@ -144,58 +1080,366 @@ def create_db_tables(conx):
     cursor.execute("CREATE TABLE IF NOT EXISTS session(id TEXT PRIMARY KEY, member_id INTEGER, ip_address TEXT, user_agent TEXT, created TEXT DEFAULT CURRENT_TIMESTAMP)")
     cursor.execute("CREATE TABLE IF NOT EXISTS author(id INTEGER PRIMARY KEY AUTOINCREMENT, first_name TEXT, middle_name TEXT, last_name TEXT)")  # How do we handle authors with the same name?
 
+class SessionStore:
+    """Where sessions and tokens are kept. The session functions below (create_new_session,
+    add_token, token_is_valid, ...) delegate to the store returned by get_session_store().
+    """
+    cache_tokens = True  # Put token_cache in front of get_token
+
+    def unit(self):
+        """Context for a group of session writes that should commit together"""
+        raise NotImplementedError
+
+    def create_session(self, session_id):
+        raise NotImplementedError
+
+    def associate_session(self, session_id, member_id, ip_address, user_agent):
+        raise NotImplementedError
+
+    def get_session_member(self, session_id):
+        raise NotImplementedError
+
+    def add_token(self, token, session_id):
+        raise NotImplementedError
+
+    def get_token(self, token):
+        """(time_created, member_id) of an active token, or None"""
+        raise NotImplementedError
+
+    def latest_token_created(self, session_id):
+        """time_created of the session's newest active token, or None"""
+        raise NotImplementedError
+
+    def deactivate_member_tokens(self, member_id):
+        raise NotImplementedError
+
+    def purge_expired(self, batch_size, session_retention_secs):
+        """Deletes up to `batch_size` each of dead tokens and anonymous sessions older than
+        `session_retention_secs`. Returns rows deleted per kind, e.g. {'tokens': 10, 'sessions': 0}"""
+        raise NotImplementedError
+
+    def stats(self):
+        return {'store': type(self).__name__}
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions and tokens in the session/token tables of the library database.
+
+    With WRITE_BEHIND, writes go through the group commit writer instead of a transaction per
+    unit: a new anonymous session is not waited for (requests using it queue behind it), and
+    every other write is waited for, so the next read sees it.
+    """
+    def unit(self):
+        return nullcontext() if WRITE_BEHIND else transaction()
+
+    def create_session(self, session_id):
+        # Not waited for (see WRITE_BEHIND), so a failure is logged rather than raised
+        submit_writes([("INSERT INTO session(id) VALUES(?)", [session_id])]).add_done_callback(_log_write_failure)
+
+    def associate_session(self, session_id, member_id, ip_address, user_agent):
+        submit_writes([(
+            "UPDATE session SET member_id=?, ip_address=?, user_agent=? WHERE id=?",
+            [member_id, ip_address, user_agent, session_id]
+        )]).result()
+
+    def get_session_member(self, session_id):
+        with read_connection() as conx:
+            return query_result(
+                conx,
+                "SELECT member_id FROM session WHERE id=?",
+                [session_id],
+                single_row=True,
+                all_fields=False,
+                empty_results=True
+            )
+
+    def add_token(self, token, session_id):
+        submit_writes([("INSERT INTO token(id, session_id) VALUES(?, ?)", [token, session_id])]).result()
+
+    def get_token(self, token):
+        with read_connection() as conx:
+            token_data = query_result(
+                conx,
+                # token.session_id was declared INTEGER; the CAST keeps the comparison TEXT so session's key index is used
+                "SELECT token.time_created, session.member_id FROM token LEFT JOIN session ON session.id = CAST(token.session_id AS TEXT) WHERE token.id=? AND token.active=1",
+                [token],
+                single_row=True,
+                all_fields=True,
+                empty_results=True
+            )
+        if not token_data:
+            return None
+        time_created, member_id = token_data
+        return datetime.strptime(time_created, "%Y-%m-%d %X"), member_id
+
+    def latest_token_created(self, session_id):
+        with read_connection() as conx:
+            time_created = query_result(
+                conx,
+                "SELECT MAX(time_created) FROM token WHERE session_id=? AND active=1",
+                [session_id],
+                single_row=True,
+                all_fields=False,
+                empty_results=True
+            )
+        return datetime.strptime(time_created, "%Y-%m-%d %X") if time_created else None
+
+    def deactivate_member_tokens(self, member_id):
+        submit_writes([(
+            "UPDATE token set active=0 WHERE active=1 AND session_id in (SELECT id from session WHERE member_id=?)",
+            [member_id]
+        )]).result()
+
+
+    def purge_expired(self, batch_size, session_retention_secs):
+        token_age = "-{} seconds".format(TOKEN_TTL_SECS)
+        session_age = "-{} seconds".format(int(session_retention_secs))
+        reclaimed = {'tokens': 0, 'sessions': 0}
+        # Timestamps are stored by CURRENT_TIMESTAMP, so cutoffs are computed in SQLite's clock too
+        with transaction() as conx:
+            for kind, qry, args in (
+                ('tokens', "DELETE FROM token WHERE id IN (SELECT id FROM token WHERE active=0 LIMIT ?)", [batch_size]),
+                (
+                    'tokens',
+                    "DELETE FROM token WHERE id IN (SELECT id FROM token WHERE active=1 AND time_created < datetime('now', ?) LIMIT ?)",
+                    [token_age, batch_size]
+                ),
+                (
+                    'sessions',
+                    "DELETE FROM session WHERE id IN (SELECT id FROM session WHERE member_id IS NULL AND created < datetime('now', ?) LIMIT ?)",
+                    [session_age, batch_size]
+                ),
+            ):
+                changes_before = conx.total_changes
+                update_db(conx, qry, args)
+                reclaimed[kind] += conx.total_changes - changes_before
+        return reclaimed
+
+
+class TimerWheel:
+    """Expires keys after a delay of at most `span_secs`, at `tick_secs` resolution.
+
+    Keys are bucketed into a ring of slots by the tick they expire on. Scheduling and cancelling
+    are O(1), and advance() only visits the slots for ticks that have passed since the last call.
+    """
+    def __init__(self, span_secs, tick_secs=TIMER_WHEEL_TICK_SECS, clock=time.monotonic):
+        self.tick_secs = tick_secs
+        self.clock = clock
+        self._slots = [set() for i in range(int(math.ceil(span_secs / tick_secs)) + 2)]
+        self._slot_of = {}  # key -> slot index
+        self._tick = int(clock() / tick_secs)
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    def schedule(self, key, delay_secs):
+        ticks = min(max(1, int(math.ceil(delay_secs / self.tick_secs))), len(self._slots) - 1)
+        self.cancel(key)
+        slot = (self._tick + ticks) % len(self._slots)
+        self._slots[slot].add(key)
+        self._slot_of[key] = slot
+
+    def cancel(self, key):
+        slot = self._slot_of.pop(key, None)
+        if slot is not None:
+            self._slots[slot].discard(key)
+
+    def advance(self):
+        """Returns the keys whose expiry tick has passed, removing them from the wheel"""
+        now_tick = int(self.clock() / self.tick_secs)
+        expired = []
+        for tick in range(self._tick + 1, min(now_tick, self._tick + len(self._slots)) + 1):
+            slot = self._slots[tick % len(self._slots)]
+            for key in slot:
+                del self._slot_of[key]
+            expired.extend(slot)
+            slot.clear()
+        self._tick = max(self._tick, now_tick)
+        return expired
+
+
+class MemorySessionStore(SessionStore):
+    """Sessions and tokens in process memory, so login and auth never touch the database.
+
+    Indexed session -> member, member -> sessions and token -> session. Tokens are dropped by a
+    TimerWheel once TOKEN_TTL_SECS pass. Everything is per process and lost on restart (members
+    simply log in again), so run one server process or keep the SQLite store.
+    """
+    cache_tokens = False  # Lookups are already dict reads
+
+    def __init__(self, token_ttl_secs=TOKEN_TTL_SECS):
+        self.token_ttl_secs = token_ttl_secs
+        self._lock = threading.Lock()
+        self._sessions = {}  # session_id -> {'member_id', 'ip_address', 'user_agent', 'created'}
+        self._member_sessions = {}  # member_id -> set of session ids
+        self._tokens = {}  # token -> (session_id, time_created)
+        self._session_tokens = {}  # session_id -> set of tokens
+        self._anonymous = OrderedDict()  # session_id -> created, oldest first, for sessions with no member
+        self._wheel = TimerWheel(token_ttl_secs)
+
+    def unit(self):
+        return nullcontext()
+
+    def _expire_tokens(self):
+        expired = self._wheel.advance()
+        for token in expired:
+            self._remove_token(token)
+        return len(expired)
+
+    def _remove_token(self, token):
+        session_id, time_created = self._tokens.pop(token)
+        session_tokens = self._session_tokens.get(session_id)
+        if session_tokens is not None:
+            session_tokens.discard(token)
+            if not session_tokens:
+                del self._session_tokens[session_id]
+
+    def create_session(self, session_id):
+        created = utc_now()
+        with self._lock:
+            self._sessions[session_id] = {'member_id': None, 'ip_address': None, 'user_agent': None, 'created': created}
+            self._anonymous[session_id] = created
+
+    def associate_session(self, session_id, member_id, ip_address, user_agent):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:  # Same as an UPDATE matching no row
+                return
+            if session['member_id'] is not None:
+                self._member_sessions.get(session['member_id'], set()).discard(session_id)
+            session.update(member_id=member_id, ip_address=ip_address, user_agent=user_agent)
+            self._anonymous.pop(session_id, None)
+            self._member_sessions.setdefault(member_id, set()).add(session_id)
+
+    def get_session_member(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return session['member_id'] if session else None
+
+    def add_token(self, token, session_id):
+        with self._lock:
+            self._expire_tokens()
+            self._tokens[token] = (session_id, utc_now())
+            self._session_tokens.setdefault(session_id, set()).add(token)
+            self._wheel.schedule(token, self.token_ttl_secs)
+
+    def get_token(self, token):
+        with self._lock:
+            self._expire_tokens()
+            token_data = self._tokens.get(token)
+            if token_data is None:
+                return None
+            session_id, time_created = token_data
+            session = self._sessions.get(session_id)
+            return time_created, session['member_id'] if session else None
+
+    def latest_token_created(self, session_id):
+        with self._lock:
+            self._expire_tokens()
+            return max((self._tokens[token][1] for token in self._session_tokens.get(session_id, ())), default=None)
+
+    def deactivate_member_tokens(self, member_id):
+        with self._lock:
+            for session_id in self._member_sessions.get(member_id, ()):
+                for token in self._session_tokens.pop(session_id, set()):
+                    self._tokens.pop(token, None)
+                    self._wheel.cancel(token)
+
+    def purge_expired(self, batch_size, session_retention_secs):
+        cutoff = utc_now() - timedelta(seconds=session_retention_secs)
+        with self._lock:
+            tokens = self._expire_tokens()  # Deactivated tokens were already dropped
+            sessions = 0
+            while self._anonymous and sessions < batch_size:
+                session_id, created = next(iter(self._anonymous.items()))
+                if created >= cutoff:
+                    break
+                del self._anonymous[session_id]
+                del self._sessions[session_id]
+                sessions += 1
+        return {'tokens': tokens, 'sessions': sessions}
+
+    def stats(self):
+        with self._lock:
+            return {
+                'store': type(self).__name__,
+                'sessions': len(self._sessions),
+                'members': len(self._member_sessions),
+                'tokens': len(self._tokens),
+                'scheduled': len(self._wheel),
+            }
+
+
+SESSION_STORES = {'sqlite': SQLiteSessionStore, 'memory': MemorySessionStore}
+_session_store = None
+_session_store_lock = threading.Lock()
+
+
+def get_session_store():
+    global _session_store
+    if _session_store is None:
+        with _session_store_lock:
+            if _session_store is None:
+                _session_store = SESSION_STORES[SESSION_STORE]()
+    return _session_store
+
+
+def set_session_store(store):
+    """Replaces the session store (e.g. MemorySessionStore()), dropping any cached tokens"""
+    global _session_store
+    with _session_store_lock:
+        _session_store = store
+    token_cache.clear()
+
+
+def session_unit_of_work(func):
+    """Like unit_of_work, for views whose only writes are session and token writes. With the
+    memory store, or the SQLite store under WRITE_BEHIND, these need no database transaction,
+    so the view never takes the write lock itself."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with get_session_store().unit():
+            return func(*args, **kwargs)
+    return wrapper
+
+
 def token_is_valid(token):
-    conx = get_sqlite3_conx(DB_NAME)
-    time_created = query_result(
-        conx,
-        "SELECT time_created FROM token WHERE id=? AND active=1",
-        [token],
-        single_row=True,
-        all_fields=False,
-        empty_results=True
-    )
-    if not time_created:
-        print("No active tokens")
+    """Whether `token` is active and younger than TOKEN_TTL_SECS. Token times are UTC, as SQLite's
+    CURRENT_TIMESTAMP writes them, so expiry is compared against utc_now()."""
+    store = get_session_store()
+    if store.cache_tokens:
+        expires_at = token_cache.get(token)
+        if expires_at is not None:
+            return utc_now() <= expires_at
+        generation = token_cache.generation()  # Before the read, so a racing revocation wins
+
+    token_data = store.get_token(token)
+    if not token_data:
+        logger.debug("No active tokens")
         # There are no active tokens
         return False
+    time_created, member_id = token_data
 
     # Has the TTL expired?
-    token_created_dt = datetime.strptime(time_created, "%Y-%m-%d %X")
-    current_time = datetime.now()
-    secs_token_active = (current_time - token_created_dt).total_seconds()
-
-    if secs_token_active > TOKEN_TTL_SECS:
+    expires_at = time_created + timedelta(seconds=TOKEN_TTL_SECS)
+    if utc_now() > expires_at:
         return False
 
+    if store.cache_tokens:
+        token_cache.put(token, expires_at, member_id, generation)
     return True
 
 
 def sesson_is_valid(session_id):
-    conx = get_sqlite3_conx(DB_NAME)
-    token_data = query_result(
-        conx,
-        "SELECT time_created FROM token WHERE session_id=? AND active=1",
-        [session_id],
-        single_row=True,
-        all_fields=True,
-        empty_results=True
-    )
-    if not token_data:
-        print("No active tokens")
+    time_created = get_session_store().latest_token_created(session_id)
+    if time_created is None:
+        logger.debug("No active tokens")
         # There are no active tokens
         return False
 
-    time_created = token_data
-
     # Has the TTL expired?
-    token_created_dt = datetime.strptime(time_created, "%Y-%m-%d %X")
-    current_time = datetime.now()
-    secs_token_active = (current_time - token_created_dt).total_seconds()
-
-    if secs_token_active > TOKEN_TTL_SECS:
-        return False
-
-    return True
+    secs_token_active = (utc_now() - time_created).total_seconds()
+    return secs_token_active <= TOKEN_TTL_SECS
 
 
 def generate_new_token():
@@ -203,414 +1447,889 @@ def generate_new_token():
 
 
 def password_matches(email, password_provided):
-    conx = get_sqlite3_conx(DB_NAME)
-    password_db = query_result(
-        conx,
-        "SELECT password FROM member WHERE email=?",
-        [email],
-        single_row=True,
-        all_fields=False,
-        empty_results=True
-    )
-    return password_provided == password_db
+    with read_connection() as conx:
+        password_db = query_result(
+            conx,
+            "SELECT password FROM member WHERE email=?",
+            [email],
+            single_row=True,
+            all_fields=False,
+            empty_results=True
+        )
+        return password_provided == password_db
 
 
 def create_new_session():
     session_id = str(uuid4())
-    conx = get_sqlite3_conx(DB_NAME)
-    update_db(
-        conx,
-        "INSERT INTO session(id) VALUES(?)",
-        [session_id]
-    )
+    get_session_store().create_session(session_id)
     return session_id
 
 
 def associate_session_with_user(session_id, member_id, ip_address, user_agent):
-    conx = get_sqlite3_conx(DB_NAME)
-    update_db(
-        conx,
-        "UPDATE session SET member_id=?, ip_address=?, user_agent=? WHERE id=?",
-        [member_id, ip_address, user_agent, session_id]
-    )
+    get_session_store().associate_session(session_id, member_id, ip_address, user_agent)
     return None
 
 
 def get_member_by_email(email):
-    conx = get_sqlite3_conx(DB_NAME)
-    member = query_result(
-        conx,
-        "SELECT id FROM member WHERE email=?",
-        [email],
-        single_row=True,
-        all_fields=False,
-        empty_results=True
-    )
-    return member
+    with read_connection() as conx:
+        member = query_result(
+            conx,
+            "SELECT id FROM member WHERE email=?",
+            [email],
+            single_row=True,
+            all_fields=False,
+            empty_results=True
+        )
+        return member
 
 
 def get_member_by_session(session_id):
-    conx = get_sqlite3_conx(DB_NAME)
-    member = query_result(
-        conx,
-        "SELECT member_id FROM session WHERE id=?",
-        [session_id],
-        single_row=True,
-        all_fields=False,
-        empty_results=True
-    )
-    return member
-
+    return get_session_store().get_session_member(session_id)
 
-def add_new_member(email, password):
-    conx = get_sqlite3_conx(DB_NAME)
 
-    email = email.lower()
-    existing_member = get_member_by_email(email)
+def get_member_by_token(token):
+    """Member id owning an active `token`, from the token cache when require_auth just validated it"""
+    store = get_session_store()
+    if store.cache_tokens:
+        member_id = token_cache.member_of(token)
+        if member_id is not None:
+            return member_id
 
-    if existing_member:
-        raise InvalidEmailException("We cannot create a member with this email at this time")
+    token_data = store.get_token(token)
+    return token_data[1] if token_data else None
 
-    member_id = update_db(
-        conx,
-        "INSERT INTO member(email, password) VALUES(?, ?)",
-        [email, password]
-    )
-    return member_id
 
+def add_new_member(email, password):
+    with transaction() as conx:
+        email = email.lower()
+        existing_member = get_member_by_email(email)
 
-def deactivate_member(member_id):
-    conx = get_sqlite3_conx(DB_NAME)
+        if existing_member:
+            raise InvalidEmailException("We cannot create a member with this email at this time")
 
-    deactivate_tokens(member_id)
-    return update_db(conx, "UPDATE member SET active=0 WHERE id=?", [member_id])
+        member_id = update_db(
+            conx,
+            "INSERT INTO member(email, password) VALUES(?, ?)",
+            [email, password]
+        )
+        return member_id
 
 
-def get_authors_by_id(author_ids):
-    conx = get_sqlite3_conx(DB_NAME)
+def deactivate_member(member_id):
+    with transaction() as conx:
+        deactivate_tokens(member_id)
+        return update_db(conx, "UPDATE member SET active=0 WHERE id=?", [member_id])
 
-    author_map = {}
 
-    print("AUTHR IDS", author_ids)
+def get_authors_by_id(author_ids):
+    with read_connection() as conx:
+        author_map = {}
 
-    where_clause = f"id in ({', '.join(['?' for i in author_ids])})"
-    print(where_clause)
+        where_clause = f"id in ({', '.join(['?' for i in author_ids])})"
 
-    qry = f"SELECT * FROM author WHERE {where_clause}"
-    author_results = query_result(
-        conx,
-        qry,
-        author_ids,
-        single_row=False,
-        all_fields=True,
-        empty_results=True
-    )
+        qry = f"SELECT * FROM author WHERE {where_clause}"
+        author_results = query_result(
+            conx,
+            qry,
+            author_ids,
+            single_row=False,
+            all_fields=True,
+            empty_results=True
+        )
 
-    for result in author_results:
-        author = Author(result)
-        author_map[author.id] = author
+        for result in author_results:
+            author = Author(result)
+            author_map[author.id] = author
 
-    return author_map
+        return author_map
 
 def get_author_by_name(first=None, middle=None, last=None):
     if not first and not middle and not last:
         raise Exception("Must provide first, middle, or last name to retrieve author")
 
-    conx = get_sqlite3_conx(DB_NAME)
-
-    qry = "SELECT id FROM author WHERE first_name=? AND middle_name=? and last_name=?"
-    authors = query_result(
-        conx,
-        qry,
-        [first, middle, last],
-        single_row=False,
-        all_fields=True,
-        empty_results=True
-    )
+    with read_connection() as conx:
+        qry = "SELECT id FROM author WHERE first_name=? AND middle_name=? and last_name=?"
+        authors = query_result(
+            conx,
+            qry,
+            [first, middle, last],
+            single_row=False,
+            all_fields=True,
+            empty_results=True
+        )
 
-    authors_found_total = len(authors)
-    if authors_found_total > 1:
-        raise MultipleAuthorsMatchedException(
-    '       Found {} authors with name {} {} {}'.format(
-                authors_found_total,
-                first,
-                middle,
-                last
+        authors_found_total = len(authors)
+        if authors_found_total > 1:
+            raise MultipleAuthorsMatchedException(
+        '       Found {} authors with name {} {} {}'.format(
+                    authors_found_total,
+                    first,
+                    middle,
+                    last
+                )
             )
-        )
-    elif authors_found_total == 0:
-        return None
-    else:
-        return authors[0][0]
+        elif authors_found_total == 0:
+            return None
+        else:
+            return authors[0][0]
+
+
+def start_member_session(session_id, member_id, ip_address, user_agent):
+    """Associates the session with the member and issues a token, as on login or join. A session
+    that no longer exists (swept while anonymous, or lost when a MemorySessionStore restarted)
+    is replaced by a new one instead of failing.
+    Returns:
+        (session_id, token): session_id differs from the one given if it was replaced
+    """
+    associate_session_with_user(session_id, member_id, ip_address, user_agent)
+    try:
+        return session_id, add_token(session_id)
+    except NoMemberFoundException:
+        logger.info("Session %s no longer exists; starting a new one", session_id)
+    session_id = create_new_session()
+    associate_session_with_user(session_id, member_id, ip_address, user_agent)
+    return session_id, add_token(session_id)
 
 
 def add_token(session_id):
-    conx = get_sqlite3_conx(DB_NAME)
-    member_id = get_member_by_session(session_id)
+    store = get_session_store()
+    with store.unit():
+        member_id = get_member_by_session(session_id)
 
-    if not member_id:
-        print("Found no member for session {}".format(session_id))
-        raise NoMemberFoundException()
+        if not member_id:
+            logger.info("Found no member for session %s", session_id)
+            raise NoMemberFoundException()
 
-    # Invalidate old tokens
-    deactivate_tokens(member_id)
+        # Invalidate old tokens
+        deactivate_tokens(member_id)
 
-    new_token = generate_new_token()
-    token_id = update_db(
-        conx,
-        "INSERT INTO token(id, session_id) VALUES(?, ?)",
-        [new_token, session_id]
-    )
-    return new_token
+        new_token = generate_new_token()
+        store.add_token(new_token, session_id)
+        return new_token
 
 
 def deactivate_tokens(member_id):
-    conx = get_sqlite3_conx(DB_NAME)
-    sessions = query_result(
-        conx,
-        "SELECT id from session WHERE member_id=?",
-        [member_id],
-        single_row=False,
-        all_fields=False
-    )
-    sessions_str = "', '".join(sessions)
-    sessions_str = "'{}'".format(sessions_str)
-    update_db(
-        conx,
-        "UPDATE token set active=0 WHERE session_id in ({})".format(sessions_str)
-    )
+    get_session_store().deactivate_member_tokens(member_id)
+    after_commit(lambda: token_cache.invalidate_member(member_id))
     return None
 
 
+def isbn10_check_digit(body):
+    """Check digit for the first 9 digits of an ISBN-10 ('0'-'9' or 'X')"""
+    total = sum((10 - i) * int(digit) for i, digit in enumerate(body))
+    check = (11 - total % 11) % 11
+    return 'X' if check == 10 else str(check)
+
+
+def isbn13_check_digit(body):
+    """Check digit for the first 12 digits of an ISBN-13"""
+    total = sum((3 if i % 2 else 1) * int(digit) for i, digit in enumerate(body))
+    return str((10 - total % 10) % 10)
+
+
+def normalize_isbn(isbn):
+    """Validates an ISBN-10 or ISBN-13, ignoring hyphens and spaces, and returns it as ISBN-13,
+    the form stored in resource.isbn.
+    Raises:
+        InvalidIsbnException: Wrong length, a non-digit, a bad check digit or an unknown prefix
+    """
+    digits = str(isbn).replace('-', '').replace(' ', '').upper()
+    if len(digits) == 10 and digits[:9].isdigit() and (digits[9].isdigit() or digits[9] == 'X'):
+        if isbn10_check_digit(digits[:9]) != digits[9]:
+            raise InvalidIsbnException(f"ISBN-10 {isbn} has an invalid check digit")
+        body = '978' + digits[:9]
+        return body + isbn13_check_digit(body)
+    if len(digits) == 13 and digits.isdigit() and digits[:3] in ('978', '979'):
+        if isbn13_check_digit(digits[:12]) != digits[12]:
+            raise InvalidIsbnException(f"ISBN-13 {isbn} has an invalid check digit")
+        return digits
+    raise InvalidIsbnException(f"{isbn} is not an ISBN-10 or ISBN-13")
+
+
+def _normalize_isbn_or_none(isbn):
+    try:
+        return normalize_isbn(isbn) if isbn else None
+    except InvalidIsbnException:
+        return None
+
+
+def isbn13_to_isbn10(isbn13):
+    """The ISBN-10 form of a normalized ISBN-13, or '' for 979 ISBNs, which have none"""
+    if not isbn13 or not isbn13.startswith('978'):
+        return ''
+    return isbn13[3:12] + isbn10_check_digit(isbn13[3:12])
+
+
+def canonical_isbns(isbn10=None, isbn13=None):
+    """Normalizes the ISBN pair given for a new resource.
+    Returns:
+        (isbn10, isbn13): Digits only, isbn10 derived from isbn13 where one exists; ('', '') if
+        neither was given
+    Raises:
+        InvalidIsbnException: Either is invalid, or they name different books
+    """
+    normalized = {normalize_isbn(isbn) for isbn in (isbn10, isbn13) if isbn}
+    if len(normalized) > 1:
+        raise InvalidIsbnException(f"ISBN-10 {isbn10} and ISBN-13 {isbn13} are different books")
+    if not normalized:
+        return '', ''
+    isbn13 = normalized.pop()
+    return isbn13_to_isbn10(isbn13), isbn13
+
+
 def add_borrow(member_id, stock_id):
-    conx = get_sqlite3_conx(DB_NAME)
-    borrow_id = update_db(
-        conx,
-        "INSERT INTO borrow(member_id, stock_id) VALUES(?, ?)",
-        [member_id, stock_id]
-    )
+    borrow_id, = submit_writes([("INSERT INTO borrow(member_id, stock_id) VALUES(?, ?)", [member_id, stock_id])]).result()
     return borrow_id
 
 
 def add_resource(title, author_first, author_middle, author_last, edition, isbn10="", isbn13=""):
-    conx = get_sqlite3_conx(DB_NAME)
-    author_id = get_author_by_name(author_first, author_middle, author_last)
-    
-    if not author_id:
-        print("Author {} {} {} did not exist in the system. Adding...".format(author_first, author_middle, author_last))
-        author_id = add_author(author_first, author_middle, author_last)
-
-    try:
-        resource_id = update_db(
-            conx,
-            "INSERT INTO resource(title, author_id, edition, isbn_10, isbn_13) VALUES(?, ?, ?, ?, ?)",
-            [title, author_id, edition, isbn10, isbn13]
-        )
-        return resource_id
-    except Exception as e:
-        print(str(e))
-        raise e
+    isbn10, isbn13 = canonical_isbns(isbn10, isbn13)
+    with transaction() as conx:
+        author_id = get_author_by_name(author_first, author_middle, author_last)
+
+        if not author_id:
+            logger.info("Author %s %s %s did not exist in the system. Adding...", author_first, author_middle, author_last)
+            author_id = add_author(author_first, author_middle, author_last)
+
+        try:
+            resource_id = update_db(
+                conx,
+                "INSERT INTO resource(title, author_id, edition, isbn_10, isbn_13, isbn) VALUES(?, ?, ?, ?, ?, ?)",
+                [title, author_id, edition, isbn10, isbn13, isbn13 or None]
+            )
+            bump_catalog_version()
+            _catalog_inserted('title', [title])
+            return resource_id
+        except Exception as e:
+            logger.exception("Failed to add resource %s", title)
+            raise e
 
 
 def deactivate_resource(resource_id):
-    conx = get_sqlite3_conx(DB_NAME)
-    update_db(
-        conx,
-        "UPDATE resource set active=0 WHERE id=?",
-        [resource_id]
-    )
+    with connection() as conx:
+        update_db(
+            conx,
+            "UPDATE resource set active=0 WHERE id=?",
+            [resource_id]
+        )
+        bump_catalog_version()
 
 def add_author(first, middle, last):
-    conx = get_sqlite3_conx(DB_NAME)
-    author_id = update_db(
-        conx,
-        "INSERT INTO author(first_name, middle_name, last_name) VALUES(?, ?, ?)",
-        [first, middle, last]
-    )
-    return author_id
+    with connection() as conx:
+        author_id = update_db(
+            conx,
+            "INSERT INTO author(first_name, middle_name, last_name) VALUES(?, ?, ?)",
+            [first, middle, last]
+        )
+        bump_catalog_version()
+        _catalog_inserted('author', [(first, middle, last)])
+        return author_id
 
 
 def add_stock(resource_id):
-    conx = get_sqlite3_conx(DB_NAME)
-    stock_id = update_db(conx, "INSERT INTO stock(resource_id) VALUES(?)", [resource_id])
-    return stock_id
+    with connection() as conx:
+        stock_id = update_db(conx, "INSERT INTO stock(resource_id) VALUES(?)", [resource_id])
+        bump_catalog_version()
+        return stock_id
 
 def add_resource_to_inventory(title, author_first, author_middle, author_last, edition, isbn10, isbn13):
-    conx = get_sqlite3_conx(DB_NAME)
+    """Adds a copy of a resource, creating the resource unless one with the same ISBN exists.
+    Raises:
+        InvalidIsbnException: An ISBN fails its checksum, or isbn10 and isbn13 name different books
+    """
+    isbn10, isbn13 = canonical_isbns(isbn10, isbn13)
+    with transaction() as conx:
+        # Has this resource already been added? Without an ISBN there is nothing to match on.
+        resource_id = None
+        if isbn13:
+            resource_id = query_result(
+                conx,
+                "SELECT id FROM resource WHERE isbn = ?",
+                [isbn13],
+                single_row=True,
+                all_fields=False,
+                empty_results=True
+            )
+        if resource_id:
+            # Add another stock for the resource
+            add_stock(resource_id)
+        else:
+            resource_id = add_resource(title, author_first, author_middle, author_last, edition, isbn10, isbn13)
+
+        resource = {
+            'id': resource_id,
+            'title': title,
+            'author': f"{author_first} {author_middle} {author_last}".replace('  ', ' '),
+            'edition': edition,
+            'isbn10': isbn10,
+            'isbn13': isbn13,
+
+        }
+        return resource
+
+
+BULK_REQUIRED_FIELDS = ('title', 'authorFirst', 'authorLast')
+_AMBIGUOUS_AUTHOR = object()  # Marks author names matching more than one author row
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _author_key(first, middle, last):
+    return (first or '', middle or '', last or '')
+
 
-    # Has this resource already been added?
-    existing_resource = query_result(
+def _next_id(conx, table):
+    """Next AUTOINCREMENT id for `table`. Only stable while the caller holds the write lock."""
+    return query_result(
         conx,
-        "SELECT * FROM resource WHERE isbn_10 = ? or isbn_13 = ?",
-        [isbn10, isbn13],
+        f"SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name='{table}'), 0), COALESCE((SELECT MAX(id) FROM {table}), 0)) + 1",
         single_row=True,
-        all_fields=True,
-        empty_results=True
+        all_fields=False
     )
-    resource_id = None
-    if existing_resource:
-        resource_id = existing_resource[0]
-        # Add another stock for the resource
-        add_stock(resource_id)
-    else:
-        resource_id = add_resource(title, author_first, author_middle, author_last, edition, isbn10, isbn13)
 
-    resource = {
-        'id': resource_id,
-        'title': title,
-        'author': f"{author_first} {author_middle} {author_last}".replace('  ', ' '),
-        'edition': edition,
-        'isbn10': isbn10,
-        'isbn13': isbn13,
 
-    }
-    return resource
+def _load_resource_ids_by_isbn(conx, isbns, resource_ids_by_isbn):
+    for isbn_chunk in _chunks(sorted(isbns), SQLITE_MAX_VARIABLES):
+        rows = query_result(
+            conx,
+            f"SELECT id, isbn FROM resource WHERE isbn IN ({', '.join('?' for i in isbn_chunk)})",
+            isbn_chunk,
+            empty_results=True
+        )
+        for resource_id, isbn in rows:
+            resource_ids_by_isbn[isbn] = resource_id
 
 
-def search_resources(*args, **kwargs):
-    conx = get_sqlite3_conx(DB_NAME)
+def _load_author_ids(conx, author_keys, author_ids):
+    last_names = {key[2] for key in author_keys}
+    for last_name_chunk in _chunks(sorted(last_names), SQLITE_MAX_VARIABLES):
+        rows = query_result(
+            conx,
+            f"SELECT id, first_name, middle_name, last_name FROM author WHERE last_name IN ({', '.join('?' for n in last_name_chunk)})",
+            last_name_chunk,
+            empty_results=True
+        )
+        for author_id, first, middle, last in rows:
+            key = _author_key(first, middle, last)
+            if key not in author_keys:
+                continue
+            author_ids[key] = _AMBIGUOUS_AUTHOR if key in author_ids else author_id
+
+
+def _ingest_batch(conx, batch, author_ids, resource_ids_by_isbn):
+    results = {}
+    valid_rows = []
+    for index, row in batch:
+        if not isinstance(row, dict):
+            results[index] = {'row': index, 'status': 'error', 'details': 'Row is not a JSON object'}
+            continue
+        missing_fields = [field for field in BULK_REQUIRED_FIELDS if not row.get(field)]
+        if missing_fields:
+            results[index] = {'row': index, 'status': 'error', 'details': f"Missing fields: {', '.join(missing_fields)}"}
+            continue
+        try:
+            isbn10, isbn13 = canonical_isbns(row.get('isbn10'), row.get('isbn13'))
+        except InvalidIsbnException as iie:
+            results[index] = {'row': index, 'status': 'error', 'details': str(iie)}
+            continue
+        valid_rows.append((index, row, isbn10, isbn13))
 
-    # Supported fields
-    author_name = kwargs.get('author')
-    author_map = {}
-    title = kwargs.get('title')
-    isbn = kwargs.get('isbn')
+    cursor = conx.cursor()
+    try:
+        with transaction():
+            isbns = set()
+            author_keys = set()
+            for index, row, isbn10, isbn13 in valid_rows:
+                if isbn13 and isbn13 not in resource_ids_by_isbn:
+                    isbns.add(isbn13)
+                key = _author_key(row['authorFirst'], row.get('authorMiddle'), row['authorLast'])
+                if key not in author_ids:
+                    author_keys.add(key)
+            _load_resource_ids_by_isbn(conx, isbns, resource_ids_by_isbn)
+            _load_author_ids(conx, author_keys, author_ids)
+
+            next_author_id = _next_id(conx, 'author')
+            next_resource_id = _next_id(conx, 'resource')
+            new_authors = []
+            new_resources = []
+            new_stock = []
+
+            for index, row, isbn10, isbn13 in valid_rows:
+                # Has this resource already been added (possibly earlier in this ingest)?
+                resource_id = resource_ids_by_isbn.get(isbn13) if isbn13 else None
+                if resource_id:
+                    new_stock.append((resource_id,))
+                    results[index] = {'row': index, 'status': 'stockAdded', 'resourceId': resource_id}
+                    continue
+
+                key = _author_key(row['authorFirst'], row.get('authorMiddle'), row['authorLast'])
+                author_id = author_ids.get(key)
+                if author_id is _AMBIGUOUS_AUTHOR:
+                    results[index] = {'row': index, 'status': 'error', 'details': "Found multiple authors named {} {} {}".format(*key)}
+                    continue
+                if author_id is None:
+                    author_id = next_author_id
+                    next_author_id += 1
+                    author_ids[key] = author_id
+                    new_authors.append((author_id,) + key)
+
+                resource_id = next_resource_id
+                next_resource_id += 1
+                new_resources.append((resource_id, row['title'], author_id, row.get('edition'), isbn10, isbn13, isbn13 or None))
+                if isbn13:
+                    resource_ids_by_isbn[isbn13] = resource_id
+                results[index] = {'row': index, 'status': 'created', 'resourceId': resource_id}
+
+            for qry, new_rows in (
+                ("INSERT INTO author(id, first_name, middle_name, last_name) VALUES(?, ?, ?, ?)", new_authors),
+                ("INSERT INTO resource(id, title, author_id, edition, isbn_10, isbn_13, isbn) VALUES(?, ?, ?, ?, ?, ?, ?)", new_resources),
+                ("INSERT INTO stock(resource_id) VALUES(?)", new_stock),
+            ):
+                started = time.perf_counter()
+                cursor.executemany(qry, new_rows)
+                _record_statement(qry, new_rows[0] if new_rows else None, time.perf_counter() - started, len(new_rows))
+            bump_catalog_version()
+            _catalog_inserted('author', [new_author[1:] for new_author in new_authors])
+            _catalog_inserted('title', [new_resource[1] for new_resource in new_resources])
+    except Exception as e:
+        # The maps may now reference rows that were rolled back
+        author_ids.clear()
+        resource_ids_by_isbn.clear()
+        for index, row, isbn10, isbn13 in valid_rows:
+            results[index] = {'row': index, 'status': 'error', 'details': str(e)}
+
+    return [results[index] for index, row in batch]
+
+
+def bulk_add_resources_to_inventory(rows, batch_size=BULK_BATCH_SIZE):
+    """Adds many resources using the same rules as add_resource_to_inventory: a known ISBN adds
+    stock, an invalid ISBN fails its row, and an unknown author is created. Rows are committed in transactions of `batch_size`,
+    so a failing batch is rolled back without losing the batches before it.
+    Args:
+        rows (iterable of dict): Resources keyed like the /v1/resource body (title, authorFirst, ...)
+        batch_size (int): Rows per transaction
+    Returns:
+        report (dict): Per-row 'results' and a 'summary' with counts and throughput
+    """
+    started = time.perf_counter()
+    author_ids = {}  # (first, middle, last) -> author id
+    resource_ids_by_isbn = {}  # normalized ISBN-13 -> resource id
+    results = []
+    batches = 0
+
+    for batch in _chunks(enumerate(rows), batch_size):
+        with connection() as conx:  # Per batch, so other writers get the writer in between
+            results += _ingest_batch(conx, batch, author_ids, resource_ids_by_isbn)
+        batches += 1
+
+    elapsed = time.perf_counter() - started
+    summary = {'rows': len(results), 'batches': batches, 'secs': round(elapsed, 3)}
+    for status in ('created', 'stockAdded', 'error'):
+        summary[status] = sum(1 for result in results if result['status'] == status)
+    summary['rowsPerSec'] = round(len(results) / elapsed, 1) if elapsed else 0.0
+    return {'results': results, 'summary': summary}
+
+
+def fts_match_expression(column, text):
+    """Builds an FTS5 MATCH expression requiring every word of `text` as a prefix within `column`.
+    Words are quoted so user input can never inject FTS5 query syntax.
+    """
+    terms = re.findall(r"\w+", text.lower())
+    return " AND ".join(f'{column} : "{term}"*' for term in terms)
+
+
+def encode_search_cursor(row_rank, resource_id):
+    position = {'i': resource_id}
+    if row_rank is not None:
+        position['r'] = row_rank
+    return urlsafe_b64encode(json.dumps(position).encode()).decode().rstrip('=')
+
+
+def decode_search_cursor(cursor):
+    """Returns (rank, resource_id) for the last row of the previous page; rank is None for unranked searches"""
+    try:
+        position = json.loads(urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return position.get('r'), int(position['i'])
+    except Exception as e:
+        raise InvalidCursorException("Cursor {} is not valid".format(cursor)) from e
+
+
+def build_search_query(author=None, title=None, isbn=None, cursor=None, limit=None, available=False):
+    """Builds the joined resource/author/availability search query.
+    Returns:
+        (qry, params), or None if the criteria can never match. Rows are the 7 resource columns,
+        the author's first, middle and last names, the total and available copy counts, then the
+        bm25 rank (NULL for unranked searches).
+    """
+    match_terms = []
+    if author:
+        match_terms.append(fts_match_expression('author', author))
+    if title:
+        match_terms.append(fts_match_expression('title', title))
+    match_terms = [term for term in match_terms if term]
+
+    if not match_terms and (author or title):  # Only punctuation was provided, which can never match
+        return None
+
+    if isbn:
+        isbn = _normalize_isbn_or_none(isbn)
+        if isbn is None:  # Not a valid ISBN, so no resource can have it
+            return None
 
+    ranked = bool(match_terms)
     where_clause = ""
     params = []
     and_ = ""
 
-    if author_name:
-        author_last = author_name.split(' ')[-1]
-        author_map = get_authors_by_last_name(author_last)
-        where_clause += f"{and_}author_id in ({', '.join(['?' for a in author_map.keys()])}) "
-        params += author_map.keys()
+    if ranked:
+        from_clause = "resource_fts JOIN resource ON resource.id = resource_fts.rowid"
+        rank_column = "resource_fts.rank"
+        where_clause += f"{and_}resource_fts MATCH ? "
+        params.append(" AND ".join(match_terms))
         and_ = "AND "
+    else:
+        from_clause = "resource"
+        rank_column = "NULL"
 
-    if title:
-        where_clause += f"{and_}title like ? "
-        params.append(f"%{title}%")
-        and_ = "AND "
+    where_clause += f"{and_}resource.active = 1 "
+    and_ = "AND "
 
     if isbn:
-        where_clause += f"{and_}isbn_10 = ?"
+        where_clause += f"{and_}resource.isbn = ? "
         params.append(isbn)
         and_ = "AND "
 
-    resources = []
-    result = query_result(
-        conx,
-        f"SELECT * FROM resource WHERE {where_clause}",
-        params,
-        single_row=False,
-        all_fields=True,
-        empty_results=True
+    if available:  # Checked per hit by resource_availability's primary key
+        where_clause += f"{and_}resource_availability.available > 0 "
+        and_ = "AND "
+
+    if cursor:
+        last_rank, last_id = decode_search_cursor(cursor)
+        if ranked:
+            where_clause += f"{and_}({rank_column} > ? OR ({rank_column} = ? AND resource.id > ?)) "
+            params += [last_rank, last_rank, last_id]
+        else:
+            where_clause += f"{and_}resource.id > ? "
+            params.append(last_id)
+        and_ = "AND "
+
+    order_by = f"{rank_column}, resource.id" if ranked else "resource.id"
+    qry = (
+        "SELECT resource.id, resource.title, resource.author_id, resource.edition, resource.isbn_10, "
+        "resource.isbn_13, resource.date_added, author.first_name, author.middle_name, author.last_name, "
+        "coalesce(resource_availability.total, 0), coalesce(resource_availability.available, 0), "
+        f"{rank_column} FROM {from_clause} JOIN author ON author.id = resource.author_id "
+        "LEFT JOIN resource_availability ON resource_availability.resource_id = resource.id "
+        f"WHERE {where_clause}ORDER BY {order_by}"
     )
+    if limit is not None:
+        qry += " LIMIT ?"
+        params.append(limit)
+    return qry, params
 
-    resource_author_ids = []
-    for resource in result:
-        author_id = resource[2]
-        resource_author_ids.append(author_id)
 
-    if not author_map.keys():  # We need to retrieve author names to populate resources
-        author_map.update(get_authors_by_id(resource_author_ids))
+def search_resources(*args, **kwargs):
+    """Searches the catalog with one query joining resource and author.
+    Kwargs:
+        author (str), title (str), isbn (str): Search criteria, combined with AND. isbn may be an
+            ISBN-10 or ISBN-13, with or without hyphens
+        available (bool): Only resources with at least one copy on the shelf
+        limit (int): Maximum resources returned (defaults to SEARCH_DEFAULT_LIMIT, capped at SEARCH_MAX_LIMIT)
+        cursor (str): Opaque cursor returned with the previous page
+    Returns:
+        resources (list of Resource), next_cursor (str, or None on the last page)
+    """
+    limit, search_query = _build_search_page_query(kwargs)
+    if search_query is None:
+        return [], None
+    qry, params = search_query
 
-    # Associate resources with author names
-    for resrc in result:
-        associated_author = author_map[int(resrc[2])]
-        resources.append(
-            Resource(resrc, associated_author.first_name, associated_author.middle_name, associated_author.last_name)
+    with read_connection() as conx:
+        result = query_result(
+            conx,
+            qry,
+            params,
+            single_row=False,
+            all_fields=True,
+            empty_results=True
         )
+    return _search_page(result, limit)
 
-    return resources
 
-def check_in_resource(member_id, stock_id):
-    conx = get_sqlite3_conx(DB_NAME)
-    stock_data = query_result(
-        conx,
-        "SELECT * FROM stock WHERE id=?",
-        [stock_id],
-        single_row=True,
-        all_fields=True
-    )
-    if not stock_data:
-        raise CheckinException("Stock {} not found in system".format(stock_id))
-    stock_id, resource_id, date_added, active = stock_data
+def _build_search_page_query(criteria):
+    """Returns (limit, build_search_query result) for one page of search_resources"""
+    limit = criteria.get('limit')
+    limit = min(int(limit if limit is not None else SEARCH_DEFAULT_LIMIT), SEARCH_MAX_LIMIT)  # 0 is invalid, not "default"
+    if limit < 1:
+        raise ValueError("Search limit must be positive, received {}".format(limit))
 
-    resource = query_result(
-        conx,
-        "SELECT * FROM resource WHERE id=?",
-        [resource_id],
-        single_row=True,
-        all_fields=True
+    # One extra row tells us whether another page exists
+    search_query = build_search_query(
+        criteria.get('author'), criteria.get('title'), criteria.get('isbn'), criteria.get('cursor'), limit + 1,
+        criteria.get('available', False)
     )
-    if not resource:
-        raise CheckinException("Resource {} not found in system".format(resource))
+    return limit, search_query
 
-    resource_id, title, author, date_added, isbn_10, isbn_13 = resource
-    borrow_id = query_result(
-        conx,
-        "SELECT id FROM borrow WHERE member_id=? AND stock_id=? AND closed=0",
-        [member_id, stock_id],
-        single_row=True,
-        all_fields=False
-    )
-    update_db(conx, "UPDATE borrow SET closed=1 WHERE id=?", [borrow_id])
-    return None
 
+def _search_page(result, limit):
+    next_cursor = None
+    if len(result) > limit:
+        result = result[:limit]
+        last_row = result[-1]
+        next_cursor = encode_search_cursor(last_row[12], last_row[0])
 
-def checkout_resource(member_id, stock_id):
-    conx = get_sqlite3_conx(DB_NAME)
-    member_data = query_result(
-        conx,
-        "SELECT * FROM member WHERE id=?",
-        [member_id],
-        single_row=True,
-        all_fields=True
-    )
+    resources = [Resource(row[:7], row[7], row[8], row[9], row[10], row[11]) for row in result]
+    return resources, next_cursor
 
-    stock_data = query_result(conx, GET_STOCK_SQL, [stock_id], single_row=True, all_fields=True)
-    stock_id, resource_id, date_added, active = stock_data
 
-    resource = query_result(
-        conx,
-        "SELECT * FROM resource WHERE id=?",
-        [resource_id],
-        single_row=True,
-        all_fields=True
+def search_resources_batch(queries):
+    """Runs many searches over one connection and one read transaction, so every query sees the
+    same snapshot of the catalog. Queries that build the same SQL (e.g. one author in several
+    reading lists, whatever its case or spacing) are executed once and share their results.
+    Args:
+        queries (list of dict): search_resources kwargs. At most SEARCH_BATCH_MAX_QUERIES, whose
+            limits add up to at most SEARCH_BATCH_MAX_RESULTS. As with /v1/search, a query
+            without author, title or isbn matches nothing.
+    Returns:
+        results (list): Per query, in order, (resources, next_cursor), or the ValueError or
+        InvalidCursorException that search_resources would have raised for it
+    Raises:
+        ValueError: The batch is over either size limit
+    """
+    if len(queries) > SEARCH_BATCH_MAX_QUERIES:
+        raise ValueError(f"At most {SEARCH_BATCH_MAX_QUERIES} searches per batch, received {len(queries)}")
+
+    prepared = []
+    for criteria in queries:
+        if not criteria.get('author') and not criteria.get('title') and not criteria.get('isbn'):
+            prepared.append((0, None))
+            continue
+        try:
+            prepared.append(_build_search_page_query(criteria))
+        except (ValueError, InvalidCursorException) as e:
+            prepared.append(e)
+    total_limit = sum(query[0] for query in prepared if isinstance(query, tuple))
+    if total_limit > SEARCH_BATCH_MAX_RESULTS:
+        raise ValueError(f"A batch may request at most {SEARCH_BATCH_MAX_RESULTS} results, received limits adding up to {total_limit}")
+
+    pages = {}  # (qry, params) -> (resources, next_cursor), shared by identical queries
+    results = []
+    with read_transaction() as conx:
+        for query in prepared:
+            if not isinstance(query, tuple):
+                results.append(query)
+                continue
+            limit, search_query = query
+            if search_query is None:
+                results.append(([], None))
+                continue
+            qry, params = search_query
+            page_key = (qry, tuple(params))
+            if page_key not in pages:
+                rows = query_result(conx, qry, params, empty_results=True)
+                pages[page_key] = _search_page(rows, limit)
+            results.append(pages[page_key])
+    return results
+
+
+def iter_search_resources(*args, **kwargs):
+    """Yields matching resources one at a time, reading SEARCH_FETCH_SIZE rows from the cursor
+    at a time, so memory stays flat however many resources match.
+    Accepts the same kwargs as search_resources, except that limit is optional (unbounded by default).
+    """
+    limit = kwargs.get('limit')
+    if limit is not None:
+        limit = int(limit)
+        if limit < 1:
+            raise ValueError("Search limit must be positive, received {}".format(limit))
+
+    search_query = build_search_query(
+        kwargs.get('author'), kwargs.get('title'), kwargs.get('isbn'), kwargs.get('cursor'), limit,
+        kwargs.get('available', False)
     )
-    resource_id, title, author, date_added, isbn_10, isbn_13 = resource
+    if search_query is None:
+        return
+    qry, params = search_query
+
+    with read_connection() as conx:
+        curs = conx.cursor()
+        started = time.perf_counter()
+        total_rows = 0
+        try:
+            curs.execute(qry, params)
+            while True:
+                rows = curs.fetchmany(SEARCH_FETCH_SIZE)
+                if not rows:
+                    break
+                total_rows += len(rows)
+                for row in rows:
+                    yield Resource(row[:7], row[7], row[8], row[9], row[10], row[11])
+        finally:
+            curs.close()
+            # Includes time the consumer spent between rows, i.e. the whole life of the cursor
+            _record_statement(qry, params, time.perf_counter() - started, total_rows)
+
+# Resolves any number of ISBNs in one statement: json_each turns the JSON array parameter into
+# rows that are joined to resource through its unique isbn index, with no bound-variable limit
+RESOURCES_BY_ISBN_SQL = (
+    "SELECT resource.id, resource.title, resource.author_id, resource.edition, resource.isbn_10, "
+    "resource.isbn_13, resource.date_added, author.first_name, author.middle_name, author.last_name, "
+    "coalesce(resource_availability.total, 0), coalesce(resource_availability.available, 0), resource.isbn "
+    "FROM json_each(?) AS wanted JOIN resource ON resource.isbn = wanted.value "
+    "JOIN author ON author.id = resource.author_id "
+    "LEFT JOIN resource_availability ON resource_availability.resource_id = resource.id "
+    "WHERE resource.active = 1"
+)
+
+
+def get_resources_by_isbn(isbns):
+    """Looks up active resources by normalized ISBN-13 (see normalize_isbn).
+    Args:
+        isbns (iterable of str): Normalized ISBN-13s, at most ISBN_BATCH_MAX
+    Returns:
+        resources (dict): ISBN-13 -> Resource, for the ISBNs that were found
+    """
+    isbns = sorted(set(isbns))
+    if not isbns:
+        return {}
+    with read_connection() as conx:
+        rows = query_result(conx, RESOURCES_BY_ISBN_SQL, [json.dumps(isbns)], empty_results=True)
+    return {row[12]: Resource(row[:7], row[7], row[8], row[9], row[10], row[11]) for row in rows}
+
+
+def get_resource_by_isbn(isbn):
+    """Returns the active Resource with this ISBN-10 or ISBN-13, or None.
+    Raises:
+        InvalidIsbnException
+    """
+    isbn13 = normalize_isbn(isbn)
+    return get_resources_by_isbn([isbn13]).get(isbn13)
+
 
-    if not active:
-        raise CheckoutException("Stock item {} '{}' is not active".format(stock_id, title))
+def resolve_isbns(isbns):
+    """Resolves a batch of scanned ISBNs, e.g. from a circulation desk, with one query.
+    Args:
+        isbns (list of str): ISBN-10s or ISBN-13s, in any mix, at most ISBN_BATCH_MAX
+    Returns:
+        results (list of dict): One per input, in order, with 'isbn' as given, 'isbn13' and a status
+        of 'found' (with 'resource'), 'notFound' or 'invalid' (with 'details')
+    """
+    if len(isbns) > ISBN_BATCH_MAX:
+        raise ValueError(f"At most {ISBN_BATCH_MAX} ISBNs may be resolved at once, received {len(isbns)}")
+    normalized = []
+    for isbn in isbns:
+        try:
+            normalized.append(normalize_isbn(isbn))
+        except InvalidIsbnException as iie:
+            normalized.append(iie)
+    found = get_resources_by_isbn(isbn13 for isbn13 in normalized if isinstance(isbn13, str))
+
+    results = []
+    for isbn, isbn13 in zip(isbns, normalized):
+        if isinstance(isbn13, InvalidIsbnException):
+            results.append({'isbn': isbn, 'isbn13': None, 'status': 'invalid', 'details': str(isbn13)})
+        elif isbn13 in found:
+            results.append({'isbn': isbn, 'isbn13': isbn13, 'status': 'found', 'resource': found[isbn13].to_dict()})
+        else:
+            results.append({'isbn': isbn, 'isbn13': isbn13, 'status': 'notFound'})
+    return results
 
-    member_id, member_email, member_password, member_checked_out, member_total_borrowed, member_joined, member_active = member_data
-    if not member_active:
-        raise CheckoutException("Member {} is not active".format(member_id))
 
-    if member_total_borrowed >= RESOURCE_CHECKOUT_LIMIT:
-        raise CheckoutException("Member is limited to {} items borrowed at one time".format(RESOURCE_CHECKOUT_LIMIT))
+def check_in_resource(member_id, stock_id):
+    """Closes the member's open borrow of `stock_id` and updates the counters in one transaction.
+    Returns:
+        borrow_id (int): The borrow that was closed
+    """
+    with transaction() as conx:
+        borrow_id = query_result(
+            conx,
+            "SELECT id FROM borrow WHERE stock_id=? AND closed=0 AND member_id=?",
+            [stock_id, member_id],
+            single_row=True,
+            all_fields=False,
+            empty_results=True
+        )
+        if not borrow_id:
+            raise CheckinException("Stock {} is not checked out to member {}".format(stock_id, member_id))
 
-    # Add borrow
-    borrow_id = add_borrow(member_id, stock_id)
+        update_db(conx, "UPDATE borrow SET closed=1 WHERE id=?", [borrow_id])
+        update_db(conx, "UPDATE stock SET on_loan=0 WHERE id=?", [stock_id])
+        update_db(conx, "UPDATE member SET checked_out=checked_out-1 WHERE id=? AND checked_out > 0", [member_id])
+        bump_catalog_version()  # Availability shown in search results changed
+        return borrow_id
+
+
+def checkout_resource(member_id, stock_id):
+    """Lends stock item `stock_id` to a member. Checks and writes run in one immediate
+    transaction, so concurrent checkouts of the same copy cannot both succeed.
+    Returns:
+        borrow_id (int)
+    """
+    with transaction() as conx:
+        member_data = query_result(
+            conx,
+            "SELECT active, checked_out FROM member WHERE id=?",
+            [member_id],
+            single_row=True,
+            all_fields=True,
+            empty_results=True
+        )
+        if not member_data:
+            raise CheckoutException("Member {} not found in system".format(member_id))
+        member_active, member_checked_out = member_data
+        if not member_active:
+            raise CheckoutException("Member {} is not active".format(member_id))
+        if (member_checked_out or 0) >= RESOURCE_CHECKOUT_LIMIT:
+            raise CheckoutException("Member is limited to {} items borrowed at one time".format(RESOURCE_CHECKOUT_LIMIT))
+
+        stock_data = query_result(conx, GET_STOCK_SQL, [stock_id], single_row=True, all_fields=True, empty_results=True)
+        if not stock_data:
+            raise CheckoutException("Stock {} not found in system".format(stock_id))
+        stock_id, active, on_loan, title = stock_data
+        if not active:
+            raise CheckoutException("Stock item {} '{}' is not active".format(stock_id, title))
+        if on_loan:
+            raise CheckoutException("Stock item {} '{}' is already checked out".format(stock_id, title))
+
+        borrow_id = add_borrow(member_id, stock_id)
+        update_db(conx, "UPDATE stock SET on_loan=1 WHERE id=?", [stock_id])
+        update_db(
+            conx,
+            "UPDATE member SET checked_out=checked_out+1, total_borrowed=total_borrowed+1 WHERE id=?",
+            [member_id]
+        )
+        bump_catalog_version()  # Availability shown in search results changed
+        return borrow_id
 
-    return borrow_id
 
 def get_authors_by_last_name(author_last):
-    conx = get_sqlite3_conx(DB_NAME)
-    author_map = {}
-    # Search for all authors with the same last name
-    matching_authors = query_result(
-    conx,
-    "SELECT * FROM author WHERE last_name like '%{}%'".format(author_last),
-    [],
-    single_row=False,
-    all_fields=True,
-    empty_results=True
-    )
+    with read_connection() as conx:
+        author_map = {}
+        # Search for all authors with the same last name
+        match_expression = fts_match_expression('last_name', author_last)
+        if not match_expression:
+            return author_map
+
+        matching_authors = query_result(
+            conx,
+            "SELECT author.* FROM author_fts JOIN author ON author.id = author_fts.rowid WHERE author_fts MATCH ? ORDER BY bm25(author_fts)",
+            [match_expression],
+            single_row=False,
+            all_fields=True,
+            empty_results=True
+        )
 
-    for author_result in matching_authors:
-        author = Author(author_result)
-        author_map[author.id] = author
+        for author_result in matching_authors:
+            author = Author(author_result)
+            author_map[author.id] = author
 
-    return author_map
+        return author_map
@@ -0,0 +1,175 @@
+"""Scale fixture generator for building production-sized library databases.
+
+Usage:
+    python fixtures.py --db big.db --scale 1000000 [--seed 7]
+    python fixtures.py --db big.db --resources 10000000 --members 500000 --borrows 20000000
+
+--scale sets the number of resources and derives the other tables from it (members = scale/10,
+authors = scale/20, stock = 2 per resource, borrows = 3 per resource). Any table can be sized
+directly instead. Rows are generated with a seeded RNG and inserted with executemany in large
+transactions, so 10^7 rows take minutes rather than hours.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import db
+
+
+FIRST_NAMES = [
+    'James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer', 'Michael', 'Linda', 'William', 'Elizabeth',
+    'David', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Charles', 'Karen',
+    'Ursula', 'Octavia', 'Chinua', 'Haruki', 'Toni', 'Gabriel', 'Isabel', 'Jorge', 'Virginia', 'Leo',
+]
+LAST_NAMES = [
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez',
+    'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin',
+    'Lee', 'Perez', 'Thompson', 'White', 'Harris', 'Sanchez', 'Clark', 'Ramirez', 'Lewis', 'Robinson',
+    'Le Guin', 'Butler', 'Achebe', 'Murakami', 'Morrison', 'Marquez', 'Allende', 'Borges', 'Woolf', 'Tolstoy',
+]
+TITLE_WORDS = [
+    'The', 'A', 'Of', 'And', 'In', 'Night', 'River', 'Garden', 'History', 'Silent', 'Winter', 'Summer',
+    'House', 'Shadow', 'Light', 'Stone', 'Sea', 'City', 'Dream', 'War', 'Peace', 'Memory', 'Time', 'Star',
+    'Forest', 'Road', 'Song', 'Fire', 'Glass', 'Iron', 'Empire', 'Island', 'Secret', 'Letters', 'Journey',
+]
+INSERT_CHUNK_ROWS = 50000
+
+
+def make_isbns(n):
+    """Valid, unique ISBN-10 and matching ISBN-13 for the n-th resource"""
+    body = f"{(n * 7919) % 1000000000:09d}"  # Multiplying by a prime coprime to 10^9 keeps bodies unique
+    return body + db.isbn10_check_digit(body), '978' + body + db.isbn13_check_digit('978' + body)
+
+
+def _insert(conx, qry, rows):
+    total = 0
+    for chunk in db._chunks(rows, INSERT_CHUNK_ROWS):
+        conx.executemany(qry, chunk)
+        conx.commit()
+        total += len(chunk)
+    return total
+
+
+def generate(db_path, members, authors, resources, stock, borrows, seed=7, log=print):
+    """Builds a fixture database at `db_path` (which must not exist yet). Returns row counts per table."""
+    if os.path.exists(db_path):
+        raise FileExistsError(f"{db_path} already exists; fixtures are only generated into a new database")
+
+    rng = random.Random(seed)
+    db.DB_NAME = db_path
+    db.reset_pool()
+    db.prepare_db()
+    counts = {}
+
+    with db.connection() as conx:
+        conx.execute("PRAGMA synchronous=OFF")  # A fixture can simply be regenerated if the machine crashes
+
+        started = time.perf_counter()
+        counts['member'] = _insert(
+            conx,
+            "INSERT INTO member(id, email, password, date_joined) VALUES(?, ?, ?, ?)",
+            (
+                (i, f"member{i}@example.com", 'password', f"20{10 + i % 14:02d}-{1 + i % 12:02d}-{1 + i % 28:02d}")
+                for i in range(1, members + 1)
+            )
+        )
+        log(f"member: {counts['member']} rows in {time.perf_counter() - started:.1f}s")
+
+        # Few distinct last names, so many authors share one (as real catalogs do)
+        started = time.perf_counter()
+        counts['author'] = _insert(
+            conx,
+            "INSERT INTO author(id, first_name, middle_name, last_name) VALUES(?, ?, ?, ?)",
+            (
+                (i, rng.choice(FIRST_NAMES), rng.choice(('', '', '', 'A', 'J', 'K', 'M')), rng.choice(LAST_NAMES))
+                for i in range(1, authors + 1)
+            )
+        )
+        log(f"author: {counts['author']} rows in {time.perf_counter() - started:.1f}s")
+
+        started = time.perf_counter()
+
+        def resource_rows():
+            for i in range(1, resources + 1):
+                isbn10, isbn13 = make_isbns(i)
+                title = ' '.join(rng.choice(TITLE_WORDS) for w in range(rng.randint(2, 6)))
+                # Skewed so a few prolific authors own many titles
+                author_id = 1 + int(authors * rng.random() ** 2)
+                yield (i, title, min(author_id, authors), str(rng.randint(1, 5)), isbn10, isbn13, isbn13)
+
+        counts['resource'] = _insert(
+            conx,
+            "INSERT INTO resource(id, title, author_id, edition, isbn_10, isbn_13, isbn) VALUES(?, ?, ?, ?, ?, ?, ?)",
+            resource_rows()
+        )
+        log(f"resource: {counts['resource']} rows in {time.perf_counter() - started:.1f}s")
+
+        started = time.perf_counter()
+        counts['stock'] = _insert(
+            conx,
+            "INSERT INTO stock(id, resource_id) VALUES(?, ?)",
+            ((i, 1 + (i - 1) % resources) for i in range(1, stock + 1))
+        )
+        log(f"stock: {counts['stock']} rows in {time.perf_counter() - started:.1f}s")
+
+        # Closed history, plus open borrows for the first few percent of stock (one per copy)
+        started = time.perf_counter()
+        open_borrows = min(stock // 20, borrows)
+
+        def borrow_rows():
+            for i in range(1, borrows + 1):
+                is_open = i <= open_borrows
+                stock_id = i if is_open else rng.randint(1, stock)
+                created = f"20{15 + i % 9:02d}-{1 + i % 12:02d}-{1 + i % 28:02d} 12:00:00"
+                yield (i, rng.randint(1, members), stock_id, created, 0 if is_open else 1)
+
+        counts['borrow'] = _insert(
+            conx,
+            "INSERT INTO borrow(id, member_id, stock_id, created, closed) VALUES(?, ?, ?, ?, ?)",
+            borrow_rows()
+        )
+        conx.execute(
+            "UPDATE member SET checked_out = (SELECT COUNT(*) FROM borrow WHERE borrow.member_id = member.id AND closed=0), "
+            "total_borrowed = (SELECT COUNT(*) FROM borrow WHERE borrow.member_id = member.id)"
+        )
+        conx.execute("UPDATE stock SET on_loan=1 WHERE id IN (SELECT stock_id FROM borrow WHERE closed=0)")
+        conx.commit()
+        log(f"borrow: {counts['borrow']} rows in {time.perf_counter() - started:.1f}s")
+
+        conx.execute("ANALYZE")
+        conx.commit()
+
+    db.reset_pool()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a production-sized library database")
+    parser.add_argument('--db', required=True, help="Path of the new SQLite database")
+    parser.add_argument('--scale', type=int, default=10000, help="Resources; other tables are derived from it")
+    parser.add_argument('--members', type=int)
+    parser.add_argument('--authors', type=int)
+    parser.add_argument('--resources', type=int)
+    parser.add_argument('--stock', type=int)
+    parser.add_argument('--borrows', type=int)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    resources = args.resources or args.scale
+    counts = generate(
+        args.db,
+        members=args.members or max(resources // 10, 1),
+        authors=args.authors or max(resources // 20, 1),
+        resources=resources,
+        stock=args.stock or resources * 2,
+        borrows=args.borrows if args.borrows is not None else resources * 3,
+        seed=args.seed
+    )
+    print(counts)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""Bulk inventory loader.
+
+Usage:
+    python ingest.py catalog.ndjson [--db library.db] [--batch-size 1000] [--show-rows]
+
+The input is either NDJSON (one resource object per line) or a JSON array of resource objects,
+keyed like the /v1/resource body: title, authorFirst, authorMiddle, authorLast, edition, isbn10, isbn13.
+"""
+import argparse
+import json
+import sys
+
+import db
+
+
+def iter_ndjson_rows(lines):
+    """Yields one parsed object per non-blank line. Lines that are not valid JSON are yielded
+    as the raw text, so the ingest reports them as per-row errors instead of failing the batch.
+    """
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield line
+
+
+def iter_rows(stream):
+    """Detects a JSON array vs NDJSON from the first non-whitespace character of a text stream"""
+    first_line = stream.readline()
+    while first_line and not first_line.strip():
+        first_line = stream.readline()
+    if first_line.lstrip().startswith('['):
+        return iter(json.loads(first_line + stream.read()))
+    return iter_ndjson_rows(_prepend(first_line, stream))
+
+
+def _prepend(first_line, stream):
+    yield first_line
+    yield from stream
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk load resources into the library inventory")
+    parser.add_argument('path', help="NDJSON or JSON array file, or - for stdin")
+    parser.add_argument('--db', default=db.DB_NAME, help="SQLite database file (default: %(default)s)")
+    parser.add_argument('--batch-size', type=int, default=db.BULK_BATCH_SIZE, help="Rows per transaction")
+    parser.add_argument('--show-rows', action='store_true', help="Print every per-row result, not just errors")
+    args = parser.parse_args(argv)
+
+    db.DB_NAME = args.db
+    db.reset_pool()
+    db.prepare_db()
+
+    stream = sys.stdin if args.path == '-' else open(args.path, encoding='utf-8')
+    with stream:
+        report = db.bulk_add_resources_to_inventory(iter_rows(stream), batch_size=args.batch_size)
+
+    for result in report['results']:
+        if args.show_rows or result['status'] == 'error':
+            print(json.dumps(result))
+    print(json.dumps(report['summary']))
+    return 1 if report['summary']['error'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,223 @@
+"""Per-request database instrumentation and Prometheus-format metrics.
+
+db.query_result and db.update_db report every statement here (fingerprint, duration, rows) and
+every commit (duration). Totals for the current request are kept per thread so app.py can send
+them as a Server-Timing header, and process-wide histograms per endpoint and per statement are
+rendered for /metrics by render_prometheus(), along with what the sweeper reclaims.
+"""
+from bisect import bisect_left
+import re
+import threading
+import time
+
+
+enabled = True  # Set False to skip all collection (see bench_metrics.py for the overhead)
+
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+FINGERPRINT_CACHE_SIZE = 1000
+
+_WHITESPACE = re.compile(r"\s+")
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+_fingerprints = {}
+_local = threading.local()
+
+
+def fingerprint(sql):
+    """Normalizes a statement so every call shape of one query shares a label:
+    literals become ?, and IN lists of any length become (?...)."""
+    cached = _fingerprints.get(sql)
+    if cached is not None:
+        return cached
+    normalized = _WHITESPACE.sub(' ', sql).strip()
+    normalized = _STRING_LITERAL.sub('?', normalized)
+    normalized = _NUMBER_LITERAL.sub('?', normalized)
+    normalized = _PLACEHOLDER_LIST.sub('(?...)', normalized)
+    if len(_fingerprints) < FINGERPRINT_CACHE_SIZE:
+        _fingerprints[sql] = normalized
+    return normalized
+
+
+class Histogram:
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class Registry:
+    """Process-wide histograms and counters, keyed by label value"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.request_durations = {}  # endpoint -> Histogram
+        self.request_queries = {}  # endpoint -> total statements run
+        self.statement_durations = {}  # fingerprint -> Histogram
+        self.statement_rows = {}  # fingerprint -> total rows
+        self.commit_durations = Histogram()
+        self.reclaimed_rows = {}  # kind -> rows deleted by the sweeper
+        self.sweep_durations = Histogram()
+
+    def observe_statement(self, statement, duration, rows):
+        with self._lock:
+            histogram = self.statement_durations.get(statement)
+            if histogram is None:
+                histogram = self.statement_durations[statement] = Histogram()
+            histogram.observe(duration)
+            self.statement_rows[statement] = self.statement_rows.get(statement, 0) + rows
+
+    def observe_commit(self, duration):
+        with self._lock:
+            self.commit_durations.observe(duration)
+
+    def observe_sweep(self, duration, reclaimed):
+        with self._lock:
+            self.sweep_durations.observe(duration)
+            for kind, rows in reclaimed.items():
+                self.reclaimed_rows[kind] = self.reclaimed_rows.get(kind, 0) + rows
+
+    def observe_request(self, endpoint, duration, queries):
+        with self._lock:
+            histogram = self.request_durations.get(endpoint)
+            if histogram is None:
+                histogram = self.request_durations[endpoint] = Histogram()
+            histogram.observe(duration)
+            self.request_queries[endpoint] = self.request_queries.get(endpoint, 0) + queries
+
+
+registry = Registry()
+
+
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.query_secs = 0.0
+        self.rows = 0
+        self.commits = 0
+        self.commit_secs = 0.0
+
+
+def start_request():
+    _local.stats = RequestStats()
+
+
+def current_request():
+    return getattr(_local, 'stats', None)
+
+
+def finish_request(endpoint):
+    """Records the request in the endpoint histogram and returns its RequestStats (or None)"""
+    stats = getattr(_local, 'stats', None)
+    _local.stats = None
+    if stats is not None and enabled:
+        registry.observe_request(endpoint or 'unknown', time.perf_counter() - stats.started, stats.queries)
+    return stats
+
+
+def record_statement(sql, duration, rows):
+    if not enabled:
+        return
+    stats = getattr(_local, 'stats', None)
+    if stats is not None:
+        stats.queries += 1
+        stats.query_secs += duration
+        stats.rows += rows
+    registry.observe_statement(fingerprint(sql), duration, rows)
+
+
+def record_commit(duration):
+    if not enabled:
+        return
+    stats = getattr(_local, 'stats', None)
+    if stats is not None:
+        stats.commits += 1
+        stats.commit_secs += duration
+    registry.observe_commit(duration)
+
+
+def record_sweep(duration, reclaimed):
+    """Records one sweeper pass and the rows it deleted, e.g. {'tokens': 40, 'sessions': 3}"""
+    if not enabled:
+        return
+    registry.observe_sweep(duration, reclaimed)
+
+
+def server_timing(stats):
+    """Server-Timing header value for a finished request"""
+    total_ms = (time.perf_counter() - stats.started) * 1000
+    return (
+        f'db;dur={stats.query_secs * 1000:.2f};desc="{stats.queries} queries, {stats.rows} rows", '
+        f'commit;dur={stats.commit_secs * 1000:.2f};desc="{stats.commits} commits", '
+        f'total;dur={total_ms:.2f}'
+    )
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _render_histogram(lines, name, labels, histogram):
+    label_prefix = ','.join(f'{k}="{_label(v)}"' for k, v in labels.items())
+    separator = ',' if label_prefix else ''
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{label_prefix}{separator}le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{label_prefix}{separator}le="+Inf"}} {histogram.count}')
+    suffix = f'{{{label_prefix}}}' if label_prefix else ''
+    lines.append(f'{name}_sum{suffix} {histogram.total:.6f}')
+    lines.append(f'{name}_count{suffix} {histogram.count}')
+
+
+def render_prometheus(extra_gauges=None):
+    """Prometheus text exposition (version 0.0.4) of all collected metrics.
+    Args:
+        extra_gauges (dict): Additional gauge name -> value pairs, e.g. pool occupancy
+    """
+    lines = []
+    with registry._lock:
+        lines.append('# HELP library_request_duration_seconds Request latency by endpoint')
+        lines.append('# TYPE library_request_duration_seconds histogram')
+        for endpoint, histogram in sorted(registry.request_durations.items()):
+            _render_histogram(lines, 'library_request_duration_seconds', {'endpoint': endpoint}, histogram)
+
+        lines.append('# HELP library_request_queries_total SQL statements run by endpoint')
+        lines.append('# TYPE library_request_queries_total counter')
+        for endpoint, total in sorted(registry.request_queries.items()):
+            lines.append(f'library_request_queries_total{{endpoint="{_label(endpoint)}"}} {total}')
+
+        lines.append('# HELP library_db_statement_duration_seconds SQL statement latency by fingerprint')
+        lines.append('# TYPE library_db_statement_duration_seconds histogram')
+        for statement, histogram in sorted(registry.statement_durations.items()):
+            _render_histogram(lines, 'library_db_statement_duration_seconds', {'statement': statement}, histogram)
+
+        lines.append('# HELP library_db_statement_rows_total Rows returned or written by fingerprint')
+        lines.append('# TYPE library_db_statement_rows_total counter')
+        for statement, rows in sorted(registry.statement_rows.items()):
+            lines.append(f'library_db_statement_rows_total{{statement="{_label(statement)}"}} {rows}')
+
+        lines.append('# HELP library_db_commit_duration_seconds COMMIT latency')
+        lines.append('# TYPE library_db_commit_duration_seconds histogram')
+        _render_histogram(lines, 'library_db_commit_duration_seconds', {}, registry.commit_durations)
+
+        lines.append('# HELP library_sweeper_duration_seconds Duration of sweeper passes')
+        lines.append('# TYPE library_sweeper_duration_seconds histogram')
+        _render_histogram(lines, 'library_sweeper_duration_seconds', {}, registry.sweep_durations)
+
+        lines.append('# HELP library_sweeper_reclaimed_rows_total Expired rows deleted by the sweeper')
+        lines.append('# TYPE library_sweeper_reclaimed_rows_total counter')
+        for kind, rows in sorted(registry.reclaimed_rows.items()):
+            lines.append(f'library_sweeper_reclaimed_rows_total{{kind="{_label(kind)}"}} {rows}')
+
+    for name, value in (extra_gauges or {}).items():
+        lines.append(f'# TYPE {name} gauge')
+        lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,108 @@
+"""Slow-query log and on-demand request profiling.
+
+Slow queries: every statement slower than SLOW_QUERY_SECS is logged to the 'library.slow_query'
+logger as one JSON line with its duration, normalized SQL, the shape (types, never values) of
+its bound parameters and the db.py function that issued it. Log lines go to SLOW_QUERY_LOG_FILE,
+or stderr when it is None.
+
+Profiling: a request is profiled with cProfile when PROFILE_TOKEN is configured and the request
+sends `X-Profile: 1` plus a matching `X-Profile-Token` header, or when it is picked by
+PROFILE_SAMPLE_RATE. The profile is written to PROFILE_DIR in pstats format, which `python -m
+pstats`, snakeviz, and flameprof/gprof2dot (for flamegraphs) all read.
+"""
+import cProfile
+import hmac
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+import metrics
+
+
+SLOW_QUERY_SECS = float(os.environ.get('LIBRARY_SLOW_QUERY_SECS', '0.1'))
+SLOW_QUERY_LOG_FILE = os.environ.get('LIBRARY_SLOW_QUERY_LOG')
+PROFILE_TOKEN = os.environ.get('LIBRARY_PROFILE_TOKEN')  # Profiling on request is disabled unless set
+PROFILE_SAMPLE_RATE = float(os.environ.get('LIBRARY_PROFILE_SAMPLE_RATE', '0'))
+PROFILE_DIR = os.environ.get('LIBRARY_PROFILE_DIR', 'profiles')
+
+# Helpers that run SQL on behalf of the real caller, skipped when attributing a slow query
+_SQL_HELPERS = {'query_result', 'update_db', '_record_statement'}
+
+slow_query_logger = logging.getLogger('library.slow_query')
+_handler_lock = threading.Lock()
+
+
+def _ensure_handler():
+    if slow_query_logger.handlers:
+        return
+    with _handler_lock:
+        if not slow_query_logger.handlers:
+            if SLOW_QUERY_LOG_FILE:
+                handler = logging.FileHandler(SLOW_QUERY_LOG_FILE)
+            else:
+                handler = logging.StreamHandler(sys.stderr)
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            slow_query_logger.addHandler(handler)
+            slow_query_logger.setLevel(logging.WARNING)
+            slow_query_logger.propagate = False
+
+
+def parameter_shape(args):
+    """Describes bound parameters without their values, e.g. ['str', 'int', 'NoneType']"""
+    if not args:
+        return []
+    if isinstance(args, dict):
+        return {key: type(value).__name__ for key, value in args.items()}
+    return [type(value).__name__ for value in args]
+
+
+def calling_function():
+    """Name of the innermost db.py function (other than the SQL helpers) on the current stack"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        if frame.f_globals.get('__name__') == 'db' and frame.f_code.co_name not in _SQL_HELPERS:
+            return frame.f_code.co_name
+        frame = frame.f_back
+    return None
+
+
+def check_slow_query(sql, args, duration):
+    if duration < SLOW_QUERY_SECS:
+        return
+    _ensure_handler()
+    slow_query_logger.warning(json.dumps({
+        'secs': round(duration, 6),
+        'sql': metrics.fingerprint(sql),
+        'params': parameter_shape(args),
+        'caller': calling_function(),
+    }))
+
+
+def should_profile(headers):
+    if PROFILE_TOKEN and headers.get('X-Profile') == '1':
+        return hmac.compare_digest(headers.get('X-Profile-Token', ''), PROFILE_TOKEN)
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def start_profile():
+    """Returns an enabled profiler, or None if another profiler is already running"""
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # Python 3.12+ allows one active profiler per process
+        return None
+    return profiler
+
+
+def finish_profile(profiler, name):
+    """Stops `profiler` and writes its stats. Returns the path written."""
+    profiler.disable()
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    safe_name = ''.join(c if c.isalnum() or c in '-_' else '_' for c in name or 'request')
+    path = os.path.join(PROFILE_DIR, f"{safe_name}-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{threading.get_ident()}.prof")
+    profiler.dump_stats(path)
+    return path
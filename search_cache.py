@@ -0,0 +1,125 @@
+"""Response cache and ETags for /v1/search.
+
+Serialized search responses are kept in an LRU keyed on the normalized query. Entries are only
+valid for the catalog version they were built at (db.catalog_version()): triggers bump the
+version stored in the database whenever resources, authors or stock (including loans) change,
+whichever process wrote them, and the cache drops everything when it sees a new version.
+Commits made by another process (ingest.py, sweeper.py --db, another server worker) are seen
+by the next request, or within db.CATALOG_VERSION_POLL_SECS if that is raised.
+
+ETags combine a per-process id, the catalog version and the query key, so a client's
+If-None-Match can be answered with 304 before touching the database. A client that lands on a
+different server process gets 200 rather than 304.
+"""
+from collections import OrderedDict
+import hashlib
+import threading
+import uuid
+
+import db
+
+
+SEARCH_CACHE_SIZE = 2000
+SEARCH_KEY_FIELDS = ('author', 'title', 'isbn', 'limit', 'cursor', 'available', 'format')
+
+_process_id = uuid.uuid4().hex[:8]  # Keeps ETags from one process from matching another's
+
+
+def cache_key(fields):
+    """Normalizes search fields so equivalent queries share an entry, e.g. ' Le  Guin' == 'le guin'"""
+    normalized = []
+    for field in SEARCH_KEY_FIELDS:
+        value = fields.get(field)
+        if field in ('author', 'title'):
+            value = ' '.join(str(value).lower().split()) if value else ''
+        elif field == 'isbn':
+            value = str(value).strip() if value else ''
+            try:
+                value = db.normalize_isbn(value) if value else ''  # ISBN-10 and ISBN-13 share an entry
+            except db.InvalidIsbnException:
+                pass
+        elif field == 'available':
+            value = '1' if value else ''
+        elif value is None:
+            value = '-'  # Omitted; differs from an empty value (an empty limit is invalid, not the default)
+        else:
+            value = str(value).strip()
+        normalized.append(f"{field}={value}")
+    return '&'.join(normalized)
+
+
+def etag(version, key):
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    return f'"{_process_id}-{version}-{digest}"'
+
+
+def etag_matches(if_none_match, current_etag):
+    """Whether an If-None-Match header value lists `current_etag` (weak comparison, as for GET)"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*' or candidate.removeprefix('W/') == current_etag:
+            return True
+    return False
+
+
+class ResponseCache:
+    """LRU of serialized responses for one catalog version"""
+    def __init__(self, max_size=SEARCH_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()  # key -> payload
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_version(self, version):
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._version = version
+
+    def get(self, version, key):
+        with self._lock:
+            self._check_version(version)
+            payload = self._entries.get(key)
+            if payload is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return payload
+
+    def put(self, version, key, payload):
+        with self._lock:
+            if version != db.catalog_version():  # Built from data that is already out of date
+                return
+            self._check_version(version)
+            self._entries[key] = payload
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxSize': self.max_size,
+                'version': self._version,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+response_cache = ResponseCache()
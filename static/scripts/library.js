@@ -88,3 +88,24 @@ function postResource(title, authorFirst, authorMiddle, authorLast, edition, isb
   var view = {status: status, body: body, error: error};
   return view
 }
+
+// Asynchronous, unlike the calls above, so typing is never blocked; a newer request for the
+// same input aborts the one still in flight.
+var suggestRequests = {};
+
+function getSuggest(prefix, kind, onSuggestions) {
+  var url = serverUrl + "/v1/suggest?kind=" + kind + "&prefix=" + encodeURIComponent(prefix);
+  if (suggestRequests[kind]) {
+    suggestRequests[kind].abort();
+  }
+  var xhr = new XMLHttpRequest();
+  suggestRequests[kind] = xhr;
+  xhr.open("GET", url, true);
+  xhr.onload = function() {
+    if (xhr.status == 200) {
+      var suggestions = JSON.parse(xhr.responseText)["suggestions"];
+      onSuggestions(suggestions.map(function(s) { return s.text; }));
+    }
+  };
+  xhr.send(null);
+}
@@ -0,0 +1,189 @@
+"""Pre-rendered pages and content-hashed static assets, served from memory by app.py and asgi_app.py.
+
+The page templates take no per-request data, so each is rendered once and kept as bytes, along
+with every file under static/. Every body is gzipped once at build time, and a request is answered
+with a dict lookup and no template or disk work.
+
+Each static file is served at two URLs:
+  /static/scripts/library.js               revalidated on every use (Cache-Control: no-cache)
+  /static/scripts/library.<hash>.js        cached for a year (Cache-Control: immutable)
+Templates link to the hashed URL through url_for('static', filename=...), so a changed script
+gets a new URL and browsers never run a stale copy. Pages keep their URLs and are revalidated
+with an ETag, which costs one 304 when nothing changed.
+
+The bundle is built on first use; app startup calls build() so no request pays for it.
+Template or asset edits take effect on restart.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+
+import jinja2
+
+import search_cache
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+TEMPLATE_DIR = os.path.join(BASE_DIR, 'templates')
+STATIC_URL_PREFIX = '/static/'
+
+PAGES = {  # Page name -> template
+    'login': 'login.html',
+    'join': 'join.html',
+    'search': 'search.html',
+    'resource': 'add_resource.html',
+}
+
+CONTENT_HASH_LENGTH = 12
+GZIP_LEVEL = 9
+GZIP_MIN_SIZE = 256  # Smaller bodies fit in a packet either way
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+
+def content_hash(body):
+    return hashlib.sha256(body).hexdigest()[:CONTENT_HASH_LENGTH]
+
+
+def hashed_filename(filename, digest):
+    """scripts/library.js -> scripts/library.<digest>.js"""
+    stem, ext = os.path.splitext(filename)
+    return f"{stem}.{digest}{ext}"
+
+
+def accepts_gzip(accept_encoding):
+    """Whether an Accept-Encoding header value allows gzip (a q=0 entry refuses it)"""
+    if not accept_encoding:
+        return False
+    qualities = {}
+    for coding in accept_encoding.split(','):
+        name, _, params = coding.partition(';')
+        params = params.replace(' ', '')
+        try:
+            quality = float(params[2:]) if params.startswith('q=') else 1.0
+        except ValueError:
+            quality = 0.0
+        qualities[name.strip().lower()] = quality
+    return qualities.get('gzip', qualities.get('*', 0.0)) > 0
+
+
+class Asset:
+    """One body held both as is and gzipped, with its response headers built up front"""
+    __slots__ = ('body', 'gzipped', 'etag', 'gzip_etag', '_headers')
+
+    def __init__(self, body, content_type):
+        digest = content_hash(body)
+        self.body = body
+        self.etag = f'"{digest}"'
+        gzipped = gzip.compress(body, GZIP_LEVEL, mtime=0) if len(body) >= GZIP_MIN_SIZE else body
+        self.gzipped = gzipped if len(gzipped) < len(body) else None
+        self.gzip_etag = f'"{digest}-gzip"'  # Each encoding is a separate representation to caches
+        self._headers = {}
+        for cache_control in (IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL):
+            for use_gzip in (False, True):
+                headers = {'Content-Type': content_type, 'Cache-Control': cache_control}
+                if self.gzipped is not None:
+                    headers['Vary'] = 'Accept-Encoding'
+                if use_gzip:
+                    headers['Content-Encoding'] = 'gzip'
+                headers['ETag'] = self.gzip_etag if use_gzip else self.etag
+                self._headers[(cache_control, use_gzip)] = headers
+
+    def respond(self, cache_control, if_none_match, accept_encoding):
+        """Returns (body, status, headers): 304 with no body when If-None-Match lists either
+        encoding's ETag, otherwise 200 with the gzipped body if the client accepts it. A 304 has
+        the headers the 200 would have had."""
+        use_gzip = self.gzipped is not None and accepts_gzip(accept_encoding)
+        headers = dict(self._headers[(cache_control, use_gzip)])
+        if search_cache.etag_matches(if_none_match, self.etag) or search_cache.etag_matches(if_none_match, self.gzip_etag):
+            return b'', 304, headers
+        return (self.gzipped if use_gzip else self.body), 200, headers
+
+
+class StaticBundle:
+    def __init__(self, static_dir=STATIC_DIR, template_dir=TEMPLATE_DIR):
+        self.files = {}  # Path under /static/ -> (Asset, Cache-Control)
+        self.urls = {}  # Static filename -> its content-hashed URL
+        self.pages = {}  # Page name -> Asset
+        self._load_static(static_dir)
+        self._render_pages(template_dir)
+
+    def _load_static(self, static_dir):
+        for dirpath, dirnames, filenames in os.walk(static_dir):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                filename = os.path.relpath(path, static_dir).replace(os.sep, '/')
+                with open(path, 'rb') as f:
+                    body = f.read()
+                content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                if content_type.startswith('text/') or content_type == 'application/javascript':
+                    content_type += '; charset=utf-8'
+                asset = Asset(body, content_type)
+                hashed = hashed_filename(filename, content_hash(body))
+                self.files[filename] = (asset, REVALIDATE_CACHE_CONTROL)
+                self.files[hashed] = (asset, IMMUTABLE_CACHE_CONTROL)
+                self.urls[filename] = STATIC_URL_PREFIX + hashed
+
+    def url_for(self, endpoint, filename=None, **values):
+        """Stands in for Flask's url_for while rendering; templates only link static files"""
+        if endpoint != 'static' or filename not in self.urls:
+            raise ValueError(f"No static file {filename!r} for url_for({endpoint!r})")
+        return self.urls[filename]
+
+    def _render_pages(self, template_dir):
+        env = jinja2.Environment(
+            loader=jinja2.FileSystemLoader(template_dir),
+            autoescape=jinja2.select_autoescape(['html']),
+            undefined=jinja2.StrictUndefined,  # A template that starts wanting request data fails the build
+        )
+        env.globals['url_for'] = self.url_for
+        for name, template in PAGES.items():
+            body = env.get_template(template).render().encode()
+            self.pages[name] = Asset(body, 'text/html; charset=utf-8')
+
+    def stats(self):
+        assets = [asset for asset, cache_control in self.files.values() if cache_control == IMMUTABLE_CACHE_CONTROL]
+        assets += self.pages.values()
+        return {
+            'pages': len(self.pages),
+            'files': len(self.urls),
+            'bytes': sum(len(asset.body) for asset in assets),
+            'gzipBytes': sum(len(asset.gzipped or asset.body) for asset in assets),
+        }
+
+
+_bundle = None
+_bundle_lock = threading.Lock()
+
+
+def build():
+    """Renders the pages and loads the static files, replacing any earlier bundle"""
+    global _bundle
+    with _bundle_lock:
+        _bundle = StaticBundle()
+        return _bundle
+
+
+def get_bundle():
+    bundle = _bundle
+    if bundle is None:
+        bundle = build()  # Two first requests may both build; the results are identical
+    return bundle
+
+
+def page_response(name, if_none_match=None, accept_encoding=None):
+    """(body, status, headers) for a pre-rendered page"""
+    return get_bundle().pages[name].respond(REVALIDATE_CACHE_CONTROL, if_none_match, accept_encoding)
+
+
+def static_response(filename, if_none_match=None, accept_encoding=None):
+    """(body, status, headers) for a file under static/, by plain or content-hashed name, or
+    None if there is no such file"""
+    entry = get_bundle().files.get(filename)
+    if entry is None:
+        return None
+    asset, cache_control = entry
+    return asset.respond(cache_control, if_none_match, accept_encoding)
@@ -0,0 +1,156 @@
+"""Concurrency stress test for checkout_resource/check_in_resource.
+
+Usage:
+    python stress_checkout.py [--threads 8] [--ops 2000] [--copies 20] [--members 50]
+
+Two phases run against a fresh fixture database:
+
+  race      every thread tries to check out the same copy at the same instant; exactly one may win
+  churn     threads check out random copies for random members and check their own loans back
+            in, so copies and members are contended and the per-member limit is hit
+
+Afterwards the borrow table is compared with stock.on_loan and member.checked_out, and the stock
+table with resource_availability. The exit status
+is 1 if a copy was ever lent twice, a member went over RESOURCE_CHECKOUT_LIMIT, or a counter
+drifted from the borrow rows.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+import db
+import fixtures
+
+
+def race(threads, members):
+    """All threads check out stock 1 at once. Returns the number of successful checkouts."""
+    barrier = threading.Barrier(threads)
+
+    def attempt(member_id):
+        barrier.wait()
+        try:
+            db.checkout_resource(member_id, 1)
+            return 1
+        except db.CheckoutException:
+            return 0
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        wins = sum(executor.map(attempt, [1 + i % members for i in range(threads)]))
+    return wins
+
+
+def churn(threads, ops, copies, members, seed):
+    """Random checkouts and check-ins. Returns outcome counts and elapsed seconds."""
+    outcomes = {'checkedOut': 0, 'checkedIn': 0, 'refused': 0}
+    lock = threading.Lock()
+
+    def drive(worker):
+        rng = random.Random(seed + worker)
+        local = dict.fromkeys(outcomes, 0)
+        held = []  # (member_id, stock_id) this worker has out
+        for i in range(ops // threads):
+            try:
+                if held and rng.random() < 0.5:
+                    member_id, stock_id = held.pop(rng.randrange(len(held)))
+                    db.check_in_resource(member_id, stock_id)
+                    local['checkedIn'] += 1
+                else:
+                    member_id, stock_id = rng.randint(1, members), rng.randint(1, copies)
+                    db.checkout_resource(member_id, stock_id)
+                    held.append((member_id, stock_id))
+                    local['checkedOut'] += 1
+            except (db.CheckoutException, db.CheckinException):
+                local['refused'] += 1
+        with lock:
+            for key, value in local.items():
+                outcomes[key] += value
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(drive, range(threads)))
+    return outcomes, time.perf_counter() - started
+
+
+def invariant_violations():
+    """Descriptions of every place the counters disagree with the borrow rows"""
+    violations = []
+    with db.read_connection() as conx:
+        for stock_id, open_borrows in conx.execute(
+            "SELECT stock_id, COUNT(*) FROM borrow WHERE closed=0 GROUP BY stock_id HAVING COUNT(*) > 1"
+        ):
+            violations.append(f"stock {stock_id} has {open_borrows} open borrows")
+        for stock_id, on_loan, open_borrows in conx.execute(
+            "SELECT id, on_loan, (SELECT COUNT(*) FROM borrow WHERE stock_id = stock.id AND closed=0) FROM stock"
+        ):
+            if bool(on_loan) != bool(open_borrows):
+                violations.append(f"stock {stock_id} on_loan={on_loan} but has {open_borrows} open borrows")
+        for member_id, checked_out, total_borrowed, open_borrows, all_borrows in conx.execute(
+            """SELECT id, checked_out, total_borrowed,
+                (SELECT COUNT(*) FROM borrow WHERE member_id = member.id AND closed=0),
+                (SELECT COUNT(*) FROM borrow WHERE member_id = member.id)
+            FROM member"""
+        ):
+            if checked_out != open_borrows or total_borrowed != all_borrows:
+                violations.append(
+                    f"member {member_id} counters {checked_out}/{total_borrowed} but borrows {open_borrows}/{all_borrows}"
+                )
+            if open_borrows > db.RESOURCE_CHECKOUT_LIMIT:
+                violations.append(f"member {member_id} has {open_borrows} items out (limit {db.RESOURCE_CHECKOUT_LIMIT})")
+        for resource_id, total, available, copies, on_shelf in conx.execute(
+            """SELECT stock.resource_id, resource_availability.total, resource_availability.available,
+                SUM(stock.active = 1), SUM(stock.active = 1 AND stock.on_loan = 0)
+            FROM stock LEFT JOIN resource_availability ON resource_availability.resource_id = stock.resource_id
+            GROUP BY stock.resource_id"""
+        ):
+            if (total, available) != (copies, on_shelf):
+                violations.append(f"resource {resource_id} availability {available}/{total} but stock has {on_shelf}/{copies}")
+    return violations
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stress concurrent checkout and check-in")
+    parser.add_argument('--threads', type=int, default=db.DB_POOL_SIZE)
+    parser.add_argument('--ops', type=int, default=2000, help="Checkout/check-in attempts in the churn phase")
+    parser.add_argument('--copies', type=int, default=20, help="Few copies so threads contend for them")
+    parser.add_argument('--members', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='stress-checkout-'), 'stress.db')
+    fixtures.generate(
+        db_path,
+        members=args.members,
+        authors=5,
+        resources=args.copies,
+        stock=args.copies,
+        borrows=0,
+        seed=args.seed,
+        log=lambda message: None
+    )
+
+    wins = race(args.threads, args.members)
+    print(f"race: {args.threads} threads checked out stock 1 at once, {wins} succeeded")
+
+    outcomes, elapsed = churn(args.threads, args.ops, args.copies, args.members, args.seed)
+    attempts = sum(outcomes.values())
+    print(
+        f"churn: {attempts} attempts in {elapsed:.2f}s ({attempts / elapsed:.0f}/s), "
+        f"{outcomes['checkedOut']} checked out, {outcomes['checkedIn']} checked in, {outcomes['refused']} refused"
+    )
+
+    violations = invariant_violations()
+    if wins != 1:
+        violations.insert(0, f"race phase had {wins} winners for one copy")
+    for violation in violations:
+        print(f"VIOLATION {violation}")
+    print("ok" if not violations else f"{len(violations)} violations")
+    return 1 if violations else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,197 @@
+"""In-process prefix index behind /v1/suggest (as-you-type titles and author names).
+
+Each index is a sorted list of "normalized key \\0 display text" strings, so a prefix lookup is a
+bisect to the first key >= prefix followed by a short forward walk: O(log n + limit) with no
+database work. Keys are lowercased, accent-stripped and whitespace-collapsed; authors are
+indexed both as "first last" and "last first".
+
+The index is built from the resource and author tables at startup and then kept current by
+db.py's catalog listener, which reports titles and authors once their insert commits. The
+listener only hears inserts committed by this process: titles loaded by ingest.py or added
+through another worker are not suggested until this process restarts or calls
+suggest_index.build() again, and deactivated titles stay suggested until then too.
+
+New keys go to a small pending list that is merged into the main list once it holds
+SUGGEST_MERGE_SIZE entries, so bulk ingests do not pay an O(n) list insert per row. A key that
+is already indexed is not added again, so repeated inserts of one title neither crowd other
+titles out of a lookup nor use up SUGGEST_MAX_ENTRIES, the per-index cap that bounds memory.
+"""
+from bisect import bisect_left, insort
+import threading
+import unicodedata
+
+import db
+
+
+SUGGEST_DEFAULT_LIMIT = 10
+SUGGEST_MAX_LIMIT = 25
+SUGGEST_MAX_ENTRIES = 2000000  # Per index; roughly 100 bytes per title entry
+SUGGEST_MERGE_SIZE = 1024
+SUGGEST_BUILD_FETCH_SIZE = 10000
+SUGGEST_KINDS = ('title', 'author')
+
+_SEPARATOR = '\0'  # Sorts before every printable character, so "dune\0Dune" < "dune messiah\0..."
+
+
+def _contains(entries, entry):
+    index = bisect_left(entries, entry)
+    return index < len(entries) and entries[index] == entry
+
+
+def normalize(text):
+    """Lowercased, accent-stripped, whitespace-collapsed form used for keys and prefixes"""
+    if not text:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', text)
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ' '.join(stripped.lower().replace(_SEPARATOR, ' ').split())
+
+
+class PrefixIndex:
+    def __init__(self, max_entries=SUGGEST_MAX_ENTRIES, merge_size=SUGGEST_MERGE_SIZE):
+        self.max_entries = max_entries
+        self.merge_size = merge_size
+        self._entries = []  # Sorted "key\0display"
+        self._pending = []  # Sorted, merged into _entries once it reaches merge_size
+        self._merging = []  # Pending entries being merged; still searched until the merge lands
+        self._lock = threading.Lock()
+        self._merge_lock = threading.Lock()
+        self.dropped = 0  # Keys refused because the index was full
+
+    def __len__(self):
+        return len(self._entries) + len(self._merging) + len(self._pending)
+
+    def load(self, pairs):
+        """Replaces the contents with (key, display) pairs, e.g. at startup"""
+        entries = sorted({f"{key}{_SEPARATOR}{display}" for key, display in pairs if key})
+        dropped = max(0, len(entries) - self.max_entries)
+        with self._lock:
+            self._entries = entries[:self.max_entries]
+            self._merging = []
+            self._pending = []
+            self.dropped = dropped
+
+    def add(self, key, display):
+        if not key:
+            return
+        entry = f"{key}{_SEPARATOR}{display}"
+        with self._lock:
+            if any(_contains(source, entry) for source in (self._entries, self._merging, self._pending)):
+                return
+            if len(self) >= self.max_entries:
+                self.dropped += 1
+                return
+            insort(self._pending, entry)
+            if len(self._pending) < self.merge_size or self._merging:
+                return
+            self._merging, self._pending = self._pending, []
+            entries, merging = self._entries, self._merging
+
+        # The O(n) merge runs outside _lock so lookups are never held up by it. Timsort merges
+        # the two sorted runs in linear time. add() skipped keys already in _entries when they
+        # arrived, but a concurrent load() may have indexed them since, so check again.
+        with self._merge_lock:
+            merged = sorted(entries + [entry for entry in merging if not _contains(entries, entry)])
+            with self._lock:
+                if self._entries is entries:  # Otherwise a load() replaced everything meanwhile
+                    self._entries = merged
+                    self._merging = []
+
+    def lookup(self, prefix, limit):
+        """Up to `limit` distinct display strings whose key starts with the normalized `prefix`"""
+        with self._lock:
+            sources = (self._entries, self._merging, self._pending)
+        found = []
+        for source in sources:
+            start = bisect_left(source, prefix)
+            for entry in source[start:start + limit * 2]:  # *2 leaves room for an author under both name orders
+                if not entry.startswith(prefix):
+                    break
+                found.append(entry)
+        found.sort()
+        results = []
+        for entry in found:
+            display = entry.split(_SEPARATOR, 1)[1]
+            if display not in results:
+                results.append(display)
+                if len(results) == limit:
+                    break
+        return results
+
+
+class SuggestIndex:
+    """Title and author prefix indexes, fed by the catalog"""
+    def __init__(self):
+        self.titles = PrefixIndex()
+        self.authors = PrefixIndex()
+        self.built = False
+
+    @staticmethod
+    def _author_pairs(first, middle, last):
+        display = ' '.join(name for name in (first, middle, last) if name)
+        yield normalize(display), display
+        if first and last:
+            yield normalize(f"{last} {first}"), display
+
+    def build(self):
+        """Loads every active title and every author from the database"""
+        title_pairs = []
+        author_pairs = []
+        with db.read_connection() as conx:
+            for qry, handle in (
+                ("SELECT title FROM resource WHERE active=1",
+                 lambda row: title_pairs.append((normalize(row[0]), row[0]))),
+                ("SELECT first_name, middle_name, last_name FROM author",
+                 lambda row: author_pairs.extend(self._author_pairs(*row))),
+            ):
+                curs = conx.execute(qry)
+                while True:
+                    rows = curs.fetchmany(SUGGEST_BUILD_FETCH_SIZE)
+                    if not rows:
+                        break
+                    for row in rows:
+                        handle(row)
+        self.titles.load(title_pairs)
+        self.authors.load(author_pairs)
+        self.built = True
+
+    def on_catalog_insert(self, kind, value):
+        """db.add_catalog_listener callback: ('title', title) or ('author', (first, middle, last))"""
+        if kind == 'title':
+            self.titles.add(normalize(value), value)
+        elif kind == 'author':
+            for key, display in self._author_pairs(*value):
+                self.authors.add(key, display)
+
+    def suggest(self, prefix, limit=SUGGEST_DEFAULT_LIMIT, kind=None):
+        """Returns [{'text': ..., 'kind': 'title' | 'author'}], titles first, or only `kind` if given
+        (so a field that wants authors is not starved when titles fill the limit)"""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        if kind == 'author':
+            return [{'text': text, 'kind': 'author'} for text in self.authors.lookup(prefix, limit)]
+        suggestions = [{'text': text, 'kind': 'title'} for text in self.titles.lookup(prefix, limit)]
+        if kind is None and len(suggestions) < limit:
+            suggestions += [
+                {'text': text, 'kind': 'author'} for text in self.authors.lookup(prefix, limit - len(suggestions))
+            ]
+        return suggestions
+
+    def stats(self):
+        return {
+            'built': self.built,
+            'titles': len(self.titles),
+            'authors': len(self.authors),
+            'dropped': self.titles.dropped + self.authors.dropped,
+        }
+
+
+suggest_index = SuggestIndex()
+
+
+def start():
+    """Subscribes to catalog inserts, then builds the index (subscribing first means no insert
+    made during the build is missed; one that lands in both is de-duplicated on lookup)"""
+    db.add_catalog_listener(suggest_index.on_catalog_insert)
+    suggest_index.build()
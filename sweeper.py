@@ -0,0 +1,112 @@
+"""Background purge of expired tokens and anonymous sessions.
+
+index() creates a session for every visitor and add_token only deactivates old tokens, so without
+this the session and token tables grow forever. Every SWEEP_INTERVAL_SECS the sweeper deletes,
+in transactions of at most SWEEP_BATCH_SIZE rows per kind:
+
+  - tokens that were deactivated or are older than db.TOKEN_TTL_SECS
+  - sessions never associated with a member and older than SESSION_RETENTION_SECS
+
+and sleeps SWEEP_PAUSE_SECS between batches, so it never holds the write lock for long and
+request writes get the lock in between. Rows reclaimed are reported to metrics (/metrics).
+
+app.py and asgi_app.py start it unless LIBRARY_SWEEPER=0. It can also run once from cron:
+    python sweeper.py [--db library.db] [--batch-size 500] [--pause 0.05]
+"""
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+
+import db
+import metrics
+
+
+SWEEPER_ENABLED = os.environ.get('LIBRARY_SWEEPER', '1') != '0'
+SWEEP_INTERVAL_SECS = float(os.environ.get('LIBRARY_SWEEP_INTERVAL_SECS', '60'))
+SWEEP_BATCH_SIZE = int(os.environ.get('LIBRARY_SWEEP_BATCH_SIZE', '500'))
+SWEEP_PAUSE_SECS = float(os.environ.get('LIBRARY_SWEEP_PAUSE_SECS', '0.05'))
+SESSION_RETENTION_SECS = float(os.environ.get('LIBRARY_SESSION_RETENTION_SECS', str(24 * 60 * 60)))
+
+logger = logging.getLogger(__name__)
+
+
+def sweep_once(batch_size=SWEEP_BATCH_SIZE, pause_secs=SWEEP_PAUSE_SECS,
+               session_retention_secs=SESSION_RETENTION_SECS, stop_event=None):
+    """Purges batches until none is full. Returns the total rows deleted per kind."""
+    started = time.perf_counter()
+    store = db.get_session_store()
+    reclaimed = {'tokens': 0, 'sessions': 0}
+    while True:
+        batch = store.purge_expired(batch_size, session_retention_secs)
+        for kind, rows in batch.items():
+            reclaimed[kind] += rows
+        if max(batch.values()) < batch_size:
+            break
+        if stop_event is None:
+            time.sleep(pause_secs)
+        elif stop_event.wait(pause_secs):
+            break
+    metrics.record_sweep(time.perf_counter() - started, reclaimed)
+    return reclaimed
+
+
+class Sweeper(threading.Thread):
+    def __init__(self, interval_secs=SWEEP_INTERVAL_SECS, **sweep_kwargs):
+        super().__init__(name='sweeper', daemon=True)
+        self.interval_secs = interval_secs
+        self.sweep_kwargs = sweep_kwargs
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval_secs):
+            try:
+                reclaimed = sweep_once(stop_event=self._stop_event, **self.sweep_kwargs)
+                if any(reclaimed.values()):
+                    logger.info("Sweeper reclaimed %s", reclaimed)
+            except Exception:
+                logger.exception("Sweeper pass failed")
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        self.join(timeout)
+
+
+_sweeper = None
+
+
+def start():
+    """Starts the process-wide sweeper thread (once), unless disabled by LIBRARY_SWEEPER=0"""
+    global _sweeper
+    if SWEEPER_ENABLED and _sweeper is None:
+        _sweeper = Sweeper()
+        _sweeper.start()
+    return _sweeper
+
+
+def stop():
+    global _sweeper
+    if _sweeper is not None:
+        _sweeper.stop()
+        _sweeper = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Purge expired tokens and anonymous sessions once")
+    parser.add_argument('--db', default=db.DB_NAME)
+    parser.add_argument('--batch-size', type=int, default=SWEEP_BATCH_SIZE)
+    parser.add_argument('--pause', type=float, default=SWEEP_PAUSE_SECS, help="Seconds between batches")
+    parser.add_argument('--retention', type=float, default=SESSION_RETENTION_SECS, help="Anonymous session age in seconds")
+    args = parser.parse_args(argv)
+
+    db.DB_NAME = args.db
+    db.reset_pool()
+    db.prepare_db()
+    print(sweep_once(args.batch_size, args.pause, args.retention))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())